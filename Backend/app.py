@@ -1,25 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from pymongo import MongoClient
+from bson import ObjectId
+from bson.errors import InvalidId
 from dotenv import load_dotenv
 import os
-import jwt
 import datetime
-import pickle
 from functools import wraps
-import bcrypt
-import random
-import string
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import re
 import logging
 import json
-import numpy as np
+import hmac
+import time
 from cryptography.fernet import Fernet
+from screening import SCREEN_MAX_LENGTH, sanitize_input
+from model_registry import ModelRegistry
+from mail_ingest import iter_message_texts
+from cache import LRUCache, PredictionCache
+from near_duplicates import NearDuplicateIndex
+from log_writer import BufferedWriter
+from mailer import Mailer
+from password_hashing import (DEFAULT_MAX_PENDING, DEFAULT_TIMEOUT, DEFAULT_WORKERS, PasswordHasher,
+                              PasswordPoolBusy)
+from otp_store import open_store
+from metrics import MetricsRegistry
+import shared_limits  # Registers the sharedmem:// rate-limit storage
+from pagination import (count_total, fetch_page, log_filters, parse_page_args, parse_timestamp,
+                        security_event_filters)
+from rollups import GRANULARITIES, MAX_BUCKETS, Rollups
+from export import LOG_FIELDS, SECURITY_EVENT_FIELDS, export_cursor, iter_csv, iter_ndjson
+from service_common import (COLLECTION_INDEXES, AuthError, ClassificationPipeline, admin_denied,
+                            auth_error_response, build_log_record, build_prediction_response,
+                            build_security_event, create_token, decode_token, decrypt_password, generate_otp,
+                            load_model, new_user, otp_sent_response, otp_verified, page_response,
+                            password_busy_response, rate_limit_response, registration_error, send_otp_email)
 
 load_dotenv()
 
@@ -42,11 +57,12 @@ logging.basicConfig(
 logger = logging.getLogger('security')
 
 # Setup rate limiter with more restrictive limits
+# Counters live in a memory-mapped file shared by every worker on the host, so limits hold server-wide
 limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["5 per minute"],
-    storage_uri="memory://",
+    storage_uri=os.getenv('LIMITER_STORAGE_URI', 'sharedmem://'),
 )
 
 # Load environment variables
@@ -56,11 +72,44 @@ EMAIL_USER = os.getenv('EMAIL_USER')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
 EMAIL_SERVER = os.getenv('EMAIL_SERVER', 'smtp.gmail.com')
 EMAIL_PORT = int(os.getenv('EMAIL_PORT', '587'))
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'true').lower() == 'true'
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', '2'))  # Persistent SMTP connections per worker
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '3'))
+SCORING_ENGINE = os.getenv('SCORING_ENGINE', 'compiled')  # 'compiled' fast path or 'sklearn'
+MODEL_ARTIFACT = os.getenv('MODEL_ARTIFACT')  # Flat artifact from model_artifact.py export; replaces the pickles
+MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR')  # Directory watched for new versioned *.ztm artifacts
+MODEL_REGISTRY_POLL = float(os.getenv('MODEL_REGISTRY_POLL', '30'))  # Seconds between directory checks
+PREDICTION_CACHE_MAX_BYTES = int(os.getenv('PREDICTION_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+PREDICTION_CACHE_TTL = int(os.getenv('PREDICTION_CACHE_TTL', '3600'))  # Seconds
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv('NEAR_DUPLICATE_MAX_ENTRIES', '50000'))  # ~1.5 KB each; 0 disables
+NEAR_DUPLICATE_TTL = int(os.getenv('NEAR_DUPLICATE_TTL', '3600'))  # Seconds
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.8'))  # Estimated Jaccard to reuse a verdict
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(DEFAULT_WORKERS)))  # Concurrent bcrypt operations per worker
+# Queued + running before rejecting; keep it below the gthread thread count, since each one holds a request thread
+BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', str(DEFAULT_MAX_PENDING)))
+BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', str(DEFAULT_TIMEOUT)))  # Seconds to wait for a queued operation
+BCRYPT_RETRY_AFTER = int(os.getenv('BCRYPT_RETRY_AFTER', '2'))  # Retry-After seconds on a busy 503
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '60'))  # Seconds a cached user/role may be served
+OTP_STORE = os.getenv('OTP_STORE', 'mongo')  # 'mongo', or 'memory' for a single worker process and tests
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', '500'))
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '1.0'))  # Seconds
+LOG_BACKPRESSURE = os.getenv('LOG_BACKPRESSURE', 'block')  # 'block', 'drop_oldest' or 'spill'
+LOG_SPILL_DIR = os.getenv('LOG_SPILL_DIR', '.')  # Where records go when the queue overflows or Mongo fails
+# Shared directory for per-worker metric snapshots; under the Procfile, gunicorn.conf.py sets a clean one per start
+METRICS_DIR = os.getenv('METRICS_DIR', os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))  # Seconds between worker snapshots
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # If set, /metrics requires 'Authorization: Bearer <token>'
 
 # Initialize encryption key for model protection
 ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', Fernet.generate_key())
 cipher_suite = Fernet(ENCRYPTION_KEY)
 
+# Outbound mail is queued and delivered over pooled SMTP connections
+mailer = Mailer(EMAIL_SERVER, EMAIL_PORT, username=EMAIL_USER, password=EMAIL_PASSWORD,
+                use_tls=EMAIL_USE_TLS, pool_size=EMAIL_POOL_SIZE, max_attempts=EMAIL_MAX_ATTEMPTS)
+
 # Database setup
 try:
     client = MongoClient(MONGO_URI, 
@@ -69,14 +118,28 @@ try:
     users_collection = db.users
     logs_collection = db.logs
     otp_collection = db.otps
+    otp_store = open_store(OTP_STORE, otp_collection)
     security_events_collection = db.security_events  # New collection for security events
+    feedback_collection = db.feedback  # Analyst label corrections consumed by online_learning.py
+    # Dashboard counters maintained incrementally from every flushed log batch
+    rollups = Rollups(db.stats_rollups, db.user_stats)
     
     # Create indexes for performance and security
-    users_collection.create_index("email", unique=True)
-    otp_collection.create_index([("email", 1), ("action", 1)])
-    otp_collection.create_index("expires_at", expireAfterSeconds=0)  # TTL index
-    logs_collection.create_index("timestamp")
-    security_events_collection.create_index("timestamp")
+    for collection_name, keys, options in COLLECTION_INDEXES:
+        db[collection_name].create_index(keys, **options)
+    otp_store.ensure_indexes()
+    feedback_collection.create_index([("status", 1), ("timestamp", 1)])
+    rollups.ensure_indexes()
+    
+    # Prediction logs and security events are written behind the request path
+    writer_options = dict(max_queue=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE,
+                          flush_interval=LOG_FLUSH_INTERVAL, policy=LOG_BACKPRESSURE)
+    prediction_log_writer = BufferedWriter(logs_collection, 'prediction_logs',
+                                           spill_path=os.path.join(LOG_SPILL_DIR, 'prediction_logs.spill.jsonl'),
+                                           on_flush=rollups.on_flush('predictions'), **writer_options)
+    security_event_writer = BufferedWriter(security_events_collection, 'security_events',
+                                           spill_path=os.path.join(LOG_SPILL_DIR, 'security_events.spill.jsonl'),
+                                           on_flush=rollups.on_flush('security_events'), **writer_options)
     
     logger.info("Connected to MongoDB successfully")
 except Exception as e:
@@ -85,20 +148,130 @@ except Exception as e:
 
 # Load the model and feature extraction
 try:
-    with open('logistic_regression.pkl', 'rb') as file:
-        model = pickle.load(file)
-    with open('feature_extraction.pkl', 'rb') as file:
-        feature_extraction = pickle.load(file)
-    logger.info("Model and feature extraction loaded successfully")
+    initial_model = load_model(MODEL_ARTIFACT, SCORING_ENGINE)
+    model_version = initial_model.version
+    logger.info(f"Model and feature extraction loaded successfully "
+                f"(version: {model_version}, scoring engine: {initial_model.scorer.engine})")
     
 except Exception as e:
     logger.error(f"Error loading model or feature extraction: {e}")
     raise
 
+# Cache of screening verdicts and predictions for repeated message bodies
+prediction_cache = PredictionCache(max_bytes=PREDICTION_CACHE_MAX_BYTES, ttl=PREDICTION_CACHE_TTL)
+prediction_cache.bind_model(model_version)
+
+# Campaign variants (same body, different name/URL/ID) reuse the verdict of an indexed near-duplicate
+near_duplicates = None
+if NEAR_DUPLICATE_MAX_ENTRIES > 0:
+    near_duplicates = NearDuplicateIndex(max_entries=NEAR_DUPLICATE_MAX_ENTRIES, ttl=NEAR_DUPLICATE_TTL,
+                                         threshold=NEAR_DUPLICATE_THRESHOLD)
+    near_duplicates.bind_model(model_version)
+
+def bind_model_caches(active_model):
+    prediction_cache.bind_model(active_model.version)
+    if near_duplicates is not None:
+        near_duplicates.bind_model(active_model.version)
+
+# The registry owns the active scorer; requests take one snapshot via model_registry.active()
+model_registry = ModelRegistry(
+    initial_model,
+    directory=MODEL_REGISTRY_DIR,
+    poll_interval=MODEL_REGISTRY_POLL,
+    on_swap=bind_model_caches
+)
+if MODEL_REGISTRY_DIR:
+    # Prefer the newest published artifact over the bundled model at startup
+    model_registry.poll()
+
+#========================Metrics==================================================
+# Hot-path updates are in-process; /metrics merges the snapshots of every worker in METRICS_DIR
+metrics = MetricsRegistry(directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL)
+STAGE_SECONDS = metrics.histogram('ztrust_stage_seconds', 'Time spent in each classification pipeline stage',
+                                  ['stage'])
+# The pipeline stages (sanitize, screen, score, near_duplicate, long_document...) are timed by ClassificationPipeline
+USER_LOOKUP_SECONDS = STAGE_SECONDS.labels('user_lookup')
+LOG_ENQUEUE_SECONDS = STAGE_SECONDS.labels('log_enqueue')
+REQUEST_SECONDS = metrics.histogram('ztrust_request_seconds', 'Request latency by endpoint', ['endpoint'])
+REQUESTS = metrics.counter('ztrust_requests_total', 'Requests by endpoint, method and status',
+                           ['endpoint', 'method', 'status'])
+PREDICTIONS = metrics.counter('ztrust_predictions_total', 'Predictions returned by result and confidence level',
+                              ['result', 'confidence_level'])
+CONFIDENCE = metrics.histogram('ztrust_prediction_confidence', 'Confidence of returned predictions',
+                               buckets=(0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0))
+REJECTED_INPUTS = metrics.counter('ztrust_rejected_inputs_total', 'Inputs rejected by screening, by reason',
+                                  ['reason'])
+
+def _writer_stats(key):
+    return lambda: {(writer.name,): writer.stats()[key] for writer in (prediction_log_writer, security_event_writer)}
+
+def _cache_stats(key):
+    return lambda: {('prediction',): prediction_cache.stats()[key], ('user',): user_cache.stats()[key]}
+
+metrics.gauge_callback('ztrust_log_queue_depth', 'Records waiting in the write-behind queue', ['writer'],
+                       _writer_stats('queue_depth'))
+metrics.counter_callback('ztrust_log_written_total', 'Records inserted by the write-behind writer', ['writer'],
+                         _writer_stats('written'))
+metrics.counter_callback('ztrust_log_dropped_total', 'Records dropped under backpressure', ['writer'],
+                         _writer_stats('dropped'))
+metrics.counter_callback('ztrust_log_spilled_total', 'Records spilled to the local file', ['writer'],
+                         _writer_stats('spilled'))
+metrics.counter_callback('ztrust_log_batches_total', 'insert_many batches written', ['writer'],
+                         _writer_stats('batches'))
+metrics.counter_callback('ztrust_log_write_seconds_total', 'Time spent in insert_many', ['writer'],
+                         _writer_stats('write_seconds'))
+metrics.counter_callback('ztrust_cache_hits_total', 'Cache hits', ['cache'], _cache_stats('hits'))
+metrics.counter_callback('ztrust_cache_misses_total', 'Cache misses', ['cache'], _cache_stats('misses'))
+metrics.counter_callback('ztrust_cache_evictions_total', 'Cache evictions', ['cache'], _cache_stats('evictions'))
+metrics.gauge_callback('ztrust_cache_bytes', 'Approximate cache size in bytes', ['cache'], _cache_stats('bytes'))
+metrics.gauge_callback('ztrust_mail_queue_depth', 'Emails waiting for delivery', [],
+                       lambda: {(): mailer.stats()['queue_depth']})
+metrics.counter_callback('ztrust_mail_sent_total', 'Emails delivered', [], lambda: {(): mailer.stats()['sent']})
+metrics.counter_callback('ztrust_mail_failed_total', 'Emails that exhausted their retries', [],
+                         lambda: {(): mailer.stats()['failed']})
+metrics.gauge_callback('ztrust_bcrypt_pending', 'bcrypt operations queued or running', [],
+                       lambda: {(): password_hasher.stats()['pending']})
+metrics.counter_callback('ztrust_bcrypt_rejected_total', 'bcrypt operations rejected because the pool was full', [],
+                         lambda: {(): password_hasher.stats()['rejected']})
+metrics.counter_callback('ztrust_bcrypt_timed_out_total', 'bcrypt operations that exceeded BCRYPT_TIMEOUT', [],
+                         lambda: {(): password_hasher.stats()['timed_out']})
+metrics.counter_callback('ztrust_model_swaps_total', 'Model hot-swaps', [], lambda: {(): model_registry.swaps})
+if near_duplicates is not None:
+    metrics.counter_callback('ztrust_near_duplicate_lookups_total', 'Near-duplicate index lookups', [],
+                             lambda: {(): near_duplicates.stats()['lookups']})
+    metrics.counter_callback('ztrust_near_duplicate_hits_total', 'Predictions reused from a near-duplicate', [],
+                             lambda: {(): near_duplicates.stats()['hits']})
+    metrics.gauge_callback('ztrust_near_duplicate_entries', 'Messages in the near-duplicate index', [],
+                           lambda: {(): near_duplicates.stats()['entries']})
+metrics.gauge_callback('ztrust_model_info', 'Active model version', ['version'],
+                       lambda: {(model_registry.active().version,): 1})
+
+def record_prediction(result, confidence, confidence_level):
+    PREDICTIONS.labels(result, confidence_level).inc()
+    CONFIDENCE.observe(confidence)
+
+@app.before_request
+def start_request_timer():
+    metrics.ensure_started()
+    g.started_at = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started_at = g.get('started_at')
+    if started_at is not None:
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started_at)
+        REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
 # Model defense: adversarial input detection thresholds
 # These limits should be adjusted based on your model's characteristics
-MAX_INPUT_LENGTH = 50000  # Maximum acceptable email length
+# Longer messages are screened and scored in SCREEN_MAX_LENGTH windows within LONG_DOCUMENT_BUDGET seconds
+MAX_INPUT_LENGTH = int(os.getenv('MAX_INPUT_LENGTH', '50000'))  # Maximum acceptable email length
+LONG_DOCUMENT_BUDGET = float(os.getenv('LONG_DOCUMENT_BUDGET', '0.25'))
 MIN_INPUT_LENGTH = 5      # Minimum acceptable email length
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '500'))  # Maximum emails per /check_spam/batch call
+MBOX_SCORING_CHUNK = 64   # Messages from an mbox upload scored per scorer call
 SUSPICIOUS_PATTERNS = [
     r'(DROP|DELETE|INSERT|UPDATE|SELECT)\s+.*\bFROM\b',  # SQL injection patterns
     r'<script.*?>',                                      # XSS scripts
@@ -112,317 +285,141 @@ def log_security_event(event_type, details, ip_address=None, user_email=None, se
     if ip_address is None:
         ip_address = get_remote_address()
     
-    security_event = {
-        'event_type': event_type,
-        'details': details,
-        'ip_address': ip_address,
-        'user_email': user_email,
-        'severity': severity,
-        'timestamp': datetime.datetime.utcnow()
-    }
-    security_events_collection.insert_one(security_event)
+    security_event_writer.submit(build_security_event(event_type, details, ip_address, user_email, severity))
     logger.warning(f"Security event: {event_type} - {details}")
 
-import re
-import numpy as np
-
-def is_adversarial_input(text):
-    """Check if input might be adversarial or malicious"""
-    # Define constants if not already defined elsewhere
-    MAX_INPUT_LENGTH = 1000  # Adjust as needed
-    MIN_INPUT_LENGTH = 5     # Adjust as needed
-    SUSPICIOUS_PATTERNS = [
-        r'<script.?>.?</script>',
-        r'<.?javascript:.?>',
-        # Add other patterns here
-    ]
-    
-    # Helper function for logging (implement as needed)
-    def log_security_event(event_type, details, severity):
-        # Implementation of your logging function
-        pass
-    
-    # Check input length constraints
-    if len(text) > MAX_INPUT_LENGTH:
-        log_security_event("oversized_input", f"Input length: {len(text)}", severity="medium")
-        return True
-    
-    if len(text) < MIN_INPUT_LENGTH:
-        log_security_event("undersized_input", f"Input length: {len(text)}", severity="low")
-        return True
-    
-    # Check for suspicious patterns
-    for pattern in SUSPICIOUS_PATTERNS:
-        if re.search(pattern, text, re.IGNORECASE):
-            log_security_event("suspicious_pattern", f"Pattern detected: {pattern}", severity="high")
-            return True
-    
-    # Check for unusual character distributions
-    char_counts = {}
-    for char in text:
-        if char in char_counts:
-            char_counts[char] += 1
+def respond(response):
+    """Flask response for a (payload, status[, headers]) tuple from service_common"""
+    payload, *rest = response
+    return (jsonify(payload), *rest)
+
+#========================Prediction Helpers==================================================
+# Sanitize, screen and score against this worker's caches; stage timings go to ztrust_stage_seconds
+pipeline = ClassificationPipeline(prediction_cache, near_duplicates, MAX_INPUT_LENGTH, LONG_DOCUMENT_BUDGET,
+                                  stage_seconds=STAGE_SECONDS, rejected_inputs=REJECTED_INPUTS)
+
+def classify_and_log(current_user, mails, active_model):
+    """Sanitize, screen and score a list of raw messages and queue their prediction logs.
+
+    Cache misses that pass screening are scored together in one scorer call.
+    Returns one result dict per message with either the prediction fields or an
+    'error', plus its 'index' in mails; rejected items share one security event.
+    """
+    results = [None] * len(mails)
+    accepted = []  # (index, mail, prediction) with prediction filled from the cache when possible
+    windowed = {}  # index -> per-window breakdown of long messages
+    pending = []   # (position in accepted, cache key) for cache misses
+    adversarial_indexes = []
+
+    # Sanitize and screen every message; failures are reported per item
+    for index, mail in enumerate(mails):
+        if not isinstance(mail, str) or not mail:
+            results[index] = {'index': index, 'error': 'Email content is required'}
+            continue
+
+        mail = pipeline.sanitize(mail)
+        if len(mail) > SCREEN_MAX_LENGTH:
+            prediction, windowed[index] = pipeline.classify_long_document(mail, active_model)
+            adversarial = prediction is None
         else:
-            char_counts[char] = 1
-    
-    # Calculate character distribution entropy
-    total_chars = len(text)
-    entropy = 0
-    for char, count in char_counts.items():
-        prob = count / total_chars
-        entropy -= prob * np.log2(prob) if prob > 0 else 0
-    
-    # Unusually low entropy can indicate adversarial inputs
-    if entropy < 2.0 and len(text) > 10:
-        log_security_event("unusual_entropy", f"Input entropy: {entropy}", severity="medium")
-        return True
-    
-    # Check for repeated character patterns
-    repeated_chars_pattern = r'(.)\1{3,}'  # At least 4 of the same character in a row
-    if re.search(repeated_chars_pattern, text):
-        log_security_event("repeated_characters", "Repeated character sequence detected", severity="medium")
-        return True
-    
-    # Check for alternating character patterns
-    alternating_pattern = r'(.)(.)(\1\2){2,}'  # Pattern like 'abababab'
-    if re.search(alternating_pattern, text):
-        log_security_event("alternating_pattern", "Alternating character pattern detected", severity="medium")
-        return True
-    
-    # Check for keyboard patterns
-    keyboard_patterns = [
-        r'qwert', r'asdfg', r'zxcvb', 
-        r'qay', r'wsx', r'edc'  # Vertical patterns
-    ]
-    for pattern in keyboard_patterns:
-        if pattern in text.lower():
-            log_security_event("keyboard_pattern", f"Keyboard pattern detected: {pattern}", severity="medium")
-            return True
-    
-    # Check for numeric-only content that's not reasonably formatted
-    if re.match(r'^[0-9]+$', text) and len(text) > 4:
-        typical_number_patterns = [
-            r'^\d{3}-\d{3}-\d{4}$',  # Phone number with hyphens
-            r'^\d{5}(-\d{4})?$',     # ZIP code
-            r'^\d{1,3}$'              # Small numbers
-        ]
-        if not any(re.match(pattern, text) for pattern in typical_number_patterns):
-            log_security_event("suspicious_numeric", "Suspicious numeric sequence", severity="medium")
-            return True
-    
-    # Check ratio of alphanumeric to non-alphanumeric characters
-    alnum_count = sum(1 for c in text if c.isalnum())
-    if len(text) > 5 and alnum_count / len(text) < 0.7:
-        log_security_event("high_special_char_ratio", "High ratio of special characters", severity="medium")
-        return True
-    
-    # Check for random character distribution (gibberish detection)
-    unique_chars = len(char_counts)
-    if len(text) > 8 and unique_chars / len(text) > 0.8:
-        log_security_event("random_distribution", "Random character distribution detected", severity="medium")
-        return True
-    
-    # NEW: Check for repeating subsequences (like your example "uiqauiqa1209uiqauiqa1209")
-    if len(text) >= 8:  # Only check longer strings
-        # Check if the string is made up of repeating patterns
-        for pattern_length in range(2, len(text) // 2 + 1):
-            # Get the potential pattern
-            pattern = text[:pattern_length]
-            # Check if the string consists of repetitions of this pattern
-            if text == pattern * (len(text) // pattern_length) + text[:(len(text) % pattern_length)]:
-                log_security_event("repeating_subsequence", f"Repeating pattern detected: {pattern}", severity="medium")
-                return True
-                
-        # NEW: Check if string has two identical halves
-        half_length = len(text) // 2
-        if text[:half_length] == text[half_length:half_length*2] and half_length >= 4:
-            log_security_event("identical_halves", "String contains identical halves", severity="medium")
-            return True
-        
-        # NEW: Check for identical segments (any position)
-        for segment_length in range(4, len(text) // 2 + 1):
-            for i in range(len(text) - segment_length * 2 + 1):
-                segment = text[i:i+segment_length]
-                # Look for this segment elsewhere in the string
-                rest_of_string = text[i+segment_length:]
-                if segment in rest_of_string:
-                    log_security_event("identical_segments", f"Identical segments detected: {segment}", severity="medium")
-                    return True
-        
-    return False
-
-def sanitize_input(text):
-    """Sanitize input text to prevent injection attacks"""
-    # Basic sanitization - remove potentially dangerous characters
-    # This is a simple implementation - consider using a library like bleach for production
-    text = re.sub(r'<[^>]*>', '', text)  # Remove HTML tags
-    text = re.sub(r'[\'";]', '', text)   # Remove quotes and semicolons
-    
-    # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    return text
+            cache_key, prediction, adversarial = pipeline.screen_with_cache(mail, active_model)
+        if adversarial:
+            results[index] = {'index': index, 'error': 'Invalid input format'}
+            adversarial_indexes.append(index)
+            continue
+
+        if prediction is None:
+            pending.append((len(accepted), cache_key))
+        accepted.append((index, mail, prediction))
+
+    # One security event for the whole batch instead of one write per rejected item
+    if adversarial_indexes:
+        log_security_event(
+            'potential_adversarial_input',
+            f"Potential adversarial input detected in batch items: {adversarial_indexes[:50]}",
+            user_email=current_user['email'],
+            severity="high"
+        )
+
+    if pending:
+        try:
+            # Score every cache miss in one call
+            predictions = pipeline.predict_with_cache(active_model, [cache_key for _, cache_key in pending],
+                                                      [accepted[position][1] for position, _ in pending])
+            for (position, _), prediction in zip(pending, predictions):
+                index, mail, _ = accepted[position]
+                accepted[position] = (index, mail, prediction)
+        except Exception as e:
+            logger.error(f"Error processing email batch: {str(e)}")
+            for position, _ in pending:
+                index = accepted[position][0]
+                results[index] = {'index': index, 'error': 'Error processing email content'}
+            accepted = [item for item in accepted if item[2] is not None]
+
+    if accepted:
+        log_records = []
+        for index, mail, (result, confidence, confidence_level, cluster_id) in accepted:
+            log_records.append(build_log_record(current_user['email'], mail, result, confidence, confidence_level,
+                                                active_model.version, cluster_id, get_remote_address()))
+            results[index] = {'index': index,
+                              **build_prediction_response(result, confidence, confidence_level, cluster_id),
+                              **(windowed.get(index) or {})}
+            record_prediction(result, confidence, confidence_level)
+
+        start = time.perf_counter()
+        prediction_log_writer.submit_many(log_records)
+        LOG_ENQUEUE_SECONDS.observe(time.perf_counter() - start)
+
+    return results
 
 #========================Password Hashing==================================================
+# bcrypt runs on a bounded pool; both functions raise PasswordPoolBusy when it is saturated or too slow
+password_hasher = PasswordHasher(rounds=12, workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING,
+                                 timeout=BCRYPT_TIMEOUT)
+
 def hash_password(password):
     # Generate a salt and hash the password
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=12))
-    return hashed_password.decode('utf-8')  # Store as a string
+    return password_hasher.hash(password)
 
 def check_password(password, hashed_password):
-    # Check if the password matches the hash
-    try:
-        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
-    except Exception:
-        return False
+    # Check if the password matches the hash (None checks against a dummy hash)
+    return password_hasher.check(password, hashed_password)
 
 #========================OTP Functions==================================================
-def generate_otp():
-    # Generate a 6-digit OTP
-    return ''.join(random.choices(string.digits, k=6))
-
 def save_otp(email, otp, action):
-    # Store OTP in database with expiration time (10 minutes)
-    expiry_time = datetime.datetime.utcnow() + datetime.timedelta(minutes=10)
-    
-    # Delete any existing OTPs for this email and action
-    otp_collection.delete_many({'email': email, 'action': action})
-    
-    # Insert new OTP with additional security metadata
-    otp_collection.insert_one({
-        'email': email,
-        'otp': otp,
-        'action': action,  # 'login' or 'signup'
-        'created_at': datetime.datetime.utcnow(),
-        'expires_at': expiry_time,
-        'verified': False,
-        'attempts': 0,  # Track verification attempts
-        'ip_address': get_remote_address()
-    })
+    # Replace any previous code for this email and action; expires after 10 minutes
+    otp_store.issue(email, action, otp, get_remote_address())
 
 def verify_otp(email, otp, action):
-    # Find OTP in database
-    otp_data = otp_collection.find_one({
-        'email': email,
-        'action': action,
-        'expires_at': {'$gt': datetime.datetime.utcnow()},
-        'verified': False
-    })
-    
-    if not otp_data:
-        return False
-    
-    # Track failed attempts
-    if otp_data['otp'] != otp:
-        # Increment attempts counter and check if we've exceeded max attempts
-        attempts = otp_data.get('attempts', 0) + 1
-        if attempts >= 5:  # Max 5 attempts
-            # Delete OTP to force re-requesting
-            otp_collection.delete_one({'_id': otp_data['_id']})
-            log_security_event('max_otp_attempts', 
-                              f"User {email} exceeded maximum OTP attempts for {action}",
-                              user_email=email,
-                              severity="high")
-            return False
-            
-        otp_collection.update_one(
-            {'_id': otp_data['_id']}, 
-            {'$set': {'attempts': attempts}}
-        )
-        return False
-    
-    # Mark OTP as verified
-    otp_collection.update_one({'_id': otp_data['_id']}, {'$set': {'verified': True}})
-    return True
-
-def send_otp_email(email, otp, action):
-    # Send OTP via email
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_USER
-        msg['To'] = email
-        
-        if action == 'signup':
-            msg['Subject'] = 'Your Signup Verification Code'
-            body = f"""
-            <html>
-              <body>
-                <h2>Complete Your Registration</h2>
-                <p>Thank you for signing up! Please use the following verification code to complete your registration:</p>
-                <h3 style="background-color: #f2f2f2; padding: 10px; font-size: 24px; letter-spacing: 5px;">{otp}</h3>
-                <p>This code will expire in 10 minutes.</p>
-                <p>If you didn't request this code, please ignore this email.</p>
-                <p>IP Address: {get_remote_address()}</p>
-              </body>
-            </html>
-            """
-        else:  # login
-            msg['Subject'] = 'Your Login Verification Code'
-            body = f"""
-            <html>
-              <body>
-                <h2>Login Verification</h2>
-                <p>You're trying to log in to your account. Please use the following verification code:</p>
-                <h3 style="background-color: #f2f2f2; padding: 10px; font-size: 24px; letter-spacing: 5px;">{otp}</h3>
-                <p>This code will expire in 10 minutes.</p>
-                <p>IP Address: {get_remote_address()}</p>
-                <p>If you didn't attempt to log in, please secure your account immediately.</p>
-              </body>
-            </html>
-            """
-        
-        msg.attach(MIMEText(body, 'html'))
-        
-        server = smtplib.SMTP(EMAIL_SERVER, EMAIL_PORT)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_USER, email, text)
-        server.quit()
-        return True
-    except Exception as e:
-        logger.error(f"Error sending email: {e}")
-        return False
+    # Checking the code and counting a failed attempt is one atomic store operation
+    return otp_verified(otp_store.verify(email, action, otp), email, action, log_security_event)
 
 #========================Authentication==================================================
-def create_token(user):
-    payload = {
-        'user_id': str(user['_id']),
-        'email': user['email'],
-        'role': user['role'],
-        'ip': get_remote_address(),  # Add IP address for extra validation
-        'iat': datetime.datetime.utcnow(),  # Issued at time
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=8)  # Reduced token lifetime
-    }
-    token = jwt.encode(payload, JWT_SECRET, algorithm='HS256')
-    return token
+# Short-lived cache of user documents so authenticated requests skip the users lookup
+user_cache = LRUCache(max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+def get_cached_user(email):
+    start = time.perf_counter()
+    user = user_cache.get(email)
+    if user is None:
+        user = users_collection.find_one({'email': email})
+        if user is not None:
+            user_cache.put(email, user)
+    USER_LOOKUP_SECONDS.observe(time.perf_counter() - start)
+    return user
+
+def invalidate_cached_user(email):
+    """Call whenever a user's document (e.g. role) changes or the user logs in again"""
+    user_cache.invalidate(email)
 
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            log_security_event('missing_token', 'API request without token', severity="medium")
-            return jsonify({'message': 'Token is missing'}), 401
-
         try:
-            token = token.split(" ")[1]
-            data = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-            current_user = users_collection.find_one({'email': data['email']})
-            
-            # Additional security: validate the IP hasn't changed
-            if data.get('ip') != get_remote_address():
-                log_security_event('ip_mismatch', 
-                                  f"Token IP {data.get('ip')} doesn't match current IP {get_remote_address()}",
-                                  user_email=data['email'],
-                                  severity="high")
-                return jsonify({'message': 'Session expired, please login again'}), 401
-                
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            log_security_event('invalid_token', 'Invalid token used', severity="high")
-            return jsonify({'message': 'Invalid token'}), 401
+            data = decode_token(request.headers.get('Authorization'), JWT_SECRET, get_remote_address())
+            current_user = get_cached_user(data['email'])
+        except AuthError as e:
+            return respond(auth_error_response(e, log_security_event))
         except Exception as e:
             logger.error(f"Token validation error: {str(e)}")
             return jsonify({'message': 'Authentication failed'}), 500
@@ -438,18 +435,10 @@ def register_initiate():
     email = data.get('email')
     password = data.get('password')
 
-    if not email or not password:
-        return jsonify({'message': 'Email and password are required'}), 400
-        
-    # Validate email format
-    if not re.match(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$", email):
-        return jsonify({'message': 'Invalid email format'}), 400
-        
-    # Password strength validation
-    if len(password) < 8:
-        return jsonify({'message': 'Password must be at least 8 characters'}), 400
-    if not re.search(r"[A-Z]", password) or not re.search(r"[a-z]", password) or not re.search(r"[0-9]", password):
-        return jsonify({'message': 'Password must contain uppercase, lowercase and numbers'}), 400
+    # Email format and password strength
+    error = registration_error(email, password)
+    if error:
+        return jsonify({'message': error}), 400
 
     if users_collection.find_one({'email': email}):
         return jsonify({'message': 'Email already exists'}), 400
@@ -458,17 +447,11 @@ def register_initiate():
     otp = generate_otp()
     save_otp(email, otp, 'signup')
     
-    if send_otp_email(email, otp, 'signup'):
-        # Store hashed password in Redis or another temporary store for better security
-        # For this example, we'll return it encrypted
-        encrypted_pwd = cipher_suite.encrypt(password.encode()).decode()
-        return jsonify({
-            'message': 'Verification code sent to your email',
-            'email': email,
-            'password': encrypted_pwd
-        }), 200
-    else:
-        return jsonify({'message': 'Failed to send verification code'}), 500
+    delivery_id = send_otp_email(mailer, EMAIL_USER, email, otp, 'signup', get_remote_address())
+    # Store hashed password in Redis or another temporary store for better security
+    # For this example, we'll return it encrypted
+    encrypted_pwd = cipher_suite.encrypt(password.encode()).decode()
+    return respond(otp_sent_response(mailer, delivery_id, email, password=encrypted_pwd))
 
 @app.route('/register/verify', methods=['POST'])
 @limiter.limit("5 per minute")
@@ -483,12 +466,7 @@ def register_verify():
 
     try:
         # Decrypt password if it was encrypted
-        if password.startswith('gAAA'):  # Simple check if it looks like Fernet encrypted
-            try:
-                password = cipher_suite.decrypt(password.encode()).decode()
-            except Exception:
-                # If decryption fails, assume it's plaintext
-                pass
+        password = decrypt_password(cipher_suite, password)
     except Exception as e:
         logger.error(f"Password decryption error: {e}")
         return jsonify({'message': 'Invalid request format'}), 400
@@ -498,15 +476,11 @@ def register_verify():
         return jsonify({'message': 'Invalid or expired verification code'}), 400
 
     # Create user
-    hashed_password = hash_password(password)
-    new_user = {
-        'email': email,
-        'password': hashed_password,
-        'role': 'user',  # Default role
-        'created_at': datetime.datetime.utcnow(),
-        'last_login': None
-    }
-    users_collection.insert_one(new_user)
+    try:
+        hashed_password = hash_password(password)
+    except PasswordPoolBusy:
+        return respond(password_busy_response(BCRYPT_RETRY_AFTER))
+    users_collection.insert_one(new_user(email, hashed_password))
     logger.info(f"New user registered: {email}")
     return jsonify({'message': 'User registered successfully'}), 201
 
@@ -521,10 +495,12 @@ def login_initiate():
         return jsonify({'message': 'Email and password are required'}), 400
 
     user = users_collection.find_one({'email': email})
-    if not user or not check_password(password, user['password']):
-        # Add delay to prevent timing attacks
-        import time
-        time.sleep(random.uniform(0.5, 1.5))
+    try:
+        # Unknown users are checked against a dummy hash so both failures take the same time
+        password_valid = check_password(password, user['password'] if user else None)
+    except PasswordPoolBusy:
+        return respond(password_busy_response(BCRYPT_RETRY_AFTER))
+    if not user or not password_valid:
         log_security_event('failed_login', f"Failed login attempt for {email}", user_email=email)
         return jsonify({'message': 'Invalid credentials'}), 401
 
@@ -532,13 +508,8 @@ def login_initiate():
     otp = generate_otp()
     save_otp(email, otp, 'login')
     
-    if send_otp_email(email, otp, 'login'):
-        return jsonify({
-            'message': 'Verification code sent to your email',
-            'email': email
-        }), 200
-    else:
-        return jsonify({'message': 'Failed to send verification code'}), 500
+    delivery_id = send_otp_email(mailer, EMAIL_USER, email, otp, 'login', get_remote_address())
+    return respond(otp_sent_response(mailer, delivery_id, email))
 
 @app.route('/login/verify', methods=['POST'])
 @limiter.limit("5 per minute")
@@ -564,8 +535,9 @@ def login_verify():
         {'_id': user['_id']},
         {'$set': {'last_login': datetime.datetime.utcnow()}}
     )
+    invalidate_cached_user(email)
 
-    token = create_token(user)
+    token = create_token(user, JWT_SECRET, get_remote_address())
     logger.info(f"User logged in: {email}")
     return jsonify({'token': token, 'role': user['role']}), 200
 
@@ -580,10 +552,15 @@ def check_spam(current_user):
         return jsonify({'message': 'Email content is required'}), 400
         
     # Security: Sanitize and validate input
-    mail = sanitize_input(mail)
-    
-    # Check for adversarial inputs
-    if is_adversarial_input(mail):
+    mail = pipeline.sanitize(mail)
+    active_model = model_registry.active()
+    try:
+        # Exact cache, adversarial screen, near-duplicate index, then the scorer
+        prediction, details = pipeline.classify(mail, active_model)
+    except Exception as e:
+        logger.error(f"Error processing email: {str(e)}")
+        return jsonify({'message': 'Error processing email content'}), 500
+    if prediction is None:
         log_security_event(
             'potential_adversarial_input', 
             'Potential adversarial input detected',
@@ -592,110 +569,253 @@ def check_spam(current_user):
         )
         return jsonify({'message': 'Invalid input format'}), 400
 
-    try:
-        # Transform input for prediction
-        input_data_features = feature_extraction.transform([mail])
-        
-        # Implement gradient masking as a defense against adversarial examples
-        # This is a simplified example - more sophisticated techniques would be used in production
-        prediction_probabilities = model.predict_proba(input_data_features)[0]
-        
-        # If the prediction is very close to the decision boundary, treat with caution
-        is_spam = prediction_probabilities[0] > 0.5
-        confidence = max(prediction_probabilities)
-        
-        # If confidence is low, flag as uncertain
-        result = 'SPAM' if is_spam else 'NOT SPAM'
-        confidence_level = "high" if confidence > 0.8 else "medium" if confidence > 0.6 else "low"
-        
-        # Log the prediction with confidence
-        log_data = {
-            'user': current_user['email'],
-            'emailSubject': mail[:50],  # Truncate subject for logging
-            'result': result,
-            'confidence': float(confidence),
-            'confidence_level': confidence_level,
-            'timestamp': datetime.datetime.utcnow(),
-            'ip_address': get_remote_address()
-        }
-        logs_collection.insert_one(log_data)
-        
-        # If confidence is very low, add a warning in the response
-        response = {'result': result, 'confidence': float(confidence), 'confidence_level': confidence_level}
-        if confidence < 0.6:
-            response['warning'] = 'Prediction has low confidence, please review carefully'
-            
-        return jsonify(response), 200
-        
-    except Exception as e:
-        logger.error(f"Error processing email: {str(e)}")
-        return jsonify({'message': 'Error processing email content'}), 500
+    result, confidence, confidence_level, cluster_id = prediction
+    # Log the prediction with confidence
+    log_data = build_log_record(current_user['email'], mail, result, confidence, confidence_level,
+                                active_model.version, cluster_id, get_remote_address())
+    start = time.perf_counter()
+    prediction_log_writer.submit(log_data)
+    LOG_ENQUEUE_SECONDS.observe(time.perf_counter() - start)
+    record_prediction(result, confidence, confidence_level)
+
+    response = build_prediction_response(result, confidence, confidence_level, cluster_id)
+    if details:
+        response.update(details)
+    return jsonify(response), 200
+
+@app.route('/check_spam/batch', methods=['POST'])
+@token_required
+@limiter.limit("10 per minute")
+def check_spam_batch(current_user):
+    data = request.get_json(silent=True) or {}
+    mails = data.get('mails')
+
+    if not isinstance(mails, list) or not mails:
+        return jsonify({'message': 'A non-empty list of emails is required'}), 400
+    if len(mails) > MAX_BATCH_SIZE:
+        return jsonify({'message': f'Batch size exceeds the limit of {MAX_BATCH_SIZE} emails'}), 400
+
+    results = classify_and_log(current_user, mails, model_registry.active())
+    failed = sum(1 for item in results if 'error' in item)
+    return jsonify({
+        'results': results,
+        'processed': len(results) - failed,
+        'failed': failed
+    }), 200
+
+@app.route('/check_spam/mbox', methods=['POST'])
+@token_required
+@limiter.limit("10 per minute")
+def check_spam_mbox(current_user):
+    """Score every message in a raw .eml or mbox upload, streaming one NDJSON line per message"""
+    active_model = model_registry.active()
+    stream = request.stream
+
+    def generate():
+        chunk = []
+        for message_info in iter_message_texts(stream):
+            chunk.append(message_info)
+            if len(chunk) >= MBOX_SCORING_CHUNK:
+                yield from score_mbox_chunk(current_user, chunk, active_model)
+                chunk = []
+        if chunk:
+            yield from score_mbox_chunk(current_user, chunk, active_model)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def score_mbox_chunk(current_user, chunk, active_model):
+    results = classify_and_log(current_user, [text for _, _, _, text in chunk], active_model)
+    for (index, message_id, subject, _), result in zip(chunk, results):
+        result.update(index=index, message_id=message_id, subject=subject[:100])
+        yield json.dumps(result) + '\n'
+
+def export_response(collection, query, fields, name):
+    """Stream query results as NDJSON (default) or CSV straight from the Mongo cursor"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'message': "format must be 'ndjson' or 'csv'"}), 400
+    cursor = export_cursor(collection, query)
+    if export_format == 'csv':
+        body, mimetype = iter_csv(cursor, fields), 'text/csv'
+    else:
+        body, mimetype = iter_ndjson(cursor), 'application/x-ndjson'
+    filename = f"{name}-{datetime.datetime.utcnow():%Y%m%dT%H%M%SZ}.{'csv' if export_format == 'csv' else 'ndjson'}"
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 @app.route('/logs', methods=['GET'])
 @token_required
 @limiter.limit("5 per minute")
 def get_logs(current_user):
-    if current_user['role'] != 'admin':
-        log_security_event(
-            'unauthorized_access',
-            f"User {current_user['email']} attempted to access logs without permission",
-            user_email=current_user['email'],
-            severity="high"
-        )
-        return jsonify({'message': 'Unauthorized'}), 403
+    denied = admin_denied(current_user, 'access logs', log_security_event)
+    if denied:
+        return respond(denied)
 
-    # Pagination support
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 10))
-    skip = (page - 1) * per_page
-    
-    logs = list(logs_collection.find({}).sort('timestamp', -1).skip(skip).limit(per_page))
-    total = logs_collection.count_documents({})
-    
-    # Convert ObjectId to string for JSON serialization
-    logs = [{**log, '_id': str(log['_id'])} for log in logs]
+    try:
+        query = log_filters(request.args)
+        page, per_page, cursor, count = parse_page_args(request.args)
+        logs, next_cursor = fetch_page(logs_collection, query, page, per_page, cursor)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    total, total_accuracy = count_total(logs_collection, query, count)
     
-    return jsonify({
-        'logs': logs,
-        'page': page,
-        'per_page': per_page,
-        'total': total
-    }), 200
+    return respond(page_response('logs', logs, page, per_page, total, total_accuracy, next_cursor))
 
 @app.route('/security-events', methods=['GET'])
 @token_required
 @limiter.limit("5 per minute")
 def get_security_events(current_user):
-    if current_user['role'] != 'admin':
-        log_security_event(
-            'unauthorized_access',
-            f"User {current_user['email']} attempted to access security events without permission",
-            user_email=current_user['email'],
-            severity="high"
-        )
-        return jsonify({'message': 'Unauthorized'}), 403
+    denied = admin_denied(current_user, 'access security events', log_security_event)
+    if denied:
+        return respond(denied)
 
-    # Filter by severity if specified
-    severity = request.args.get('severity')
-    query = {'severity': severity} if severity else {}
-    
-    # Pagination support
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 10))
-    skip = (page - 1) * per_page
-    
-    events = list(security_events_collection.find(query).sort('timestamp', -1).skip(skip).limit(per_page))
-    total = security_events_collection.count_documents(query)
-    
-    # Convert ObjectId to string for JSON serialization
-    events = [{**event, '_id': str(event['_id'])} for event in events]
+    try:
+        query = security_event_filters(request.args)
+        page, per_page, cursor, count = parse_page_args(request.args)
+        events, next_cursor = fetch_page(security_events_collection, query, page, per_page, cursor)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    total, total_accuracy = count_total(security_events_collection, query, count)
     
-    return jsonify({
-        'events': events,
-        'page': page,
-        'per_page': per_page,
-        'total': total
-    }), 200
+    return respond(page_response('events', events, page, per_page, total, total_accuracy, next_cursor))
+
+@app.route('/logs/export', methods=['GET'])
+@token_required
+@limiter.limit("5 per minute")
+def export_logs(current_user):
+    denied = admin_denied(current_user, 'export logs', log_security_event)
+    if denied:
+        return respond(denied)
+    try:
+        query = log_filters(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    logger.info(f"Logs export started by {current_user['email']}: {query}")
+    return export_response(logs_collection, query, LOG_FIELDS, 'logs')
+
+@app.route('/security-events/export', methods=['GET'])
+@token_required
+@limiter.limit("5 per minute")
+def export_security_events(current_user):
+    denied = admin_denied(current_user, 'export security events', log_security_event)
+    if denied:
+        return respond(denied)
+    try:
+        query = security_event_filters(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    logger.info(f"Security events export started by {current_user['email']}: {query}")
+    return export_response(security_events_collection, query, SECURITY_EVENT_FIELDS, 'security-events')
+
+@app.route('/stats', methods=['GET'])
+@token_required
+@limiter.limit("30 per minute")
+def get_stats(current_user):
+    """Dashboard statistics read from the rollups, independent of how many logs exist"""
+    denied = admin_denied(current_user, 'access stats', log_security_event)
+    if denied:
+        return respond(denied)
+
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in GRANULARITIES:
+        return jsonify({'message': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+    try:
+        until = parse_timestamp(request.args.get('until')) or datetime.datetime.utcnow()
+        # Default window: the last 60 minutes, 24 hours or 30 days
+        default_span = {'minute': 60, 'hour': 24, 'day': 30}[granularity] * GRANULARITIES[granularity]
+        since = parse_timestamp(request.args.get('since')) or until - default_span
+        top_users = min(int(request.args.get('top_users', 10)), 100)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if since >= until:
+        return jsonify({'message': 'since must be before until'}), 400
+    if (until - since) > MAX_BUCKETS * GRANULARITIES[granularity]:
+        return jsonify({'message': f'Time range exceeds {MAX_BUCKETS} {granularity} buckets; '
+                                   f'use a coarser granularity'}), 400
+
+    response = {'granularity': granularity, 'since': since.isoformat(), 'until': until.isoformat()}
+    for kind in ('predictions', 'security_events'):
+        buckets, totals = rollups.series(kind, granularity, since, until)
+        response[kind] = {'buckets': buckets, 'totals': totals}
+    response['top_users'] = rollups.top_users(top_users) if top_users > 0 else []
+    return jsonify(response), 200
+
+@app.route('/clusters', methods=['GET'])
+@token_required
+@limiter.limit("30 per minute")
+def get_clusters(current_user):
+    """Largest active near-duplicate clusters in this worker's index"""
+    denied = admin_denied(current_user, 'access clusters', log_security_event)
+    if denied:
+        return respond(denied)
+    if near_duplicates is None:
+        return jsonify({'message': 'Near-duplicate index is disabled'}), 404
+
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+        min_hits = int(request.args.get('min_hits', 1))
+    except ValueError:
+        return jsonify({'message': 'limit and min_hits must be integers'}), 400
+
+    clusters = []
+    for cluster in near_duplicates.largest_clusters(limit, min_hits):
+        result, confidence, confidence_level = cluster.pop('verdict')
+        cluster.update(
+            result=result,
+            confidence=confidence,
+            confidence_level=confidence_level,
+            first_seen=datetime.datetime.utcfromtimestamp(cluster['first_seen']).isoformat(),
+            last_seen=datetime.datetime.utcfromtimestamp(cluster['last_seen']).isoformat(),
+        )
+        clusters.append(cluster)
+    # Each worker keeps its own index, so the listing covers the traffic this worker has seen
+    return jsonify({'clusters': clusters, 'index': near_duplicates.stats(), 'worker': os.getpid()}), 200
+
+@app.route('/feedback', methods=['POST'])
+@token_required
+@limiter.limit("30 per minute")
+def submit_feedback(current_user):
+    """Queue a corrected label for the online learner; optionally tied to a logged prediction"""
+    denied = admin_denied(current_user, 'submit feedback', log_security_event)
+    if denied:
+        return respond(denied)
+
+    data = request.get_json(silent=True) or {}
+    mail = data.get('mail')
+    label = data.get('label')
+    if not mail or not isinstance(mail, str):
+        return jsonify({'message': 'Email content is required'}), 400
+    if label not in ('spam', 'ham'):
+        return jsonify({'message': "label must be 'spam' or 'ham'"}), 400
+
+    feedback = {
+        'text': sanitize_input(mail),
+        'label': label,
+        'submitted_by': current_user['email'],
+        'status': 'pending',
+        'timestamp': datetime.datetime.utcnow(),
+    }
+    log_id = data.get('log_id')
+    if log_id:
+        try:
+            log = logs_collection.find_one({'_id': ObjectId(log_id)}, {'result': 1, 'model_version': 1})
+        except (InvalidId, TypeError):
+            log = None
+        if log is None:
+            return jsonify({'message': 'Unknown log_id'}), 404
+        feedback.update(log_id=log['_id'], predicted=log.get('result'), model_version=log.get('model_version'))
+
+    feedback_id = feedback_collection.insert_one(feedback).inserted_id
+    logger.info(f"Feedback {feedback_id} ({label}) submitted by {current_user['email']}")
+    return jsonify({'id': str(feedback_id), 'status': 'pending'}), 201
+
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def get_metrics():
+    """Prometheus scrape endpoint, aggregated across workers when METRICS_DIR is set"""
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'message': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # Add OPTIONS route handlers for CORS preflight requests
 @app.route('/register/initiate', methods=['OPTIONS'])
@@ -703,23 +823,33 @@ def get_security_events(current_user):
 @app.route('/login/initiate', methods=['OPTIONS'])
 @app.route('/login/verify', methods=['OPTIONS'])
 @app.route('/check_spam', methods=['OPTIONS'])
+@app.route('/check_spam/batch', methods=['OPTIONS'])
+@app.route('/check_spam/mbox', methods=['OPTIONS'])
 @app.route('/logs', methods=['OPTIONS'])
 @app.route('/security-events', methods=['OPTIONS'])
+@app.route('/stats', methods=['OPTIONS'])
+@app.route('/logs/export', methods=['OPTIONS'])
+@app.route('/security-events/export', methods=['OPTIONS'])
+@app.route('/feedback', methods=['OPTIONS'])
+@app.route('/clusters', methods=['OPTIONS'])
 def handle_options_request():
     return '', 200
 
 # Route to handle rate limit exceeded error
+# Clients that keep hammering a limit are logged once per minute per limit, not on every 429
+rate_limit_events = LRUCache(max_entries=10000, ttl=60)
+
 @app.errorhandler(429)
 def ratelimit_handler(e):
-    log_security_event(
-        'rate_limit_exceeded',
-        f"Rate limit exceeded: {str(e)}",
-        severity="medium"
-    )
-    return jsonify({
-        "message": "Rate limit exceeded. Please try again later.",
-        "error": "Too many requests"
-    }), 429
+    event_key = (get_remote_address(), request.endpoint, str(e))
+    if rate_limit_events.get(event_key) is None:
+        rate_limit_events.put(event_key, True)
+        log_security_event(
+            'rate_limit_exceeded',
+            f"Rate limit exceeded: {str(e)}",
+            severity="medium"
+        )
+    return respond(rate_limit_response())
 
 if __name__ == '__main__':
     # Don't run in debug mode in production
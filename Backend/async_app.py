@@ -0,0 +1,486 @@
+"""ASGI variant of the service with non-blocking Mongo and SMTP I/O.
+
+Serves the same routes and JSON contracts as app.py:
+
+- /register/initiate and /register/verify
+- /login/initiate and /login/verify
+- /check_spam
+- /logs and /security-events
+
+Requests run as coroutines on one event loop:
+
+- Mongo goes through motor and OTP email through aiosmtplib.
+- Screening and scoring run on a small inference thread pool.
+- bcrypt runs on the bounded PasswordHasher pool.
+
+A request waiting on Mongo or the SMTP relay holds no thread, so
+concurrency is no longer capped at workers x threads.
+
+    pip install -r requirements-async.txt
+    hypercorn async_app:app --bind 0.0.0.0:5000
+
+Configuration comes from the same environment variables as app.py. The
+prediction and security-event write-behind stays on BufferedWriter, which
+runs its own thread and pymongo client. Its default policy here is 'spill'
+rather than 'block', because a full queue must not stall the event loop.
+compare_serving.py measures both modes against local Mongo and SMTP
+stand-ins.
+
+Validation, screening and scoring, tokens, and response bodies come from
+service_common.py, which app.py uses too. This module only awaits the I/O
+around them.
+"""
+import asyncio
+import datetime
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from cryptography.fernet import Fernet
+from dotenv import load_dotenv
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from quart import Quart, jsonify, request
+from quart_cors import cors
+
+import shared_limits  # Registers the sharedmem:// rate-limit storage
+from async_mailer import AsyncMailer
+from cache import LRUCache, PredictionCache
+from log_writer import BufferedWriter
+from model_registry import ModelRegistry
+from near_duplicates import NearDuplicateIndex
+from pagination import (COUNT_LIMIT, SORT, finish_page, keyset_query, log_filters, parse_page_args,
+                        security_event_filters)
+from otp_store import open_store
+from password_hashing import (DEFAULT_MAX_PENDING, DEFAULT_TIMEOUT, DEFAULT_WORKERS, PasswordHasher,
+                              PasswordPoolBusy)
+from rollups import Rollups
+from service_common import (COLLECTION_INDEXES, AuthError, ClassificationPipeline, admin_denied,
+                            auth_error_response, build_log_record, build_prediction_response,
+                            build_security_event, create_token, decode_token, decrypt_password, generate_otp,
+                            load_model, new_user, otp_sent_response, otp_verified, page_response,
+                            password_busy_response, rate_limit_response, registration_error, send_otp_email)
+
+load_dotenv()
+
+app = Quart(__name__)
+app = cors(app, allow_origin=os.getenv('ALLOWED_ORIGINS', 'http://localhost:5173').split(','),
+           allow_methods=["GET", "POST", "OPTIONS"],
+           allow_headers=["Content-Type", "Authorization"],
+           allow_credentials=True)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('security.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger('security')
+
+MONGO_URI = os.getenv('MONGO_URI')
+JWT_SECRET = os.getenv('JWT_SECRET')
+EMAIL_USER = os.getenv('EMAIL_USER')
+EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
+EMAIL_SERVER = os.getenv('EMAIL_SERVER', 'smtp.gmail.com')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '587'))
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'true').lower() == 'true'
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', '2'))
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '3'))
+SCORING_ENGINE = os.getenv('SCORING_ENGINE', 'compiled')
+MODEL_ARTIFACT = os.getenv('MODEL_ARTIFACT')
+MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR')
+MODEL_REGISTRY_POLL = float(os.getenv('MODEL_REGISTRY_POLL', '30'))
+PREDICTION_CACHE_MAX_BYTES = int(os.getenv('PREDICTION_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+PREDICTION_CACHE_TTL = int(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv('NEAR_DUPLICATE_MAX_ENTRIES', '50000'))
+NEAR_DUPLICATE_TTL = int(os.getenv('NEAR_DUPLICATE_TTL', '3600'))
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.8'))
+MAX_INPUT_LENGTH = int(os.getenv('MAX_INPUT_LENGTH', '50000'))
+LONG_DOCUMENT_BUDGET = float(os.getenv('LONG_DOCUMENT_BUDGET', '0.25'))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(DEFAULT_WORKERS)))
+BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', str(DEFAULT_MAX_PENDING)))
+BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', str(DEFAULT_TIMEOUT)))
+BCRYPT_RETRY_AFTER = int(os.getenv('BCRYPT_RETRY_AFTER', '2'))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '60'))
+OTP_STORE = os.getenv('OTP_STORE', 'mongo')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', '500'))
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', '1.0'))
+LOG_BACKPRESSURE = os.getenv('LOG_BACKPRESSURE', 'spill')  # 'block' would stall the event loop when full
+LOG_SPILL_DIR = os.getenv('LOG_SPILL_DIR', '.')
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '4'))  # Threads for screening and scoring
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
+
+ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', Fernet.generate_key())
+cipher_suite = Fernet(ENCRYPTION_KEY)
+
+#========================Database==================================================
+client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+db = client.spam_classifier_db
+users_collection = db.users
+logs_collection = db.logs
+otp_collection = db.otps
+otp_store = open_store(OTP_STORE, otp_collection, asynchronous=True)
+security_events_collection = db.security_events
+
+# The write-behind writers flush from their own threads, so they keep a synchronous client
+sync_db = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000).spam_classifier_db
+rollups = Rollups(sync_db.stats_rollups, sync_db.user_stats)
+writer_options = dict(max_queue=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE,
+                      flush_interval=LOG_FLUSH_INTERVAL, policy=LOG_BACKPRESSURE)
+prediction_log_writer = BufferedWriter(sync_db.logs, 'prediction_logs',
+                                       spill_path=os.path.join(LOG_SPILL_DIR, 'prediction_logs.spill.jsonl'),
+                                       on_flush=rollups.on_flush('predictions'), **writer_options)
+security_event_writer = BufferedWriter(sync_db.security_events, 'security_events',
+                                       spill_path=os.path.join(LOG_SPILL_DIR, 'security_events.spill.jsonl'),
+                                       on_flush=rollups.on_flush('security_events'), **writer_options)
+
+async def ensure_indexes():
+    # Same indexes as app.py
+    for collection_name, keys, options in COLLECTION_INDEXES:
+        await db[collection_name].create_index(keys, **options)
+    await otp_store.ensure_indexes()
+
+#========================Model==================================================
+initial_model = load_model(MODEL_ARTIFACT, SCORING_ENGINE)
+model_version = initial_model.version
+logger.info(f"Model loaded (version: {model_version}, scoring engine: {initial_model.scorer.engine})")
+
+prediction_cache = PredictionCache(max_bytes=PREDICTION_CACHE_MAX_BYTES, ttl=PREDICTION_CACHE_TTL)
+prediction_cache.bind_model(model_version)
+near_duplicates = None
+if NEAR_DUPLICATE_MAX_ENTRIES > 0:
+    near_duplicates = NearDuplicateIndex(max_entries=NEAR_DUPLICATE_MAX_ENTRIES, ttl=NEAR_DUPLICATE_TTL,
+                                         threshold=NEAR_DUPLICATE_THRESHOLD)
+    near_duplicates.bind_model(model_version)
+
+def bind_model_caches(active_model):
+    prediction_cache.bind_model(active_model.version)
+    if near_duplicates is not None:
+        near_duplicates.bind_model(active_model.version)
+
+model_registry = ModelRegistry(
+    initial_model,
+    directory=MODEL_REGISTRY_DIR,
+    poll_interval=MODEL_REGISTRY_POLL,
+    on_swap=bind_model_caches
+)
+if MODEL_REGISTRY_DIR:
+    model_registry.poll()
+# No metrics registry here, so the pipeline stages are not timed
+pipeline = ClassificationPipeline(prediction_cache, near_duplicates, MAX_INPUT_LENGTH, LONG_DOCUMENT_BUDGET)
+
+#========================Executors, Mail and Rate Limits==================================================
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix='inference')
+password_hasher = PasswordHasher(rounds=12, workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING,
+                                 timeout=BCRYPT_TIMEOUT)
+mailer = AsyncMailer(EMAIL_SERVER, EMAIL_PORT, username=EMAIL_USER, password=EMAIL_PASSWORD,
+                     use_tls=EMAIL_USE_TLS, pool_size=EMAIL_POOL_SIZE, max_attempts=EMAIL_MAX_ATTEMPTS)
+user_cache = LRUCache(max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Same fixed-window counters and storage as flask-limiter uses in app.py
+rate_limiter = FixedWindowRateLimiter(storage_from_string(os.getenv('LIMITER_STORAGE_URI', 'sharedmem://')))
+rate_limit_events = LRUCache(max_entries=10000, ttl=60)
+
+@app.before_serving
+async def start_services():
+    await ensure_indexes()
+    await mailer.start()
+
+@app.after_serving
+async def stop_services():
+    await mailer.close()
+    inference_executor.shutdown(wait=False)
+
+def get_remote_address():
+    return request.remote_addr or '127.0.0.1'
+
+def rate_limited(limit):
+    item = parse(limit)
+
+    def decorator(f):
+        @wraps(f)
+        async def decorated(*args, **kwargs):
+            if RATELIMIT_ENABLED and not rate_limiter.hit(item, request.endpoint, get_remote_address()):
+                return ratelimit_response(item)
+            return await f(*args, **kwargs)
+        return decorated
+    return decorator
+
+def ratelimit_response(item):
+    # Clients that keep hammering a limit are logged once per minute per limit, as in app.py
+    event_key = (get_remote_address(), request.endpoint, str(item))
+    if rate_limit_events.get(event_key) is None:
+        rate_limit_events.put(event_key, True)
+        log_security_event('rate_limit_exceeded', f"Rate limit exceeded: {item}", severity="medium")
+    return respond(rate_limit_response())
+
+#========================Security Functions==================================================
+def log_security_event(event_type, details, ip_address=None, user_email=None, severity="medium"):
+    """Queue a security event for the write-behind writer (never waits on Mongo)"""
+    security_event_writer.submit(build_security_event(event_type, details, ip_address or get_remote_address(),
+                                                      user_email, severity))
+    logger.warning(f"Security event: {event_type} - {details}")
+
+def respond(response):
+    """Quart response for a (payload, status[, headers]) tuple from service_common"""
+    payload, *rest = response
+    return (jsonify(payload), *rest)
+
+def classify(mail, active_model):
+    """Sanitize, screen and score one message on the inference pool; (sanitized mail, prediction, details)"""
+    mail = pipeline.sanitize(mail)
+    return (mail, *pipeline.classify(mail, active_model))
+
+#========================Password Hashing and OTP==================================================
+async def wait_password(future):
+    # Same timeout as the sync pool; cancelling the wait also drops the operation if it is still queued
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), password_hasher.timeout)
+    except asyncio.TimeoutError:
+        password_hasher.timed_out += 1
+        raise PasswordPoolBusy("Password operation timed out")
+
+async def hash_password(password):
+    return await wait_password(password_hasher.submit_hash(password))
+
+async def check_password(password, hashed_password):
+    return await wait_password(password_hasher.submit_check(password, hashed_password))
+
+async def save_otp(email, otp, action):
+    await otp_store.issue(email, action, otp, get_remote_address())
+
+async def verify_otp(email, otp, action):
+    return otp_verified(await otp_store.verify(email, action, otp), email, action, log_security_event)
+
+#========================Authentication==================================================
+async def get_cached_user(email):
+    user = user_cache.get(email)
+    if user is None:
+        user = await users_collection.find_one({'email': email})
+        if user is not None:
+            user_cache.put(email, user)
+    return user
+
+def token_required(f):
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        try:
+            data = decode_token(request.headers.get('Authorization'), JWT_SECRET, get_remote_address())
+            current_user = await get_cached_user(data['email'])
+        except AuthError as e:
+            return respond(auth_error_response(e, log_security_event))
+        except Exception as e:
+            logger.error(f"Token validation error: {str(e)}")
+            return jsonify({'message': 'Authentication failed'}), 500
+
+        return await f(current_user, *args, **kwargs)
+    return decorated
+
+#========================Pagination==================================================
+async def fetch_page(collection, query, page, per_page, cursor=None):
+    """Async pagination.fetch_page"""
+    find = collection.find(keyset_query(query, cursor)).sort(SORT)
+    if not cursor:
+        find = find.skip((page - 1) * per_page)
+    return finish_page(await find.limit(per_page + 1).to_list(per_page + 1), per_page)
+
+async def count_total(collection, query, mode):
+    """Async pagination.count_total"""
+    if mode == 'none':
+        return None, None
+    if mode == 'exact':
+        return await collection.count_documents(query), 'exact'
+    if not query:
+        return await collection.estimated_document_count(), 'estimated'
+    total = await collection.count_documents(query, limit=COUNT_LIMIT)
+    return total, 'exact' if total < COUNT_LIMIT else 'lower_bound'
+
+#========================API Endpoints==================================================
+@app.route('/register/initiate', methods=['POST'])
+@rate_limited("5 per minute")
+async def register_initiate():
+    data = await request.get_json()
+    email = data.get('email')
+    password = data.get('password')
+
+    error = registration_error(email, password)
+    if error:
+        return jsonify({'message': error}), 400
+
+    if await users_collection.find_one({'email': email}):
+        return jsonify({'message': 'Email already exists'}), 400
+
+    otp = generate_otp()
+    await save_otp(email, otp, 'signup')
+
+    delivery_id = send_otp_email(mailer, EMAIL_USER, email, otp, 'signup', get_remote_address())
+    encrypted_pwd = cipher_suite.encrypt(password.encode()).decode()
+    return respond(otp_sent_response(mailer, delivery_id, email, password=encrypted_pwd))
+
+@app.route('/register/verify', methods=['POST'])
+@rate_limited("5 per minute")
+async def register_verify():
+    data = await request.get_json()
+    email = data.get('email')
+    password = data.get('password')
+    otp = data.get('otp')
+
+    if not email or not password or not otp:
+        return jsonify({'message': 'Email, password and verification code are required'}), 400
+
+    password = decrypt_password(cipher_suite, password)
+
+    if not await verify_otp(email, otp, 'signup'):
+        return jsonify({'message': 'Invalid or expired verification code'}), 400
+
+    try:
+        hashed_password = await hash_password(password)
+    except PasswordPoolBusy:
+        return respond(password_busy_response(BCRYPT_RETRY_AFTER))
+    await users_collection.insert_one(new_user(email, hashed_password))
+    logger.info(f"New user registered: {email}")
+    return jsonify({'message': 'User registered successfully'}), 201
+
+@app.route('/login/initiate', methods=['POST'])
+@rate_limited("5 per minute")
+async def login_initiate():
+    data = await request.get_json()
+    email = data.get('email')
+    password = data.get('password')
+
+    if not email or not password:
+        return jsonify({'message': 'Email and password are required'}), 400
+
+    user = await users_collection.find_one({'email': email})
+    try:
+        # Unknown users are checked against a dummy hash so both failures take the same time
+        password_valid = await check_password(password, user['password'] if user else None)
+    except PasswordPoolBusy:
+        return respond(password_busy_response(BCRYPT_RETRY_AFTER))
+    if not user or not password_valid:
+        log_security_event('failed_login', f"Failed login attempt for {email}", user_email=email)
+        return jsonify({'message': 'Invalid credentials'}), 401
+
+    otp = generate_otp()
+    await save_otp(email, otp, 'login')
+
+    delivery_id = send_otp_email(mailer, EMAIL_USER, email, otp, 'login', get_remote_address())
+    return respond(otp_sent_response(mailer, delivery_id, email))
+
+@app.route('/login/verify', methods=['POST'])
+@rate_limited("5 per minute")
+async def login_verify():
+    data = await request.get_json()
+    email = data.get('email')
+    otp = data.get('otp')
+
+    if not email or not otp:
+        return jsonify({'message': 'Email and verification code are required'}), 400
+
+    if not await verify_otp(email, otp, 'login'):
+        return jsonify({'message': 'Invalid or expired verification code'}), 400
+
+    user = await users_collection.find_one({'email': email})
+    if not user:
+        return jsonify({'message': 'User not found'}), 404
+
+    await users_collection.update_one({'_id': user['_id']}, {'$set': {'last_login': datetime.datetime.utcnow()}})
+    user_cache.invalidate(email)
+
+    token = create_token(user, JWT_SECRET, get_remote_address())
+    logger.info(f"User logged in: {email}")
+    return jsonify({'token': token, 'role': user['role']}), 200
+
+@app.route('/check_spam', methods=['POST'])
+@token_required
+@rate_limited("10 per minute")
+async def check_spam(current_user):
+    data = await request.get_json()
+    mail = data.get('mail')
+
+    if not mail:
+        return jsonify({'message': 'Email content is required'}), 400
+
+    active_model = model_registry.active()
+    try:
+        mail, prediction, details = await asyncio.get_running_loop().run_in_executor(
+            inference_executor, classify, mail, active_model)
+    except Exception as e:
+        logger.error(f"Error processing email: {str(e)}")
+        return jsonify({'message': 'Error processing email content'}), 500
+
+    if prediction is None:
+        log_security_event(
+            'potential_adversarial_input',
+            'Potential adversarial input detected',
+            user_email=current_user['email'],
+            severity="high"
+        )
+        return jsonify({'message': 'Invalid input format'}), 400
+
+    result, confidence, confidence_level, cluster_id = prediction
+    prediction_log_writer.submit(build_log_record(current_user['email'], mail, result, confidence, confidence_level,
+                                                  active_model.version, cluster_id, get_remote_address()))
+    response = build_prediction_response(result, confidence, confidence_level, cluster_id)
+    if details:
+        response.update(details)
+    return jsonify(response), 200
+
+@app.route('/logs', methods=['GET'])
+@token_required
+@rate_limited("5 per minute")
+async def get_logs(current_user):
+    denied = admin_denied(current_user, 'access logs', log_security_event)
+    if denied:
+        return respond(denied)
+
+    try:
+        query = log_filters(request.args)
+        page, per_page, cursor, count = parse_page_args(request.args)
+        (logs, next_cursor), (total, total_accuracy) = await asyncio.gather(
+            fetch_page(logs_collection, query, page, per_page, cursor),
+            count_total(logs_collection, query, count))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    return respond(page_response('logs', logs, page, per_page, total, total_accuracy, next_cursor))
+
+@app.route('/security-events', methods=['GET'])
+@token_required
+@rate_limited("5 per minute")
+async def get_security_events(current_user):
+    denied = admin_denied(current_user, 'access security events', log_security_event)
+    if denied:
+        return respond(denied)
+
+    try:
+        query = security_event_filters(request.args)
+        page, per_page, cursor, count = parse_page_args(request.args)
+        (events, next_cursor), (total, total_accuracy) = await asyncio.gather(
+            fetch_page(security_events_collection, query, page, per_page, cursor),
+            count_total(security_events_collection, query, count))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    return respond(page_response('events', events, page, per_page, total, total_accuracy, next_cursor))
+
+@app.route('/register/initiate', methods=['OPTIONS'])
+@app.route('/register/verify', methods=['OPTIONS'])
+@app.route('/login/initiate', methods=['OPTIONS'])
+@app.route('/login/verify', methods=['OPTIONS'])
+@app.route('/check_spam', methods=['OPTIONS'])
+@app.route('/logs', methods=['OPTIONS'])
+@app.route('/security-events', methods=['OPTIONS'])
+async def handle_options_request():
+    return '', 200
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
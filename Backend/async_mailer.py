@@ -0,0 +1,150 @@
+import asyncio
+import itertools
+import logging
+import time
+import uuid
+from collections import OrderedDict
+
+import aiosmtplib
+
+from mailer import MailQueueFull
+
+logger = logging.getLogger('security')
+
+
+class AsyncMailer:
+    """asyncio counterpart of mailer.Mailer for the ASGI service.
+
+    Same contract: send() only enqueues and returns a delivery id, a few
+    worker tasks each keep one aiosmtplib connection open, failed deliveries
+    are retried with exponential backoff and recent statuses are kept for
+    status(). Everything runs on the event loop, so waiting on the relay
+    costs no threads.
+    """
+
+    def __init__(self, host, port, username=None, password=None, sender=None, use_tls=True,
+                 pool_size=2, max_queue=1000, max_attempts=3, backoff=1.0, max_backoff=30.0,
+                 timeout=10.0, max_tracked=10000, smtp_factory=aiosmtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.use_tls = use_tls
+        self.pool_size = pool_size
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_tracked = max_tracked
+        self.smtp_factory = smtp_factory
+        self._queue = None
+        self._workers = []
+        self._statuses = OrderedDict()
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.connections_opened = 0
+
+    async def start(self):
+        """Start the worker tasks; call from the serving event loop"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [asyncio.create_task(self._run(), name=f"smtp-worker-{index}")
+                         for index in range(self.pool_size)]
+
+    def send(self, to_address, message):
+        """Queue a message (str or email.message.Message) and return its delivery id"""
+        if not isinstance(message, str):
+            message = message.as_string()
+        delivery_id = uuid.uuid4().hex
+        self._set_status(delivery_id, 'queued', attempts=0)
+        try:
+            self._queue.put_nowait((delivery_id, to_address, message))
+        except asyncio.QueueFull:
+            self._set_status(delivery_id, 'failed', error='Mail queue is full')
+            raise MailQueueFull(f"Mail queue is full ({self.max_queue} messages)")
+        return delivery_id
+
+    def status(self, delivery_id):
+        entry = self._statuses.get(delivery_id)
+        return dict(entry, id=delivery_id) if entry else None
+
+    def _set_status(self, delivery_id, status, **fields):
+        entry = self._statuses.pop(delivery_id, {})
+        entry.update(fields, status=status, updated_at=time.time())
+        self._statuses[delivery_id] = entry
+        while len(self._statuses) > self.max_tracked:
+            self._statuses.popitem(last=False)
+
+    async def _connect(self):
+        server = self.smtp_factory(hostname=self.host, port=self.port, timeout=self.timeout,
+                                   start_tls=self.use_tls)
+        try:
+            await server.connect()
+            if self.username:
+                await server.login(self.username, self.password)
+        except Exception:
+            await self._disconnect(server)
+            raise
+        self.connections_opened += 1
+        return server
+
+    @staticmethod
+    async def _disconnect(server):
+        try:
+            await server.quit()
+        except Exception:
+            server.close()
+
+    async def _run(self):
+        server = None
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                if server is not None:
+                    await self._disconnect(server)
+                self._queue.task_done()
+                return
+            delivery_id, to_address, message = item
+            for attempt in itertools.count(1):
+                self._set_status(delivery_id, 'sending', attempts=attempt)
+                try:
+                    if server is None:
+                        server = await self._connect()
+                    await server.sendmail(self.sender, [to_address], message)
+                except Exception as e:
+                    # Drop the connection; the next attempt opens a fresh one
+                    if server is not None:
+                        await self._disconnect(server)
+                        server = None
+                    if attempt >= self.max_attempts or isinstance(e, aiosmtplib.SMTPRecipientsRefused):
+                        self.failed += 1
+                        self._set_status(delivery_id, 'failed', error=str(e))
+                        logger.error(f"Error sending email: {e}")
+                        break
+                    self.retries += 1
+                    self._set_status(delivery_id, 'retrying', error=str(e))
+                    await asyncio.sleep(min(self.backoff * 2 ** (attempt - 1), self.max_backoff))
+                else:
+                    self.sent += 1
+                    self._set_status(delivery_id, 'sent', error=None)
+                    break
+            self._queue.task_done()
+
+    async def close(self, timeout=None):
+        """Deliver what is queued, then shut the connections down"""
+        if self._queue is None:
+            return
+        for _ in self._workers:
+            await self._queue.put(None)
+        await asyncio.wait(self._workers, timeout=timeout or self.timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'connections_opened': self.connections_opened,
+        }
@@ -0,0 +1,239 @@
+"""Reproducible benchmarks for the /check_spam request path.
+
+Each stage is timed in isolation (sanitize_input, adversarial screening,
+TF-IDF transform, predict_proba, compiled scoring, vocabulary lookups,
+windowed long-document analysis, log inserts against an in-memory Mongo
+stand-in) and end to end
+through Flask's test client with a real JWT. Inputs are mail_data.csv plus seeded synthetic messages of
+increasing length, which exposes any superlinear screening cost.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+
+Run from Backend/ with the model pickles present. The in-memory Mongo
+stand-in needs the dev requirements (pip install -r requirements-dev.txt).
+Results are written as JSON so runs from different commits can be compared.
+"""
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from long_documents import analyze_document
+from screening import SCREEN_MAX_LENGTH, AdversarialInputScanner, sanitize_input
+from scoring import CompiledLinearScorer
+
+SYNTHETIC_LENGTHS = [100, 250, 500, 1000, 2000, 5000, 10000, 20000, 50000]
+WORDS = ("meeting tomorrow lunch project report please call free prize win cash claim offer account "
+         "update review schedule weekend family dinner office invoice payment delivery urgent reply").split()
+
+
+def load_corpus(path='mail_data.csv'):
+    with open(path, newline='', encoding='utf-8') as file:
+        return [row['Message'] for row in csv.DictReader(file) if row['Message']]
+
+
+def synthetic_message(length, seed):
+    """Deterministic word salad of exactly length characters"""
+    rng = random.Random(seed)
+    words = []
+    total = 0
+    while total < length:
+        word = rng.choice(WORDS) + str(rng.randint(0, 9999))
+        words.append(word)
+        total += len(word) + 1
+    return ' '.join(words)[:length]
+
+
+def measure(function, inputs, repeat, warmup=3):
+    """Time function over every input, repeat times; returns per-call statistics in microseconds"""
+    for item in inputs[:warmup]:
+        function(item)
+    samples = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter_ns()
+            function(item)
+            samples.append(time.perf_counter_ns() - start)
+    samples = np.asarray(samples, dtype=np.float64) / 1000.0
+    return {
+        'calls': int(samples.size),
+        'mean_us': float(samples.mean()),
+        'p50_us': float(np.percentile(samples, 50)),
+        'p95_us': float(np.percentile(samples, 95)),
+        'p99_us': float(np.percentile(samples, 99)),
+        'min_us': float(samples.min()),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def stage_benchmarks(corpus, repeat, record):
+    import pickle
+    with open('logistic_regression.pkl', 'rb') as file:
+        model = pickle.load(file)
+    with open('feature_extraction.pkl', 'rb') as file:
+        feature_extraction = pickle.load(file)
+    compiled = CompiledLinearScorer.from_sklearn(feature_extraction, model)
+    sanitized = [sanitize_input(message) for message in corpus]
+
+    record('sanitize_input', 'corpus', measure(sanitize_input, corpus, repeat))
+    # Unbounded scanner so long inputs are screened rather than rejected on length
+    unbounded = AdversarialInputScanner(max_length=sys.maxsize)
+    record('is_adversarial_input', 'corpus', measure(unbounded.scan, sanitized, repeat))
+    record('tfidf_transform', 'corpus', measure(lambda text: feature_extraction.transform([text]), sanitized, repeat))
+    features = [feature_extraction.transform([text]) for text in sanitized]
+    record('predict_proba', 'corpus', measure(model.predict_proba, features, repeat))
+    record('compiled_score', 'corpus', measure(lambda text: compiled.predict_proba([text]), sanitized, repeat))
+    # Token lookups alone: the compact vocabulary against the vectorizer's dict
+    tokenized = [compiled.tokenize(text) for text in sanitized]
+    lookup = feature_extraction.vocabulary_.get
+    record('vocabulary_dict', 'corpus',
+           measure(lambda tokens: [index for index in map(lookup, tokens) if index is not None], tokenized, repeat))
+    record('vocabulary_compact', 'corpus', measure(compiled.vocabulary.indexes, tokenized, repeat))
+
+    for length in SYNTHETIC_LENGTHS:
+        messages = [synthetic_message(length, seed) for seed in range(20)]
+        dataset = f'synthetic_{length}'
+        record('sanitize_input', dataset, measure(sanitize_input, messages, repeat))
+        record('is_adversarial_input', dataset, measure(unbounded.scan, messages, repeat))
+        record('tfidf_transform', dataset, measure(lambda text: feature_extraction.transform([text]), messages, repeat))
+        record('compiled_score', dataset, measure(lambda text: compiled.predict_proba([text]), messages, repeat))
+        if length > SCREEN_MAX_LENGTH:
+            # Windowed screen + score without a budget, so the cost of the full document shows
+            record('long_document', dataset,
+                   measure(lambda text: analyze_document(text, compiled, budget=float('inf')), messages, repeat))
+
+
+def log_insert_benchmarks(repeat, record):
+    import mongomock
+    from log_writer import BufferedWriter
+
+    collection = mongomock.MongoClient().bench.logs
+
+    def make_record(_):
+        return {'user': 'bench@example.com', 'emailSubject': 'benchmark message', 'result': 'NOT SPAM',
+                'confidence': 0.95, 'confidence_level': 'high', 'timestamp': datetime.datetime.utcnow(),
+                'ip_address': '127.0.0.1'}
+
+    inputs = list(range(500))
+    record('log_insert_one', 'in_memory_mongo', measure(lambda i: collection.insert_one(make_record(i)), inputs, repeat))
+    writer = BufferedWriter(collection, 'benchmark', max_queue=100000)
+    record('log_buffered_submit', 'in_memory_mongo', measure(lambda i: writer.submit(make_record(i)), inputs, repeat))
+    writer.close()
+
+
+def endpoint_benchmarks(corpus, repeat, record):
+    import jwt
+    import mongomock
+    import pymongo
+
+    # The app connects to Mongo at import; point it at the in-memory stand-in
+    pymongo.MongoClient = mongomock.MongoClient
+    os.environ.setdefault('JWT_SECRET', 'benchmark-secret-benchmark-secret')
+    import app as service
+
+    # Keep the per-request security log lines out of the benchmark output
+    logging.getLogger('security').setLevel(logging.ERROR)
+    service.limiter.enabled = False
+    service.users_collection.insert_one({'email': 'bench@example.com', 'role': 'admin', 'password': ''})
+    token = jwt.encode({
+        'email': 'bench@example.com', 'role': 'admin', 'ip': '127.0.0.1',
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+    }, service.JWT_SECRET, algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    client = service.app.test_client()
+
+    def check_spam(mail):
+        client.post('/check_spam', json={'mail': mail}, headers=headers)
+
+    # Cold: clear the prediction cache so every request is screened and scored
+    def check_spam_cold(mail):
+        service.prediction_cache.clear()
+        check_spam(mail)
+
+    record('check_spam_endpoint_cold', 'corpus', measure(check_spam_cold, corpus, repeat))
+    record('check_spam_endpoint_cached', 'corpus', measure(check_spam, corpus, repeat))
+    for length in (100, 500, 1000):
+        messages = [synthetic_message(length, seed) for seed in range(20)]
+        record('check_spam_endpoint_cold', f'synthetic_{length}', measure(check_spam_cold, messages, repeat))
+    service.prediction_log_writer.close()
+    service.security_event_writer.close()
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = {(item['name'], item['dataset']): item for item in json.load(file)['results']}
+    print(f"{'benchmark':<30} {'dataset':<18} {'baseline p50':>13} {'current p50':>12} {'ratio':>7}")
+    for item in results:
+        previous = baseline.get((item['name'], item['dataset']))
+        if previous is None:
+            continue
+        ratio = item['p50_us'] / previous['p50_us'] if previous['p50_us'] else float('inf')
+        print(f"{item['name']:<30} {item['dataset']:<18} {previous['p50_us']:>11.1f}us "
+              f"{item['p50_us']:>10.1f}us {ratio:>6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the spam classification pipeline")
+    parser.add_argument('--output', default='-', help="Where to write the JSON results ('-' for stdout)")
+    parser.add_argument('--compare', help="Previous JSON results to compare against")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over each input set")
+    parser.add_argument('--corpus-size', type=int, default=1000, help="Messages taken from mail_data.csv")
+    parser.add_argument('--skip-endpoint', action='store_true', help="Skip the Flask end-to-end benchmarks")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus()[:args.corpus_size]
+    results = []
+
+    def record(name, dataset, stats):
+        results.append({'name': name, 'dataset': dataset, **stats})
+        print(f"{name:<30} {dataset:<18} p50 {stats['p50_us']:10.1f}us  p95 {stats['p95_us']:10.1f}us",
+              file=sys.stderr)
+
+    stage_benchmarks(corpus, args.repeat, record)
+    log_insert_benchmarks(args.repeat, record)
+    if not args.skip_endpoint:
+        endpoint_benchmarks(corpus, args.repeat, record)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'corpus_size': len(corpus),
+        },
+        'results': results,
+    }
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""Offline bulk scorer for CSV archives and mbox/.eml dumps.
+
+Runs the same sanitize_input -> adversarial screen -> vectorize ->
+predict_proba pipeline as /check_spam, sharded across a process pool, and
+streams one output row per message. Messages longer than one screening
+window are screened and scored window by window, as the API does:
+
+    python bulk_score.py mail_data.csv archive.mbox --output scores.csv --workers 8
+    python bulk_score.py mail_data.csv --artifact model.ztm --output scores.parquet
+
+CSV inputs need a 'Message' column; a 'Category' column (spam/ham) is passed
+through and used to report accuracy. Throughput and per-stage timings are
+printed to stderr when the run finishes.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from mail_ingest import iter_message_texts
+from long_documents import analyze_document
+from screening import SCREEN_MAX_LENGTH, sanitize_input, scanner
+from scoring import build_scorer, interpret_probabilities
+
+OUTPUT_FIELDS = ['source', 'index', 'label', 'result', 'confidence', 'confidence_level', 'rejected_reason']
+STAGES = ['sanitize', 'screen', 'score', 'long_document']
+# Same defaults as the API's MAX_INPUT_LENGTH and LONG_DOCUMENT_BUDGET
+MAX_INPUT_LENGTH = 50000
+LONG_DOCUMENT_BUDGET = 0.25
+
+_scorer = None
+
+
+def load_scorer(artifact=None, vectorizer_path='feature_extraction.pkl', model_path='logistic_regression.pkl',
+                engine='compiled'):
+    if artifact:
+        from model_artifact import load_scorer as load_artifact_scorer
+        return load_artifact_scorer(artifact)[0]
+    import pickle
+    with open(model_path, 'rb') as file:
+        model = pickle.load(file)
+    with open(vectorizer_path, 'rb') as file:
+        vectorizer = pickle.load(file)
+    return build_scorer(vectorizer, model, engine)
+
+
+def _init_worker(scorer_options):
+    global _scorer
+    _scorer = load_scorer(**scorer_options)
+
+
+def score_long_document(row, mail, max_input_length, budget):
+    """Fill row with the windowed verdict for a message longer than one screening window"""
+    if len(mail) > max_input_length:
+        row['rejected_reason'] = 'oversized_input'
+        return
+    analysis = analyze_document(mail, _scorer, budget)
+    if analysis.rejection is not None:
+        row['rejected_reason'] = analysis.rejection.reason
+    else:
+        row['result'], row['confidence'], row['confidence_level'] = interpret_probabilities(analysis.probabilities)
+
+
+def score_chunk(rows, max_input_length=MAX_INPUT_LENGTH, long_document_budget=LONG_DOCUMENT_BUDGET):
+    """Score (source, index, label, text) rows; returns (output rows, stage timings)"""
+    timings = dict.fromkeys(STAGES, 0.0)
+    output = []
+    accepted = []
+
+    for source, index, label, text in rows:
+        start = time.perf_counter()
+        mail = sanitize_input(text or '')
+        timings['sanitize'] += time.perf_counter() - start
+
+        row = {'source': source, 'index': index, 'label': label, 'result': '', 'confidence': '',
+               'confidence_level': '', 'rejected_reason': ''}
+        output.append(row)
+        if not mail:
+            row['rejected_reason'] = 'empty_input'
+            continue
+        start = time.perf_counter()
+        if len(mail) > SCREEN_MAX_LENGTH:
+            score_long_document(row, mail, max_input_length, long_document_budget)
+            timings['long_document'] += time.perf_counter() - start
+            continue
+        finding = scanner.scan(mail)
+        timings['screen'] += time.perf_counter() - start
+        if finding is not None:
+            row['rejected_reason'] = finding.reason
+        else:
+            accepted.append((row, mail))
+
+    if accepted:
+        start = time.perf_counter()
+        probabilities = _scorer.predict_proba([mail for _, mail in accepted])
+        for (row, _), prediction_probabilities in zip(accepted, probabilities):
+            row['result'], row['confidence'], row['confidence_level'] = interpret_probabilities(prediction_probabilities)
+        timings['score'] += time.perf_counter() - start
+    return output, timings
+
+
+def iter_inputs(paths):
+    """Yield (source, index, label, text) for every message in the input files"""
+    for path in paths:
+        source = os.path.basename(path)
+        if path.lower().endswith('.csv'):
+            with open(path, newline='', encoding='utf-8') as file:
+                for index, record in enumerate(csv.DictReader(file)):
+                    yield source, index, record.get('Category', ''), record.get('Message') or ''
+        else:
+            with open(path, 'rb') as file:
+                for index, _, _, text in iter_message_texts(file):
+                    yield source, index, '', text
+
+
+def iter_chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class CsvOutput:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8') if path != '-' else sys.stdout
+        self.writer = csv.DictWriter(self.file, fieldnames=OUTPUT_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ParquetOutput:
+    """Writes each scored chunk as a Parquet row group (requires pyarrow)"""
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output requires pyarrow (pip install pyarrow)")
+        self.pa = pa
+        self.schema = pa.schema([
+            ('source', pa.string()), ('index', pa.int64()), ('label', pa.string()), ('result', pa.string()),
+            ('confidence', pa.float64()), ('confidence_level', pa.string()), ('rejected_reason', pa.string()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = {name: [row[name] for row in rows] for name in OUTPUT_FIELDS}
+        columns['confidence'] = [value if value != '' else None for value in columns['confidence']]
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def run(paths, output, workers, chunk_size, scorer_options, max_input_length=MAX_INPUT_LENGTH,
+        long_document_budget=LONG_DOCUMENT_BUDGET):
+    """Score every input message and return a summary of the run"""
+    totals = Counter()
+    stage_times = dict.fromkeys(STAGES, 0.0)
+    started = time.perf_counter()
+    write_time = 0.0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(scorer_options,)) as pool:
+        # Keep a bounded window of chunks in flight so memory stays flat on huge inputs
+        window = []
+        chunks = iter_chunks(iter_inputs(paths), chunk_size)
+        for chunk in chunks:
+            window.append(pool.submit(score_chunk, chunk, max_input_length, long_document_budget))
+            if len(window) < workers * 2:
+                continue
+            write_time += _collect(window.pop(0), output, totals, stage_times)
+        for future in window:
+            write_time += _collect(future, output, totals, stage_times)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'messages': totals['messages'],
+        'rejected': totals['rejected'],
+        'elapsed_seconds': elapsed,
+        'messages_per_second': totals['messages'] / elapsed if elapsed else 0.0,
+        'stage_seconds': dict(stage_times, write=write_time),
+        'labelled': totals['labelled'],
+        'accuracy': totals['correct'] / totals['labelled'] if totals['labelled'] else None,
+    }
+
+
+def _collect(future, output, totals, stage_times):
+    rows, timings = future.result()
+    for stage, seconds in timings.items():
+        stage_times[stage] += seconds
+    for row in rows:
+        totals['messages'] += 1
+        if row['rejected_reason']:
+            totals['rejected'] += 1
+        elif row['label'] in ('spam', 'ham'):
+            totals['labelled'] += 1
+            totals['correct'] += (row['result'] == 'SPAM') == (row['label'] == 'spam')
+    start = time.perf_counter()
+    output.write(rows)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-score CSV and mbox archives with the spam model")
+    parser.add_argument('inputs', nargs='+', help="CSV files with a 'Message' column, or mbox/.eml files")
+    parser.add_argument('--output', default='-', help="Output path ('-' for stdout); .parquet selects Parquet")
+    parser.add_argument('--format', choices=['csv', 'parquet'], help="Output format (default: from extension)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--artifact', help="Flat model artifact (model.ztm) instead of the pickles")
+    parser.add_argument('--vectorizer', default='feature_extraction.pkl')
+    parser.add_argument('--model', default='logistic_regression.pkl')
+    parser.add_argument('--engine', choices=['compiled', 'sklearn'], default='compiled')
+    parser.add_argument('--max-input-length', type=int, default=MAX_INPUT_LENGTH,
+                        help="Longer messages are rejected as oversized_input")
+    parser.add_argument('--long-document-budget', type=float, default=LONG_DOCUMENT_BUDGET,
+                        help="Seconds per long message for windowed screening and scoring")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    output = ParquetOutput(args.output) if output_format == 'parquet' else CsvOutput(args.output)
+    scorer_options = {'artifact': args.artifact, 'vectorizer_path': args.vectorizer,
+                      'model_path': args.model, 'engine': args.engine}
+    try:
+        summary = run(args.inputs, output, args.workers, args.chunk_size, scorer_options,
+                      args.max_input_length, args.long_document_budget)
+    finally:
+        output.close()
+
+    print(f"Scored {summary['messages']} messages ({summary['rejected']} rejected by screening) "
+          f"in {summary['elapsed_seconds']:.2f}s with {args.workers} workers: "
+          f"{summary['messages_per_second']:.0f} messages/s", file=sys.stderr)
+    for stage, seconds in summary['stage_seconds'].items():
+        print(f"  {stage:>13}: {seconds:8.3f}s", file=sys.stderr)
+    if summary['accuracy'] is not None:
+        print(f"  accuracy on {summary['labelled']} labelled messages: {summary['accuracy']:.4f}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
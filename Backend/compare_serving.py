@@ -0,0 +1,394 @@
+"""Concurrency comparison of the WSGI service (app.py) and the ASGI one (async_app.py).
+
+Each mode is started in its own process against local stand-ins:
+
+- an in-memory Mongo that waits --mongo-latency per round trip, with
+  time.sleep for pymongo and asyncio.sleep for motor;
+- an SMTP relay that waits --smtp-latency per message.
+
+A closed-loop load generator then steps through increasing numbers of
+concurrent keep-alive connections. The request mix is mostly /check_spam,
+plus /logs and /register/initiate. For each mode it reports the highest
+concurrency whose p99 latency stays at or under --p99.
+
+    python compare_serving.py run --p99 0.25 --output serving.json
+    python compare_serving.py serve async --port 5001   # one stand-in server, for manual runs
+
+The sync service runs as the Procfile runs it: gunicorn gthread, 8 threads,
+one worker. The async service runs under hypercorn on one event loop.
+Run from Backend/ with the model pickles present. Needs both the dev
+and async requirements.
+"""
+import argparse
+import asyncio
+import csv
+import datetime
+import functools
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+ADMIN_EMAIL = 'admin@bench.local'
+SEED_LOGS = 200  # Kept small: mongomock's own CPU cost must stay well below the simulated round trip
+LEVELS = [4, 8, 16, 32, 64, 128, 256]
+MIX = [('check_spam', 0.7), ('logs', 0.2), ('register', 0.1)]
+MAX_ERROR_RATE = 0.01
+REGISTER_EMAILS = 50  # Registrations never complete, so reusing addresses keeps the otps collection small
+# Only the request path gets the latency; the write-behind writers use insert_many/bulk_write in both modes
+REQUEST_PATH_METHODS = ['find_one', 'find_one_and_update', 'insert_one', 'update_one', 'delete_one', 'delete_many',
+                        'count_documents', 'estimated_document_count']
+
+
+#========================Stand-ins==================================================
+def _delay_sync(cls, name, latency):
+    original = getattr(cls, name)
+
+    @functools.wraps(original)
+    def delayed(*args, **kwargs):
+        time.sleep(latency)
+        return original(*args, **kwargs)
+    setattr(cls, name, delayed)
+
+
+def _delay_async(cls, name, latency):
+    original = getattr(cls, name)
+
+    @functools.wraps(original)
+    async def delayed(*args, **kwargs):
+        await asyncio.sleep(latency)
+        return await original(*args, **kwargs)
+    setattr(cls, name, delayed)
+
+
+class StandInSMTP:
+    """smtplib.SMTP lookalike whose sendmail takes latency seconds"""
+    latency = 0.0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def sendmail(self, sender, recipients, message):
+        time.sleep(self.latency)
+
+    def quit(self):
+        pass
+
+    close = quit
+
+
+class AsyncStandInSMTP:
+    """aiosmtplib.SMTP lookalike whose sendmail takes latency seconds"""
+    latency = 0.0
+
+    def __init__(self, **kwargs):
+        pass
+
+    async def connect(self):
+        pass
+
+    async def login(self, username, password):
+        pass
+
+    async def sendmail(self, sender, recipients, message):
+        await asyncio.sleep(self.latency)
+
+    async def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def seed_documents():
+    now = datetime.datetime.utcnow()
+    admin = {'email': ADMIN_EMAIL, 'password': b'', 'role': 'admin', 'created_at': now, 'last_login': None}
+    logs = [{
+        'user': ADMIN_EMAIL,
+        'emailSubject': f"seeded message {index}",
+        'result': 'SPAM' if index % 4 == 0 else 'HAM',
+        'confidence': 0.9,
+        'confidence_level': 'high',
+        'model_version': 'seed',
+        'cluster_id': None,
+        'timestamp': now - datetime.timedelta(seconds=index),
+        'ip_address': '127.0.0.1'
+    } for index in range(SEED_LOGS)]
+    return admin, logs
+
+
+def detach_writers(service, mongomock):
+    # Write-behind records go to a separate store, so /logs pages over the same seeded data in both modes
+    discarded = mongomock.MongoClient().spam_classifier_db
+    service.prediction_log_writer.collection = discarded.logs
+    service.security_event_writer.collection = discarded.security_events
+
+
+def serve(mode, port, mongo_latency, smtp_latency):
+    """Run one service in this process with the stand-ins installed"""
+    import mongomock
+    import pymongo
+    pymongo.MongoClient = mongomock.MongoClient
+    admin, logs = seed_documents()
+
+    if mode == 'sync':
+        from gunicorn.app.base import BaseApplication
+
+        for name in REQUEST_PATH_METHODS + ['find']:
+            _delay_sync(mongomock.collection.Collection, name, mongo_latency)
+        import app as service
+        logging.getLogger('security').setLevel(logging.ERROR)
+        service.limiter.enabled = False
+        detach_writers(service, mongomock)
+        StandInSMTP.latency = smtp_latency
+        service.mailer.smtp_factory = StandInSMTP
+        service.users_collection.insert_one(admin)
+        service.logs_collection.insert_many(logs)
+
+        class Server(BaseApplication):
+            def load_config(self):
+                for key, value in {'bind': f"127.0.0.1:{port}", 'workers': 1, 'worker_class': 'gthread',
+                                   'threads': 8, 'loglevel': 'warning'}.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return service.app
+
+        Server().run()
+        return
+
+    import mongomock_motor
+    import motor.motor_asyncio
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+    for name in REQUEST_PATH_METHODS:
+        _delay_async(mongomock_motor.AsyncMongoMockCollection, name, mongo_latency)
+    _delay_async(mongomock_motor.AsyncCursor, 'to_list', mongo_latency)
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    import async_app as service
+    logging.getLogger('security').setLevel(logging.ERROR)
+    detach_writers(service, mongomock)
+    AsyncStandInSMTP.latency = smtp_latency
+    service.mailer.smtp_factory = AsyncStandInSMTP
+
+    async def main():
+        await service.users_collection.insert_one(admin)
+        await service.logs_collection.insert_many(logs)
+        config = Config()
+        config.bind = [f"127.0.0.1:{port}"]
+        config.loglevel = 'WARNING'
+        await hypercorn_serve(service.app, config)
+
+    asyncio.run(main())
+
+
+#========================Load generator==================================================
+async def http_request(reader, writer, method, path, token, body=None):
+    """Send one HTTP/1.1 request on a keep-alive connection and return its status code"""
+    payload = json.dumps(body).encode() if body is not None else b''
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {token}\r\n"
+                  f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n").encode() + payload)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Connection closed by server")
+    length = 0
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value.lower()
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+def next_request(rng, messages):
+    roll = rng.random()
+    for kind, share in MIX:
+        if roll < share:
+            break
+        roll -= share
+    if kind == 'check_spam':
+        return kind, 'POST', '/check_spam', {'mail': rng.choice(messages)}
+    if kind == 'logs':
+        return kind, 'GET', '/logs?per_page=20&result=SPAM', None
+    return kind, 'POST', '/register/initiate', {'email': f"bench-{rng.randrange(REGISTER_EMAILS)}@bench.local",
+                                                'password': 'Passw0rdBench'}
+
+
+async def run_level(port, token, messages, concurrency, duration, warmup):
+    """Closed loop: each connection sends its next request as soon as the previous one completes"""
+    latencies = []
+    kinds = {kind: 0 for kind, _ in MIX}
+    errors = 0
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def connection(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        while time.perf_counter() < deadline:
+            kind, method, path, body = next_request(rng, messages)
+            sent = time.perf_counter()
+            try:
+                status = await http_request(reader, writer, method, path, token, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                status = None
+            if sent < measure_from:
+                continue
+            latencies.append(time.perf_counter() - sent)
+            kinds[kind] += 1
+            if status is None or status >= 400:
+                errors += 1
+        writer.close()
+
+    await asyncio.gather(*(connection(index) for index in range(concurrency)))
+    samples = np.array(latencies)
+    return {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'throughput': len(samples) / duration,
+        'p50': float(np.percentile(samples, 50)) if len(samples) else None,
+        'p99': float(np.percentile(samples, 99)) if len(samples) else None,
+        'errors': errors,
+        'mix': kinds,
+    }
+
+
+def wait_for_port(port, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start listening on port {port}")
+
+
+def load_messages(path, limit=2000):
+    """Short corpus messages that pass screening, so /check_spam errors mean the server failed"""
+    from screening import SCREEN_MAX_LENGTH, sanitize_input, scanner
+
+    with open(path, newline='', encoding='utf-8') as file:
+        messages = [row['Message'] for row in csv.DictReader(file) if row['Message']]
+    return [message for message in messages
+            if len(message) <= SCREEN_MAX_LENGTH and scanner.scan(sanitize_input(message)) is None][:limit]
+
+
+def compare_modes(args):
+    import jwt
+
+    secret = 'compare-serving-' + uuid.uuid4().hex
+    now = datetime.datetime.utcnow()
+    token = jwt.encode({'user_id': 'bench', 'email': ADMIN_EMAIL, 'role': 'admin', 'ip': '127.0.0.1', 'iat': now,
+                        'exp': now + datetime.timedelta(hours=8)}, secret, algorithm='HS256')
+    messages = load_messages(args.dataset)
+    spill_dir = tempfile.mkdtemp(prefix='compare-serving-')
+    env = dict(os.environ, JWT_SECRET=secret, MONGO_URI='mongodb://stand-in', LOG_SPILL_DIR=spill_dir,
+               EMAIL_USER='bench@bench.local', EMAIL_PASSWORD='', EMAIL_POOL_SIZE='8', MODEL_REGISTRY_DIR='')
+    results = {'p99_target': args.p99, 'mongo_latency': args.mongo_latency, 'smtp_latency': args.smtp_latency,
+               'duration': args.duration, 'mix': dict(MIX), 'modes': {}}
+
+    for offset, mode in enumerate(args.modes):
+        port = args.port + offset
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve', mode, '--port', str(port),
+                                    '--mongo-latency', str(args.mongo_latency),
+                                    '--smtp-latency', str(args.smtp_latency)], env=env)
+        try:
+            wait_for_port(port, process)
+            levels = []
+            sustained = 0
+            for concurrency in args.levels:
+                level = asyncio.run(run_level(port, token, messages, concurrency, args.duration, args.warmup))
+                levels.append(level)
+                ok = (level['p99'] is not None and level['p99'] <= args.p99
+                      and level['errors'] <= MAX_ERROR_RATE * level['requests'])
+                print(f"{mode:>5} c={concurrency:<4} {level['throughput']:8.1f} req/s  p50 {level['p50'] * 1e3:7.1f} ms"
+                      f"  p99 {level['p99'] * 1e3:7.1f} ms  errors {level['errors']:<5} {'ok' if ok else 'over'}",
+                      flush=True)
+                if not ok:
+                    break
+                sustained = concurrency
+            results['modes'][mode] = {'sustained_concurrency': sustained, 'levels': levels}
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    print(f"\nhighest concurrency with p99 <= {args.p99 * 1e3:.0f} ms "
+          f"(mongo {args.mongo_latency * 1e3:.0f} ms/round trip, smtp {args.smtp_latency * 1e3:.0f} ms/message):")
+    for mode, result in results['modes'].items():
+        sustained = [level for level in result['levels'] if level['concurrency'] == result['sustained_concurrency']]
+        throughput = f"{sustained[0]['throughput']:.1f} req/s" if sustained else '-'
+        print(f"  {mode:>5}: {result['sustained_concurrency']:>4} connections ({throughput})")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the sync and async services under concurrent load")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('run', 'serve'):
+        command = subparsers.add_parser(name)
+        command.add_argument('--port', type=int, default=5100)
+        command.add_argument('--mongo-latency', type=float, default=0.005, help="Seconds per Mongo round trip")
+        command.add_argument('--smtp-latency', type=float, default=0.2, help="Seconds per SMTP delivery")
+        if name == 'serve':
+            command.add_argument('mode', choices=['sync', 'async'])
+    run = subparsers.choices['run']
+    run.add_argument('--modes', nargs='+', choices=['sync', 'async'], default=['sync', 'async'])
+    run.add_argument('--p99', type=float, default=0.25, help="p99 latency target in seconds")
+    run.add_argument('--levels', type=lambda value: [int(level) for level in value.split(',')], default=LEVELS,
+                     help="Comma-separated concurrency levels to step through")
+    run.add_argument('--duration', type=float, default=10.0, help="Measured seconds per level")
+    run.add_argument('--warmup', type=float, default=2.0, help="Unmeasured seconds before each level")
+    run.add_argument('--dataset', default='mail_data.csv')
+    run.add_argument('--output', help="Also write the results here as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.mode, args.port, args.mongo_latency, args.smtp_latency)
+        return 0
+    results = compare_modes(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import csv
+import datetime
+import io
+import json
+
+EXPORT_BATCH_SIZE = 1000  # Documents fetched from Mongo per round trip
+CHUNK_DOCUMENTS = 200     # Documents serialized per chunk handed to the WSGI server
+
+LOG_FIELDS = ['_id', 'timestamp', 'user', 'result', 'confidence', 'confidence_level', 'model_version',
+              'cluster_id', 'emailSubject', 'ip_address']
+SECURITY_EVENT_FIELDS = ['_id', 'timestamp', 'event_type', 'severity', 'user_email', 'ip_address', 'details']
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')  # Cell starts a spreadsheet reads as a formula
+
+
+def _json_default(value):
+    # ObjectIds and anything else BSON-specific fall back to their string form
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if value is None:
+        return ''
+    if isinstance(value, (bool, int, float)):
+        return value
+    value = str(value)
+    # Subjects and details come from email senders; a leading quote keeps spreadsheets from running them as formulas
+    if value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_cursor(collection, query):
+    """Oldest-first cursor over query that streams in bounded batches"""
+    return collection.find(query).sort([('timestamp', 1), ('_id', 1)]).batch_size(EXPORT_BATCH_SIZE)
+
+
+def iter_ndjson(cursor):
+    """Yield newline-delimited JSON in chunks of CHUNK_DOCUMENTS documents"""
+    lines = []
+    for document in cursor:
+        lines.append(json.dumps(document, default=_json_default))
+        if len(lines) >= CHUNK_DOCUMENTS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_csv(cursor, fields):
+    """Yield a header row then CSV rows of fields in chunks; unknown fields are ignored"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    rows = 0
+    for document in cursor:
+        writer.writerow([_csv_value(document.get(field)) for field in fields])
+        rows += 1
+        if rows >= CHUNK_DOCUMENTS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    # The header alone still goes out for an empty export
+    if buffer.tell():
+        yield buffer.getvalue()
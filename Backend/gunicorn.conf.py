@@ -0,0 +1,30 @@
+"""gunicorn hooks for the Procfile.
+
+Each worker keeps its own metrics, and /metrics sums the snapshots they
+write to METRICS_DIR. The master gives every server start a clean
+directory before any worker forks, so a scrape covers exactly this
+server's workers: a fresh private one when METRICS_DIR is unset, or the
+configured one emptied of earlier snapshots.
+"""
+import glob
+import os
+import shutil
+import tempfile
+
+
+def on_starting(server):
+    directory = os.environ.get('METRICS_DIR') or os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            os.unlink(path)
+    else:
+        directory = server.metrics_dir_created = tempfile.mkdtemp(prefix='ztrust-metrics-')
+    # Workers inherit the environment, and app.py reads METRICS_DIR at import
+    os.environ['METRICS_DIR'] = directory
+
+
+def on_exit(server):
+    created = getattr(server, 'metrics_dir_created', None)
+    if created:
+        shutil.rmtree(created, ignore_errors=True)
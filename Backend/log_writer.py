@@ -0,0 +1,192 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger('security')
+
+
+class BufferedWriter:
+    """Write-behind buffer that moves Mongo inserts off the request thread.
+
+    Records are queued in memory and a background thread writes them with
+    insert_many whenever batch_size records are waiting or flush_interval
+    seconds have passed. When the queue is full the backpressure policy
+    decides what happens to new records:
+
+    - 'block': wait (up to block_timeout seconds) for the writer to make room
+    - 'drop_oldest': discard the oldest queued record
+    - 'spill': append the record to a local JSON-lines file instead
+
+    on_flush, if given, is called from the writer thread with every batch
+    after it has been inserted (not for spilled or dropped records).
+    """
+
+    POLICIES = ('block', 'drop_oldest', 'spill')
+
+    def __init__(self, collection, name, max_queue=10000, batch_size=500, flush_interval=1.0,
+                 policy='block', spill_path=None, block_timeout=5.0, on_flush=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        if policy == 'spill' and not spill_path:
+            raise ValueError("The 'spill' policy requires a spill_path")
+        self.collection = collection
+        self.name = name
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.spill_path = spill_path
+        self.block_timeout = block_timeout
+        self.on_flush = on_flush
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._closed = False
+        self._flush_requested = False
+        self._thread = None
+        self._pid = None
+        self._spill_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+        self.batches = 0
+        self.write_seconds = 0.0  # Time spent in insert_many, including failed attempts
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # Started lazily so forked gunicorn workers each get their own writer thread
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._queue.clear()
+            self._in_flight = 0
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, record):
+        self.submit_many([record])
+
+    def submit_many(self, records):
+        with self._condition:
+            self._ensure_started()
+            for record in records:
+                if len(self._queue) >= self.max_queue and not self._make_room(record):
+                    continue
+                self._queue.append(record)
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify_all()
+
+    def _make_room(self, record):
+        """Apply the backpressure policy; return True if record may be queued. Holds the lock."""
+        if self.policy == 'drop_oldest':
+            self._queue.popleft()
+            self.dropped += 1
+            return True
+        if self.policy == 'spill':
+            self._spill([record])
+            return False
+        deadline = time.monotonic() + self.block_timeout
+        while len(self._queue) >= self.max_queue:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._closed:
+                self.dropped += 1
+                return False
+            self._condition.notify_all()
+            self._condition.wait(remaining)
+        return True
+
+    def _spill(self, records):
+        try:
+            with self._spill_lock, open(self.spill_path, 'a', encoding='utf-8') as file:
+                for record in records:
+                    file.write(json.dumps(record, default=str) + '\n')
+            self.spilled += len(records)
+        except OSError as e:
+            logger.error(f"Error spilling {self.name} records: {e}")
+            self.dropped += len(records)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_interval
+                while not (self._closed or self._flush_requested) and len(self._queue) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if not self._queue:
+                    self._flush_requested = False
+                    if self._closed:
+                        return
+                    continue
+                count = min(self.batch_size, len(self._queue))
+                batch = [self._queue.popleft() for _ in range(count)]
+                self._in_flight = count
+                self._condition.notify_all()
+            self._write(batch)
+            with self._condition:
+                self._in_flight = 0
+                self._condition.notify_all()
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        try:
+            self.collection.insert_many(batch, ordered=False)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} {self.name} records: {e}")
+            if self.spill_path:
+                self._spill(batch)
+            else:
+                self.failed += len(batch)
+            return
+        finally:
+            self.write_seconds += time.perf_counter() - start
+        if self.on_flush is not None:
+            try:
+                self.on_flush(batch)
+            except Exception as e:
+                # The batch is already stored; only the consumer of the callback falls behind
+                logger.error(f"Error in {self.name} flush callback for {len(batch)} records: {e}")
+
+    def flush(self, timeout=10.0):
+        """Block until everything queued so far has been written; return True on success"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if self._pid != os.getpid():
+                return True
+            while self._queue or self._in_flight:
+                self._flush_requested = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.notify_all()
+                self._condition.wait(min(remaining, 0.05))
+        return True
+
+    def close(self, timeout=10.0):
+        """Flush remaining records and stop the writer thread"""
+        with self._condition:
+            if self._pid != os.getpid() or self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': len(self._queue),
+            'max_queue': self.max_queue,
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'spilled': self.spilled,
+            'failed': self.failed,
+            'write_seconds': self.write_seconds,
+        }
@@ -0,0 +1,146 @@
+"""Load test: /check_spam throughput during a failed-login storm.
+
+bcrypt runs on PasswordHasher's bounded pool, so failed logins should
+neither hold request threads nor queue without bound. This starts the
+service with the compare_serving.py stand-ins (in-memory Mongo, SMTP relay)
+and measures /check_spam twice with the same number of connections:
+
+1. alone;
+2. while further connections send /login/initiate with wrong credentials
+   for unknown addresses. Each of those costs a full bcrypt check against
+   the dummy hash.
+
+It reports /check_spam throughput and latency for both phases, and the
+status codes the storm received: 401 once checked, 503 with Retry-After
+when the pool was full or too slow.
+
+    python login_storm.py --spam-connections 8 --storm-connections 32 --output storm.json
+
+The storm competes with /check_spam for CPU, so give the host at least
+BCRYPT_WORKERS spare cores. Run from Backend/ with the model pickles present
+and the dev requirements installed. Exits non-zero if storm throughput falls
+below --min-ratio of the baseline.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+import numpy as np
+
+from compare_serving import ADMIN_EMAIL, http_request, load_messages, wait_for_port
+
+
+async def run_phase(port, token, messages, spam_connections, storm_connections, duration, warmup):
+    """Closed loop on every connection; returns latency and status statistics per endpoint"""
+    latencies = {'check_spam': [], 'login': []}
+    statuses = {'check_spam': Counter(), 'login': Counter()}
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def connection(kind, seed):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        count = 0
+        while time.perf_counter() < deadline:
+            count += 1
+            if kind == 'check_spam':
+                method, path, body = 'POST', '/check_spam', {'mail': messages[(seed * 7919 + count) % len(messages)]}
+            else:
+                method, path = 'POST', '/login/initiate'
+                body = {'email': f"storm-{seed}-{count}@bench.local", 'password': 'wrong-password'}
+            sent = time.perf_counter()
+            try:
+                status = await http_request(reader, writer, method, path, token, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                status = None
+            if sent < measure_from:
+                continue
+            latencies[kind].append(time.perf_counter() - sent)
+            statuses[kind][status] += 1
+        writer.close()
+
+    await asyncio.gather(*[connection('check_spam', index) for index in range(spam_connections)],
+                         *[connection('login', index) for index in range(storm_connections)])
+    result = {}
+    for kind, samples in latencies.items():
+        samples = np.array(samples)
+        result[kind] = {
+            'requests': len(samples),
+            'throughput': len(samples) / duration,
+            'p50': float(np.percentile(samples, 50)) if len(samples) else None,
+            'p99': float(np.percentile(samples, 99)) if len(samples) else None,
+            'statuses': {str(status): count for status, count in statuses[kind].items()},
+        }
+    return result
+
+
+def describe(name, stats):
+    if not stats['requests']:
+        return f"{name:>20}: no requests"
+    return (f"{name:>20}: {stats['throughput']:8.1f} req/s  p50 {stats['p50'] * 1e3:7.1f} ms  "
+            f"p99 {stats['p99'] * 1e3:7.1f} ms  statuses {stats['statuses']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="/check_spam throughput with and without a failed-login storm")
+    parser.add_argument('--mode', choices=['sync', 'async'], default='sync', help="sync is the Procfile's gunicorn")
+    parser.add_argument('--port', type=int, default=5200)
+    parser.add_argument('--spam-connections', type=int, default=8)
+    parser.add_argument('--storm-connections', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15.0, help="Measured seconds per phase")
+    parser.add_argument('--warmup', type=float, default=3.0, help="Unmeasured seconds before each phase")
+    parser.add_argument('--min-ratio', type=float, default=0.8,
+                        help="Lowest acceptable storm / baseline /check_spam throughput")
+    parser.add_argument('--dataset', default='mail_data.csv')
+    parser.add_argument('--output', help="Also write the results here as JSON")
+    args = parser.parse_args(argv)
+
+    import jwt
+
+    secret = 'login-storm-' + uuid.uuid4().hex
+    now = datetime.datetime.utcnow()
+    token = jwt.encode({'user_id': 'bench', 'email': ADMIN_EMAIL, 'role': 'admin', 'ip': '127.0.0.1', 'iat': now,
+                        'exp': now + datetime.timedelta(hours=8)}, secret, algorithm='HS256')
+    messages = load_messages(args.dataset)
+    env = dict(os.environ, JWT_SECRET=secret, MONGO_URI='mongodb://stand-in',
+               LOG_SPILL_DIR=tempfile.mkdtemp(prefix='login-storm-'), EMAIL_USER='bench@bench.local',
+               EMAIL_PASSWORD='', MODEL_REGISTRY_DIR='')
+    serving = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compare_serving.py')
+    process = subprocess.Popen([sys.executable, serving, 'serve', args.mode, '--port', str(args.port),
+                                '--mongo-latency', '0', '--smtp-latency', '0'], env=env)
+    try:
+        wait_for_port(args.port, process)
+        baseline = asyncio.run(run_phase(args.port, token, messages, args.spam_connections, 0,
+                                         args.duration, args.warmup))
+        storm = asyncio.run(run_phase(args.port, token, messages, args.spam_connections, args.storm_connections,
+                                      args.duration, args.warmup))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    ratio = storm['check_spam']['throughput'] / baseline['check_spam']['throughput']
+    print(f"{args.mode} service, {args.spam_connections} /check_spam connections, {os.cpu_count()} CPUs")
+    print(describe('baseline check_spam', baseline['check_spam']))
+    print(describe('storm check_spam', storm['check_spam']))
+    print(describe(f"storm login x{args.storm_connections}", storm['login']))
+    print(f"/check_spam throughput during the storm: {ratio:.1%} of baseline (minimum {args.min_ratio:.0%})")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'mode': args.mode, 'cpus': os.cpu_count(), 'spam_connections': args.spam_connections,
+                       'storm_connections': args.storm_connections, 'duration': args.duration,
+                       'baseline': baseline, 'storm': storm, 'ratio': ratio}, file, indent=2)
+    return 0 if ratio >= args.min_ratio else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Windowed screening and scoring for messages longer than one screening window.
+
+The adversarial screen is tuned for short inputs and rejects anything over
+SCREEN_MAX_LENGTH. A longer message, up to the configured input limit, is
+split at whitespace into windows of at most that size. Windows are screened
+and scored a chunk at a time until the time budget runs out.
+
+- A high-severity finding in any window rejects the whole message.
+- Windows with other findings are skipped and reported.
+- The verdict is the length-weighted mean of the scored windows' log-odds.
+
+Cost is linear in the number of windows, and the budget caps it.
+"""
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from screening import SCREEN_MAX_LENGTH, AdversarialInputScanner
+
+WINDOW_CHUNK = 8  # Windows screened and scored per scorer call between budget checks
+
+# probabilities is a predict_proba row for the whole message (None if nothing was scored);
+# rejection is the Finding that rejects it, if any
+DocumentAnalysis = namedtuple('DocumentAnalysis', ['probabilities', 'windows', 'windows_total', 'truncated',
+                                                   'rejection'])
+
+window_scanner = AdversarialInputScanner(segment_checks=False)
+
+
+def split_windows(text, size=SCREEN_MAX_LENGTH):
+    """(start, end) spans of at most size characters, cut at the last space where possible"""
+    spans = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + size, length)
+        if end < length:
+            # Only look back half a window, so a text without spaces still advances by size // 2 or more
+            cut = text.rfind(' ', start + size // 2, end)
+            if cut > start:
+                end = cut
+        spans.append((start, end))
+        start = end
+        while start < length and text[start].isspace():
+            start += 1
+    return spans
+
+
+def analyze_document(text, scorer, budget, window_size=SCREEN_MAX_LENGTH, scanner=window_scanner):
+    """Screen and score text window by window within budget seconds.
+
+    The first chunk of windows is always processed; later chunks only start
+    while time is left, and skipping any sets truncated. Each entry of windows
+    is {'index', 'start', 'end'} plus either 'spam_probability' or 'skipped'
+    with the screening reason.
+    """
+    deadline = time.perf_counter() + budget
+    spans = split_windows(text, window_size)
+    windows = []
+    log_odds = []
+    weights = []
+    first_finding = None
+    truncated = False
+
+    for chunk_start in range(0, len(spans), WINDOW_CHUNK):
+        if chunk_start and time.perf_counter() >= deadline:
+            truncated = True
+            break
+        clean = []
+        for index in range(chunk_start, min(chunk_start + WINDOW_CHUNK, len(spans))):
+            start, end = spans[index]
+            window = {'index': index, 'start': start, 'end': end}
+            windows.append(window)
+            finding = scanner.scan(text[start:end])
+            if finding is None:
+                clean.append(window)
+                continue
+            if finding.severity == 'high':
+                return DocumentAnalysis(None, windows, len(spans), truncated, finding)
+            window['skipped'] = finding.reason
+            first_finding = first_finding or finding
+        if not clean:
+            continue
+        probabilities = scorer.predict_proba([text[window['start']:window['end']] for window in clean])
+        # Class 0 is spam; clip so a saturated window cannot produce an infinite log-odds
+        spam = np.clip(probabilities[:, 0], 1e-12, 1 - 1e-12)
+        for window, spam_probability in zip(clean, spam.tolist()):
+            window['spam_probability'] = spam_probability
+        log_odds.extend(np.log(spam / (1 - spam)).tolist())
+        weights.extend(window['end'] - window['start'] for window in clean)
+
+    if not log_odds:
+        return DocumentAnalysis(None, windows, len(spans), truncated, first_finding)
+    spam_probability = 1.0 / (1.0 + np.exp(-np.average(log_odds, weights=weights)))
+    return DocumentAnalysis(np.array([spam_probability, 1.0 - spam_probability]), windows, len(spans), truncated,
+                            None)
@@ -0,0 +1,123 @@
+import email.policy
+import re
+from email.parser import BytesFeedParser
+from html.parser import HTMLParser
+
+MAX_MESSAGE_BYTES = 1024 * 1024   # Raw bytes parsed per message; the rest is skipped
+MAX_LINE_BYTES = 64 * 1024        # Longest physical line read at once
+
+ESCAPED_FROM_RE = re.compile(rb'^>+From ')
+
+
+class _TextExtractor(HTMLParser):
+    """Collects visible text from HTML, skipping script and style contents"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return ' '.join(extractor.parts)
+
+
+def _part_text(part):
+    try:
+        return part.get_content()
+    except Exception:
+        payload = part.get_payload(decode=True) or b''
+        return payload.decode(part.get_content_charset() or 'utf-8', 'replace')
+
+
+def extract_text(message):
+    """Return subject plus the decoded text body of a parsed message.
+
+    text/plain parts are preferred; HTML parts are only used (converted to
+    text) when a message has no plain-text part. Attachments are ignored.
+    """
+    plain, html = [], []
+    for part in message.walk():
+        if part.is_multipart() or part.get_content_disposition() == 'attachment':
+            continue
+        content_type = part.get_content_type()
+        if content_type == 'text/plain':
+            plain.append(_part_text(part))
+        elif content_type == 'text/html':
+            html.append(html_to_text(_part_text(part)))
+    body = '\n'.join(plain) if plain else '\n'.join(html)
+    subject = str(message.get('Subject', '') or '')
+    return f"{subject}\n{body}" if subject else body
+
+
+class _MessageBuilder:
+    """Feeds one message's lines to a BytesFeedParser, capping the bytes kept"""
+
+    def __init__(self, max_bytes):
+        self.parser = BytesFeedParser(policy=email.policy.default)
+        self.remaining = max_bytes
+
+    def feed(self, line):
+        if self.remaining <= 0:
+            return
+        line = line[:self.remaining]
+        self.remaining -= len(line)
+        self.parser.feed(line)
+
+    def close(self):
+        return self.parser.close()
+
+
+def iter_messages(stream, max_message_bytes=MAX_MESSAGE_BYTES):
+    """Yield parsed messages from a binary stream holding an mbox or a single .eml.
+
+    The stream is read line by line and each message is parsed incrementally,
+    so memory is bounded by max_message_bytes regardless of the file size.
+    A stream starting with an mbox 'From ' separator is treated as mbox
+    (escaped '>From ' body lines are unescaped); anything else is one message.
+    """
+    first = stream.readline(MAX_LINE_BYTES)
+    if not first:
+        return
+    is_mbox = first.startswith(b'From ')
+    builder = _MessageBuilder(max_message_bytes)
+    if not is_mbox:
+        builder.feed(first)
+
+    previous_blank = False
+    while True:
+        line = stream.readline(MAX_LINE_BYTES)
+        if not line:
+            break
+        if is_mbox:
+            if previous_blank and line.startswith(b'From '):
+                yield builder.close()
+                builder = _MessageBuilder(max_message_bytes)
+                previous_blank = False
+                continue
+            previous_blank = line in (b'\n', b'\r\n')
+            if ESCAPED_FROM_RE.match(line):
+                line = line[1:]
+        builder.feed(line)
+    yield builder.close()
+
+
+def iter_message_texts(stream, max_message_bytes=MAX_MESSAGE_BYTES):
+    """Yield (index, message_id, subject, text) for every message in the stream"""
+    for index, message in enumerate(iter_messages(stream, max_message_bytes)):
+        yield index, message.get('Message-ID'), str(message.get('Subject', '') or ''), extract_text(message)
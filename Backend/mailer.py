@@ -0,0 +1,226 @@
+import atexit
+import itertools
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+logger = logging.getLogger('security')
+
+
+class MailQueueFull(Exception):
+    pass
+
+
+def build_otp_message(sender, to_address, otp, action, ip_address):
+    """Build the verification email carrying otp; action is 'signup' or 'login'"""
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to_address
+
+    if action == 'signup':
+        msg['Subject'] = 'Your Signup Verification Code'
+        body = f"""
+        <html>
+          <body>
+            <h2>Complete Your Registration</h2>
+            <p>Thank you for signing up! Please use the following verification code to complete your registration:</p>
+            <h3 style="background-color: #f2f2f2; padding: 10px; font-size: 24px; letter-spacing: 5px;">{otp}</h3>
+            <p>This code will expire in 10 minutes.</p>
+            <p>If you didn't request this code, please ignore this email.</p>
+            <p>IP Address: {ip_address}</p>
+          </body>
+        </html>
+        """
+    else:  # login
+        msg['Subject'] = 'Your Login Verification Code'
+        body = f"""
+        <html>
+          <body>
+            <h2>Login Verification</h2>
+            <p>You're trying to log in to your account. Please use the following verification code:</p>
+            <h3 style="background-color: #f2f2f2; padding: 10px; font-size: 24px; letter-spacing: 5px;">{otp}</h3>
+            <p>This code will expire in 10 minutes.</p>
+            <p>IP Address: {ip_address}</p>
+            <p>If you didn't attempt to log in, please secure your account immediately.</p>
+          </body>
+        </html>
+        """
+
+    msg.attach(MIMEText(body, 'html'))
+    return msg
+
+
+class Mailer:
+    """Outbound mail queue served by a small pool of persistent SMTP connections.
+
+    send() only enqueues the message and returns a delivery id, so request
+    threads never wait on the TLS handshake or a slow relay. Each worker thread
+    keeps one authenticated connection open, reconnects when it drops and
+    retries failed deliveries with exponential backoff. Recent delivery
+    statuses ('queued', 'sending', 'retrying', 'sent', 'failed') are kept for
+    status() lookups.
+    """
+
+    def __init__(self, host, port, username=None, password=None, sender=None, use_tls=True,
+                 pool_size=2, max_queue=1000, max_attempts=3, backoff=1.0, max_backoff=30.0,
+                 timeout=10.0, max_tracked=10000, smtp_factory=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.use_tls = use_tls
+        self.pool_size = pool_size
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_tracked = max_tracked
+        self.smtp_factory = smtp_factory
+        self._queue = None
+        self._workers = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._statuses = OrderedDict()
+        self._status_lock = threading.Lock()
+        self._closed = False
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.connections_opened = 0
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # Started lazily so forked gunicorn workers each get their own pool
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._closed = False
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._workers = [
+                threading.Thread(target=self._run, name=f"smtp-worker-{index}", daemon=True)
+                for index in range(self.pool_size)
+            ]
+            for worker in self._workers:
+                worker.start()
+
+    def send(self, to_address, message):
+        """Queue a message (str or email.message.Message) and return its delivery id"""
+        self._ensure_started()
+        if not isinstance(message, str):
+            message = message.as_string()
+        delivery_id = uuid.uuid4().hex
+        self._set_status(delivery_id, 'queued', attempts=0)
+        try:
+            self._queue.put_nowait((delivery_id, to_address, message))
+        except queue.Full:
+            self._set_status(delivery_id, 'failed', error='Mail queue is full')
+            raise MailQueueFull(f"Mail queue is full ({self.max_queue} messages)")
+        return delivery_id
+
+    def status(self, delivery_id):
+        with self._status_lock:
+            entry = self._statuses.get(delivery_id)
+            return dict(entry, id=delivery_id) if entry else None
+
+    def _set_status(self, delivery_id, status, **fields):
+        with self._status_lock:
+            entry = self._statuses.pop(delivery_id, {})
+            entry.update(fields, status=status, updated_at=time.time())
+            self._statuses[delivery_id] = entry
+            while len(self._statuses) > self.max_tracked:
+                self._statuses.popitem(last=False)
+
+    def _connect(self):
+        server = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            self._disconnect(server)
+            raise
+        self.connections_opened += 1
+        return server
+
+    @staticmethod
+    def _disconnect(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        server = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                if server is not None:
+                    self._disconnect(server)
+                self._queue.task_done()
+                return
+            delivery_id, to_address, message = item
+            for attempt in itertools.count(1):
+                self._set_status(delivery_id, 'sending', attempts=attempt)
+                try:
+                    if server is None:
+                        server = self._connect()
+                    server.sendmail(self.sender, [to_address], message)
+                except Exception as e:
+                    # Drop the connection; the next attempt opens a fresh one
+                    if server is not None:
+                        self._disconnect(server)
+                        server = None
+                    if attempt >= self.max_attempts or isinstance(e, smtplib.SMTPRecipientsRefused):
+                        self.failed += 1
+                        self._set_status(delivery_id, 'failed', error=str(e))
+                        logger.error(f"Error sending email: {e}")
+                        break
+                    self.retries += 1
+                    self._set_status(delivery_id, 'retrying', error=str(e))
+                    time.sleep(min(self.backoff * 2 ** (attempt - 1), self.max_backoff))
+                else:
+                    self.sent += 1
+                    self._set_status(delivery_id, 'sent', error=None)
+                    break
+            self._queue.task_done()
+
+    def join(self):
+        """Block until every queued message has been delivered or has failed"""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Deliver what is queued, then shut the connections down"""
+        if self._pid != os.getpid() or self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            try:
+                self._queue.put(None, timeout=self.timeout)
+            except queue.Full:
+                break
+        for worker in self._workers:
+            worker.join(self.timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'connections_opened': self.connections_opened,
+        }
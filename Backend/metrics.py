@@ -0,0 +1,286 @@
+import atexit
+import glob
+import json
+import logging
+import math
+import os
+import threading
+from bisect import bisect_left
+
+logger = logging.getLogger('security')
+
+# Seconds; tuned for stages that take tens of microseconds up to whole slow requests
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self, lock):
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def sample(self):
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, lock, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self._lock = lock
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def sample(self):
+        with self._lock:
+            return [list(self.counts), self.sum]
+
+
+class MetricFamily:
+    """A named metric with one child per combination of label values"""
+
+    def __init__(self, registry, kind, name, help_text, labelnames=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets is not None else None
+        self._registry = registry
+        self._children = {}
+
+    def labels(self, *values):
+        # Keyed on the raw values so the hot path is a single dict lookup; stringified when sampled
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._registry.lock:
+                child = self._children.get(values)
+                if child is None:
+                    if self.kind == 'histogram':
+                        child = _HistogramChild(self._registry.lock, self.buckets)
+                    else:
+                        child = _CounterChild(self._registry.lock)
+                    self._children[values] = child
+        return child
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        return [[[str(value) for value in values], child.sample()] for values, child in list(self._children.items())]
+
+
+class _CallbackFamily:
+    """Counter or gauge whose samples are read from a callback at snapshot time"""
+
+    def __init__(self, kind, name, help_text, labelnames, collect):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = None
+        self._collect = collect
+
+    def samples(self):
+        try:
+            collected = self._collect()
+        except Exception as e:
+            logger.error(f"Error collecting metric {self.name}: {e}")
+            return []
+        return [[[str(value) for value in labels], float(value)] for labels, value in collected.items()]
+
+
+class MetricsRegistry:
+    """Process-local metrics exported in the Prometheus text format.
+
+    Hot-path updates only touch in-process counters: resolve labels() once
+    where possible and time stages with explicit time.perf_counter() pairs,
+    which keeps an update under a microsecond. With a directory set,
+    every process (e.g. each gunicorn worker) periodically writes a snapshot
+    to metrics-<pid>.json there, and render() merges all snapshots so a
+    scrape served by any worker reports totals for the whole server. Counters
+    and histograms from exited workers keep counting; gauges only come from
+    live workers. Empty the directory when the server is (re)started.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self._families = {}
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.write_snapshot)
+
+    def _register(self, family):
+        if family.name in self._families:
+            raise ValueError(f"Metric {family.name} is already registered")
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(MetricFamily(self, 'counter', name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(MetricFamily(self, 'histogram', name, help_text, labelnames, buckets))
+
+    def counter_callback(self, name, help_text, labelnames, collect):
+        """collect() returns {label values tuple: cumulative value}"""
+        return self._register(_CallbackFamily('counter', name, help_text, labelnames, collect))
+
+    def gauge_callback(self, name, help_text, labelnames, collect):
+        """collect() returns {label values tuple: current value}"""
+        return self._register(_CallbackFamily('gauge', name, help_text, labelnames, collect))
+
+    def ensure_started(self):
+        # Started lazily so forked gunicorn workers each publish their own snapshot
+        if self.directory and self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid == os.getpid():
+                    return
+                self._pid = os.getpid()
+                self._stop.clear()
+                threading.Thread(target=self._publish, name='metrics-publisher', daemon=True).start()
+
+    def _publish(self):
+        while not self._stop.wait(self.flush_interval):
+            self.write_snapshot()
+
+    def snapshot(self):
+        return {
+            'pid': os.getpid(),
+            'families': {
+                name: {'kind': family.kind, 'help': family.help, 'labelnames': list(family.labelnames),
+                       'buckets': list(family.buckets) if family.buckets else None, 'samples': family.samples()}
+                for name, family in list(self._families.items())
+            },
+        }
+
+    def write_snapshot(self):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        temporary = f"{path}.tmp"
+        try:
+            with open(temporary, 'w', encoding='utf-8') as file:
+                json.dump(self.snapshot(), file)
+            os.replace(temporary, path)
+        except OSError as e:
+            logger.error(f"Error writing metrics snapshot: {e}")
+
+    def _read_snapshots(self):
+        own = self.snapshot()
+        snapshots = [own]
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path, encoding='utf-8') as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            if snapshot.get('pid') == own['pid']:
+                continue
+            snapshot['alive'] = _pid_alive(snapshot.get('pid'))
+            snapshots.append(snapshot)
+        return snapshots
+
+    def render(self):
+        """Return every metric, merged across processes, in the Prometheus text format"""
+        if self.directory:
+            self.write_snapshot()
+            snapshots = self._read_snapshots()
+        else:
+            snapshots = [self.snapshot()]
+        return render_snapshots(snapshots)
+
+
+def _pid_alive(pid):
+    if not isinstance(pid, int):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def merge_snapshots(snapshots):
+    """Sum samples with the same name and labels; returns {name: (family info, {labels: sample})}"""
+    merged = {}
+    for snapshot in snapshots:
+        alive = snapshot.get('alive', True)
+        for name, family in snapshot['families'].items():
+            if family['kind'] == 'gauge' and not alive:
+                continue
+            info, samples = merged.setdefault(name, (family, {}))
+            for labels, sample in family['samples']:
+                key = tuple(labels)
+                if family['kind'] == 'histogram':
+                    counts, total = sample
+                    previous = samples.get(key)
+                    if previous is not None and len(previous[0]) == len(counts):
+                        counts = [a + b for a, b in zip(previous[0], counts)]
+                        total += previous[1]
+                    samples[key] = [counts, total]
+                else:
+                    samples[key] = samples.get(key, 0.0) + sample
+    return merged
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def render_snapshots(snapshots):
+    lines = []
+    for name, (family, samples) in sorted(merge_snapshots(snapshots).items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        labelnames = family['labelnames']
+        for labels, sample in sorted(samples.items()):
+            if family['kind'] != 'histogram':
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(sample)}")
+                continue
+            counts, total = sample
+            cumulative = 0
+            for bound, count in zip(list(family['buckets']) + [math.inf], counts):
+                cumulative += count
+                bucket_labels = _format_labels(labelnames, labels, ('le', _format_value(bound)))
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labelnames, labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,186 @@
+"""Flat, mmap-able model artifact for the compiled scorer.
+
+File layout (little endian):
+
+    8 bytes   magic b'ZTMODEL1'
+    8 bytes   header length (uint64)
+    N bytes   JSON header: kind, version, scorer params and an array table
+              mapping each array name to its dtype, shape and file offset
+    ...       raw array bytes, each aligned to 64 bytes
+
+Arrays are opened with np.memmap, so every gunicorn worker that loads the
+same file shares its pages through the OS page cache, and nothing is
+unpickled at startup. That includes the vocabulary, which is served
+straight from its blob, offsets and hash-table arrays (see vocabulary.py).
+"""
+import argparse
+import hashlib
+import json
+import struct
+import sys
+
+import numpy as np
+
+from scoring import CompiledLinearScorer, HashingLinearScorer
+from vocabulary import CompactVocabulary
+
+MAGIC = b'ZTMODEL1'
+ALIGNMENT = 64
+FORMAT_VERSION = 1
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_artifact(path, kind, params, arrays):
+    """Write named arrays and scorer params to path; returns the artifact version"""
+    digest = hashlib.sha256(json.dumps({'kind': kind, 'params': params}, sort_keys=True).encode('utf-8'))
+    table = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        digest.update(name.encode('utf-8'))
+        digest.update(array.tobytes())
+        table[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+    version = digest.hexdigest()[:16]
+
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'kind': kind,
+        'version': version,
+        'params': params,
+        'arrays': table,
+    }).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    with open(path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<Q', len(header)))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(data_start + table[name]['offset'])
+            file.write(np.ascontiguousarray(array).tobytes())
+        file.truncate(data_start + offset)
+    return version
+
+
+def read_artifact(path):
+    """Map an artifact file; returns (header, {name: read-only array view})"""
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    if mapped[:len(MAGIC)].tobytes() != MAGIC:
+        raise ValueError(f"{path} is not a model artifact")
+    header_length = struct.unpack('<Q', mapped[len(MAGIC):len(MAGIC) + 8].tobytes())[0]
+    header_start = len(MAGIC) + 8
+    header = json.loads(mapped[header_start:header_start + header_length].tobytes().decode('utf-8'))
+    if header.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model artifact format: {header.get('format_version')}")
+
+    data_start = _align(header_start + header_length)
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        start = data_start + spec['offset']
+        arrays[name] = mapped[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+    return header, arrays
+
+
+def export_artifact(vectorizer, model, path):
+    """Compile a fitted vectorizer and model and write them as a flat artifact"""
+    scorer = CompiledLinearScorer.from_sklearn(vectorizer, model)
+    params = {
+        'intercept': scorer.intercept,
+        'token_pattern': scorer.token_pattern,
+        'lowercase': scorer.lowercase,
+        'binary': scorer.binary,
+        'sublinear_tf': scorer.sublinear_tf,
+        'norm': scorer.norm,
+    }
+    arrays = {
+        'vocab_blob': scorer.vocabulary.blob,
+        'vocab_offsets': scorer.vocabulary.offsets,
+        'vocab_slots': scorer.vocabulary.slots,
+        'idf': scorer.idf,
+        'coef': scorer.coef,
+    }
+    return write_artifact(path, 'tfidf_logreg', params, arrays)
+
+
+def export_hashing_artifact(scorer, path, metadata=None):
+    """Write a HashingLinearScorer as a flat artifact; metadata is stored in the header params"""
+    params = {
+        'intercept': scorer.intercept,
+        'n_features': scorer.n_features,
+        'stop_words': sorted(scorer.stop_words),
+        'token_pattern': scorer.token_pattern,
+        'lowercase': scorer.lowercase,
+        'norm': scorer.norm,
+        'metadata': metadata or {},
+    }
+    return write_artifact(path, 'hashing_logreg', params, {'coef': scorer.coef})
+
+
+def load_scorer(path):
+    """Load a compiled scorer from an artifact; returns (scorer, version)"""
+    header, arrays = read_artifact(path)
+    params = header['params']
+    if header['kind'] == 'hashing_logreg':
+        scorer = HashingLinearScorer(
+            coef=arrays['coef'],
+            intercept=params['intercept'],
+            n_features=params['n_features'],
+            stop_words=params['stop_words'],
+            token_pattern=params['token_pattern'],
+            lowercase=params['lowercase'],
+            norm=params['norm'],
+        )
+        return scorer, header['version']
+    if header['kind'] != 'tfidf_logreg':
+        raise ValueError(f"Unsupported model artifact kind: {header['kind']}")
+    scorer = CompiledLinearScorer(
+        # Artifacts written before vocab_slots existed get their hash table built here
+        vocabulary=CompactVocabulary(arrays['vocab_blob'], arrays['vocab_offsets'], arrays.get('vocab_slots')),
+        idf=arrays['idf'],
+        coef=arrays['coef'],
+        intercept=params['intercept'],
+        token_pattern=params['token_pattern'],
+        lowercase=params['lowercase'],
+        binary=params['binary'],
+        sublinear_tf=params['sublinear_tf'],
+        norm=params['norm'],
+    )
+    return scorer, header['version']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or inspect flat model artifacts")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export = subparsers.add_parser('export', help="Convert the pickled model into a flat artifact")
+    export.add_argument('--vectorizer', default='feature_extraction.pkl')
+    export.add_argument('--model', default='logistic_regression.pkl')
+    export.add_argument('--output', default='model.ztm')
+
+    inspect = subparsers.add_parser('inspect', help="Print an artifact's header")
+    inspect.add_argument('path')
+
+    args = parser.parse_args(argv)
+    if args.command == 'export':
+        import pickle
+        # Pickles are only trusted here, at export time, never by the serving path
+        with open(args.model, 'rb') as file:
+            model = pickle.load(file)
+        with open(args.vectorizer, 'rb') as file:
+            vectorizer = pickle.load(file)
+        version = export_artifact(vectorizer, model, args.output)
+        print(f"Wrote {args.output} (version {version})")
+    else:
+        header, _ = read_artifact(args.path)
+        print(json.dumps(header, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
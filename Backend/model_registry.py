@@ -0,0 +1,118 @@
+import glob
+import logging
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from model_artifact import load_scorer, read_artifact
+
+logger = logging.getLogger('security')
+
+ActiveModel = namedtuple('ActiveModel', ['version', 'scorer', 'source'])
+
+# Messages every candidate model must score sanely before it is activated
+CANARY_MESSAGES = [
+    "Hello there, are we meeting for lunch tomorrow at noon?",
+    "URGENT! You have won a 1 week FREE membership in our prize Jackpot! Txt CLAIM to 81010",
+    "",
+]
+
+
+def validate_scorer(scorer):
+    """Raise ValueError unless scorer returns well-formed probabilities for the canaries"""
+    probabilities = np.asarray(scorer.predict_proba(CANARY_MESSAGES))
+    if probabilities.shape != (len(CANARY_MESSAGES), 2):
+        raise ValueError(f"Unexpected predict_proba shape {probabilities.shape}")
+    if not np.all(np.isfinite(probabilities)) or probabilities.min() < 0 or probabilities.max() > 1:
+        raise ValueError("Model produced invalid probabilities")
+    if not np.allclose(probabilities.sum(axis=1), 1.0):
+        raise ValueError("Model probabilities do not sum to 1")
+
+
+class ModelRegistry:
+    """Holds the active scorer and hot-swaps it when a new artifact version appears.
+
+    A background thread polls directory for model artifacts (*.ztm). The newest
+    file whose version differs from the active one is loaded and validated off
+    the request path, then installed with a single reference assignment.
+    Requests call active() once and use that snapshot throughout, so in-flight
+    requests finish on the model they started with. Publish artifacts by
+    writing to a temporary name and renaming into the directory.
+    """
+
+    def __init__(self, initial, directory=None, poll_interval=30.0, pattern='*.ztm', on_swap=None):
+        self._active = initial
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.pattern = pattern
+        self.on_swap = on_swap
+        self._rejected = {}  # path -> mtime of artifacts that failed to load or validate
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.swaps = 0
+
+    def active(self):
+        if self.directory and self._pid != os.getpid():
+            self._start_watcher()
+        return self._active
+
+    def _start_watcher(self):
+        # Started lazily so forked gunicorn workers each run their own watcher
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            threading.Thread(target=self._watch, name='model-registry', daemon=True).start()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Model registry poll failed: {e}")
+
+    def newest_artifact(self):
+        paths = glob.glob(os.path.join(self.directory, self.pattern))
+        candidates = []
+        for path in paths:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if self._rejected.get(path) != mtime:
+                candidates.append((mtime, path))
+        return max(candidates)[1] if candidates else None
+
+    def poll(self):
+        """Check the directory once; returns True if a new model was activated"""
+        path = self.newest_artifact()
+        if path is None:
+            return False
+        mtime = os.path.getmtime(path)
+        try:
+            header, _ = read_artifact(path)
+            if header['version'] == self._active.version:
+                return False
+            scorer, version = load_scorer(path)
+            validate_scorer(scorer)
+        except Exception as e:
+            logger.error(f"Rejected model artifact {path}: {e}")
+            self._rejected[path] = mtime
+            return False
+        self.activate(ActiveModel(version, scorer, path))
+        return True
+
+    def activate(self, model):
+        previous = self._active
+        self._active = model
+        self.swaps += 1
+        logger.info(f"Activated model version {model.version} (was {previous.version})")
+        if self.on_swap is not None:
+            self.on_swap(model)
+
+    def stop(self):
+        self._stop.set()
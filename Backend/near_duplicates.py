@@ -0,0 +1,266 @@
+"""Near-duplicate index over recently scored messages.
+
+Spam campaigns send the same body with a changed name, URL or tracking ID,
+so the exact-text prediction cache misses every variant. Each scored message
+gets a MinHash signature over word 3-gram shingles. URLs, email addresses
+and digits are masked before shingling. The signatures are banded into LSH
+tables, so a lookup only compares against the few messages sharing a band.
+A lookup whose estimated Jaccard similarity reaches the threshold reuses the
+stored verdict and joins its cluster.
+
+Signatures live in a fixed-size ring, so memory is bounded by max_entries.
+Entries leave the ring when they expire or when newer ones need the room.
+A cluster that keeps matching is re-inserted before it expires.
+
+Run `python near_duplicates.py` for a lookup benchmark on a full index.
+"""
+import heapq
+import re
+import secrets
+import threading
+import time
+import zlib
+
+import numpy as np
+
+NUM_PERM = 60
+BANDS = 10                     # 10 bands of 6 rows: candidates from roughly 0.7 similarity upwards
+SHINGLE_SIZE = 3
+MIN_SHINGLES = 5               # Shorter messages are left to the exact cache
+MAX_CANDIDATES = 64            # Bound on signatures compared per lookup
+_PRIME = (1 << 31) - 1
+
+_URL_RE = re.compile(r'(?:https?://|www\.)\S+', re.IGNORECASE)
+_EMAIL_RE = re.compile(r'\S+@\S+')
+_DIGIT_RE = re.compile(r'\d')
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Word n-grams of text with URLs, email addresses and digits masked"""
+    text = _URL_RE.sub(' urltoken ', text.lower())
+    text = _DIGIT_RE.sub('0', _EMAIL_RE.sub(' emailtoken ', text))
+    tokens = _TOKEN_RE.findall(text)
+    return {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+class _Cluster:
+    __slots__ = ('size', 'hits', 'first_seen', 'last_seen', 'verdict', 'sample')
+
+    def __init__(self, verdict, sample, now):
+        self.size = 0
+        self.hits = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.verdict = verdict
+        self.sample = sample
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class NearDuplicateIndex:
+    """Bounded MinHash LSH index mapping recent messages to verdicts and clusters.
+
+    Verdicts are only valid for the model that produced them, so binding a
+    different model version empties the index like PredictionCache does.
+    """
+
+    def __init__(self, max_entries=200000, ttl=3600, threshold=0.8, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.max_entries = int(max_entries)
+        self.ttl = ttl
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        # Odd 64-bit multipliers fold each band's rows into one integer key
+        self._band_mix = rng.integers(1, 1 << 63, size=num_perm // bands, dtype=np.uint64) * 2 + 1
+        self._lock = threading.Lock()
+        self.model_version = None
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self._reset()
+
+    def _reset(self):
+        self._signatures = np.zeros((self.max_entries, self.num_perm), dtype=np.uint32)
+        self._expires = np.zeros(self.max_entries, dtype=np.float64)
+        self._verdicts = [None] * self.max_entries
+        self._cluster_ids = [None] * self.max_entries
+        self._tables = [{} for _ in range(self.bands)]  # band key -> newest slot with that key
+        self._clusters = {}
+        self._oldest = 0
+        self._count = 0
+
+    def bind_model(self, model_version):
+        # Version and entries change together, so lookup() and add() never see one without the other
+        with self._lock:
+            if model_version != self.model_version:
+                self._reset()
+                self.model_version = model_version
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def signature(self, text):
+        """MinHash signature of text, or None if it is too short to compare reliably"""
+        grams = shingles(text)
+        if len(grams) < MIN_SHINGLES:
+            return None
+        hashes = np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64,
+                             count=len(grams)) % _PRIME
+        # Universal hashing (a * x + b) mod p; every operand is below 2**31, so nothing overflows
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        rows = signature.reshape(self.bands, -1).astype(np.uint64)
+        return (rows * self._band_mix).sum(axis=1).tolist()
+
+    def lookup(self, signature, model_version=None):
+        """Return (verdict, cluster_id) of the most similar live entry above the threshold, or None.
+
+        With model_version, entries indexed under another model never match.
+        """
+        now = time.monotonic()
+        band_keys = self._band_keys(signature)
+        with self._lock:
+            if model_version is not None and model_version != self.model_version:
+                return None
+            self.lookups += 1
+            candidates = {table[key] for table, key in zip(self._tables, band_keys) if key in table}
+            candidates = [slot for slot in candidates if self._expires[slot] > now][:MAX_CANDIDATES]
+            if not candidates:
+                return None
+            similarity = np.count_nonzero(self._signatures[candidates] == signature, axis=1) / self.num_perm
+            best = int(np.argmax(similarity))
+            if similarity[best] < self.threshold:
+                return None
+            slot = candidates[best]
+            self.hits += 1
+            verdict = self._verdicts[slot]
+            cluster_id = self._cluster_ids[slot]
+            cluster = self._clusters[cluster_id]
+            cluster.hits += 1
+            cluster.last_seen = time.time()
+            if self._expires[slot] - now < self.ttl / 2:
+                # Keep an active campaign indexed: re-insert its stored signature, not the variant's.
+                # In a full ring the re-insert may evict this very slot
+                self._insert(self._signatures[slot].copy(), verdict, cluster_id, now)
+            return verdict, cluster_id
+
+    def add(self, signature, verdict, sample='', model_version=None):
+        """Index a freshly scored message as the start of a new cluster; returns the cluster ID.
+
+        With model_version, a verdict from a model that is no longer bound is
+        not indexed and None is returned.
+        """
+        cluster_id = secrets.token_hex(6)
+        now = time.monotonic()
+        with self._lock:
+            if model_version is not None and model_version != self.model_version:
+                return None
+            self._clusters[cluster_id] = _Cluster(verdict, sample, time.time())
+            self._insert(signature, verdict, cluster_id, now)
+        return cluster_id
+
+    def _insert(self, signature, verdict, cluster_id, now):
+        # Counted first, so evicting the cluster's only other entry (a refresh in a full ring) keeps the cluster
+        self._clusters[cluster_id].size += 1
+        # Every entry gets the same TTL, so ring order is expiry order and the oldest slot expires first
+        while self._count and (self._count == self.max_entries or self._expires[self._oldest] <= now):
+            self._evict(self._oldest)
+            self._oldest = (self._oldest + 1) % self.max_entries
+            self._count -= 1
+        slot = (self._oldest + self._count) % self.max_entries
+        self._count += 1
+        self._signatures[slot] = signature
+        self._expires[slot] = now + self.ttl
+        self._verdicts[slot] = verdict
+        self._cluster_ids[slot] = cluster_id
+        for table, key in zip(self._tables, self._band_keys(signature)):
+            table[key] = slot
+
+    def _evict(self, slot):
+        for table, key in zip(self._tables, self._band_keys(self._signatures[slot])):
+            if table.get(key) == slot:
+                del table[key]
+        cluster_id = self._cluster_ids[slot]
+        cluster = self._clusters[cluster_id]
+        cluster.size -= 1
+        if cluster.size == 0:
+            del self._clusters[cluster_id]
+        self._verdicts[slot] = None
+        self._cluster_ids[slot] = None
+        self.evictions += 1
+
+    def largest_clusters(self, limit=20, min_hits=1):
+        """Live clusters that matched at least min_hits near-duplicates, most hits first"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            live = ((cluster_id, cluster) for cluster_id, cluster in self._clusters.items()
+                    if cluster.hits >= min_hits and cluster.last_seen > cutoff)
+            largest = heapq.nlargest(limit, live, key=lambda item: item[1].hits)
+            return [{'cluster_id': cluster_id, **cluster.as_dict()} for cluster_id, cluster in largest]
+
+    def __len__(self):
+        return self._count
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': self._count,
+                'max_entries': self.max_entries,
+                'clusters': len(self._clusters),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'evictions': self.evictions,
+            }
+
+
+if __name__ == '__main__':
+    # Benchmark: fill the index with unrelated messages, then time lookups of fresh variants
+    import argparse
+    import csv
+    import resource
+
+    parser = argparse.ArgumentParser(description="Near-duplicate index benchmark")
+    parser.add_argument('--entries', type=int, default=300000)
+    parser.add_argument('--dataset', default='mail_data.csv')
+    args = parser.parse_args()
+
+    with open(args.dataset, newline='', encoding='utf-8') as file:
+        messages = [row['Message'] for row in csv.DictReader(file) if len(shingles(row['Message'])) >= MIN_SHINGLES]
+    rng = np.random.default_rng(0)
+    words = np.array(sorted({word for message in messages for word in message.split()}), dtype=object)
+
+    def variant(message):
+        # A campaign variant: a new name and tracking URL added to the same body
+        return f"Dear {rng.choice(words)}, {message} see https://t.example/{rng.integers(1 << 30)}"
+
+    index = NearDuplicateIndex(max_entries=args.entries, ttl=3600)
+    start = time.perf_counter()
+    for i in range(args.entries):
+        # Synthetic distinct messages: random word salads around 25 words long
+        index.add(index.signature(' '.join(rng.choice(words, 25))), ('HAM', 0.9, 'high'))
+    print(f"filled {len(index)} entries in {time.perf_counter() - start:.1f}s, "
+          f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    # Campaign bodies of email length; very short texts differ too much once a name and URL are added
+    campaign = [message for message in messages if len(shingles(message)) >= 25][:500]
+    for message in campaign:
+        index.add(index.signature(message), ('SPAM', 0.99, 'high'))
+    probes = [variant(message) for message in campaign]
+    start = time.perf_counter()
+    matched = sum(index.lookup(index.signature(probe)) is not None for probe in probes)
+    per_lookup = (time.perf_counter() - start) / len(probes)
+    unrelated = [' '.join(rng.choice(words, 25)) for _ in range(500)]
+    start = time.perf_counter()
+    false_matches = sum(index.lookup(index.signature(probe)) is not None for probe in unrelated)
+    miss_lookup = (time.perf_counter() - start) / len(unrelated)
+    print(f"variants matched: {matched}/{len(probes)}  unrelated matched: {false_matches}/{len(unrelated)}")
+    print(f"signature + lookup: {per_lookup * 1e6:.0f} us (hit path), {miss_lookup * 1e6:.0f} us (miss path)")
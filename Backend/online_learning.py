@@ -0,0 +1,274 @@
+"""Incremental spam model trained from analyst feedback.
+
+Admins POST corrected labels to /feedback. This worker folds pending
+feedback into a HashingVectorizer + SGDClassifier(log_loss) with partial_fit
+in mini-batches, checks the candidate against the notebook's holdout split,
+and publishes accepted models as versioned artifacts into the model registry
+directory, where serving workers validate and hot-swap them:
+
+    python online_learning.py bootstrap                    # initial fit on mail_data.csv
+    python online_learning.py apply --registry-dir models  # fold in pending feedback [--watch 60]
+    python online_learning.py compare                      # accuracy/latency vs the batch model
+
+The hashed feature space is fixed at N_FEATURES, so memory stays constant no
+matter how much feedback arrives; nothing is ever refit from scratch.
+"""
+import argparse
+import copy
+import csv
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.model_selection import train_test_split
+
+from model_artifact import export_hashing_artifact
+from model_registry import validate_scorer
+from scoring import HashingLinearScorer
+
+N_FEATURES = 2 ** 18
+MINI_BATCH_SIZE = 64
+BOOTSTRAP_EPOCHS = 10
+LABELS = {'spam': 0, 'ham': 1}  # Same encoding as the notebook: class 0 is spam
+CLASSES = np.array([0, 1])
+STATE_PATH = 'online_state.pkl'
+
+
+def make_vectorizer():
+    return HashingVectorizer(n_features=N_FEATURES, stop_words='english', binary=True, alternate_sign=False,
+                             norm='l2')
+
+
+def make_classifier():
+    return SGDClassifier(loss='log_loss', alpha=1e-5, random_state=42)
+
+
+def load_dataset(path='mail_data.csv'):
+    messages, labels = [], []
+    with open(path, newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            if row['Category'] in LABELS:
+                messages.append(row['Message'] or '')
+                labels.append(LABELS[row['Category']])
+    return messages, np.array(labels)
+
+
+def holdout_split(messages, labels):
+    """The notebook's split: (train messages, test messages, train labels, test labels)"""
+    return train_test_split(messages, labels, test_size=0.2, random_state=42)
+
+
+def accuracy(scorer, messages, labels):
+    predictions = (scorer.predict_proba(messages)[:, 1] > 0.5).astype(int)
+    return float(np.mean(predictions == labels))
+
+
+class OnlineLearner:
+    """The SGD model plus bookkeeping, persisted between runs in a pickle only this worker reads"""
+
+    def __init__(self, state_path=STATE_PATH):
+        self.state_path = state_path
+        self.vectorizer = make_vectorizer()  # Stateless; nothing to persist
+        self.model = None
+        self.updates = 0
+        self.holdout_accuracy = None
+        self.published_version = None
+        if state_path and os.path.exists(state_path):
+            with open(state_path, 'rb') as file:
+                state = pickle.load(file)
+            self.model = state['model']
+            self.updates = state['updates']
+            self.holdout_accuracy = state['holdout_accuracy']
+            self.published_version = state['published_version']
+
+    def partial_fit(self, model, messages, labels):
+        """Apply labelled messages to model in mini-batches; returns seconds per mini-batch"""
+        timings = []
+        for start in range(0, len(messages), MINI_BATCH_SIZE):
+            began = time.perf_counter()
+            features = self.vectorizer.transform(messages[start:start + MINI_BATCH_SIZE])
+            model.partial_fit(features, labels[start:start + MINI_BATCH_SIZE], classes=CLASSES)
+            timings.append(time.perf_counter() - began)
+        return timings
+
+    def bootstrap(self, messages, labels, epochs=BOOTSTRAP_EPOCHS):
+        """Fit a fresh model by streaming the training data through partial_fit"""
+        model = make_classifier()
+        rng = np.random.default_rng(42)
+        messages = np.asarray(messages, dtype=object)
+        for _ in range(epochs):
+            order = rng.permutation(len(messages))
+            self.partial_fit(model, list(messages[order]), labels[order])
+        self.model = model
+        self.updates = 0
+        return model
+
+    def candidate(self, messages, labels):
+        """Return (updated copy of the model, seconds per mini-batch); the live model is untouched"""
+        model = copy.deepcopy(self.model)
+        return model, self.partial_fit(model, messages, labels)
+
+    def scorer(self, model=None):
+        return HashingLinearScorer.from_sklearn(self.vectorizer, model if model is not None else self.model)
+
+    def save(self):
+        temporary = f"{self.state_path}.tmp"
+        with open(temporary, 'wb') as file:
+            pickle.dump({'model': self.model, 'updates': self.updates, 'holdout_accuracy': self.holdout_accuracy,
+                         'published_version': self.published_version}, file)
+        os.replace(temporary, self.state_path)
+
+    def publish(self, directory):
+        """Write the current model into the registry directory atomically; returns its version"""
+        scorer = self.scorer()
+        validate_scorer(scorer)
+        os.makedirs(directory, exist_ok=True)
+        # The registry only watches *.ztm, so the half-written file is never picked up
+        temporary = os.path.join(directory, f".online-{os.getpid()}.tmp")
+        version = export_hashing_artifact(scorer, temporary, metadata={
+            'updates': self.updates, 'holdout_accuracy': self.holdout_accuracy})
+        os.replace(temporary, os.path.join(directory, f"online-{version}.ztm"))
+        self.published_version = version
+        return version
+
+
+def apply_feedback(learner, feedback_collection, registry_dir, holdout, max_accuracy_drop, limit):
+    """Fold one batch of pending feedback into the model; returns a summary or None if nothing was pending"""
+    pending = list(feedback_collection.find({'status': 'pending'}).sort('timestamp', 1).limit(limit))
+    if not pending:
+        return None
+    messages = [item['text'] for item in pending]
+    labels = np.array([LABELS[item['label']] for item in pending])
+    model, timings = learner.candidate(messages, labels)
+    candidate_accuracy = accuracy(learner.scorer(model), *holdout)
+
+    ids = [item['_id'] for item in pending]
+    # Gate on the holdout so a bad or poisoned batch cannot degrade the serving model
+    if learner.holdout_accuracy is not None and candidate_accuracy < learner.holdout_accuracy - max_accuracy_drop:
+        feedback_collection.update_many({'_id': {'$in': ids}}, {'$set': {
+            'status': 'rejected', 'holdout_accuracy': candidate_accuracy}})
+        return {'applied': 0, 'rejected': len(ids), 'holdout_accuracy': candidate_accuracy}
+
+    learner.model = model
+    learner.updates += len(ids)
+    learner.holdout_accuracy = candidate_accuracy
+    version = learner.publish(registry_dir)
+    learner.save()
+    feedback_collection.update_many({'_id': {'$in': ids}}, {'$set': {'status': 'applied', 'applied_version': version}})
+    return {'applied': len(ids), 'rejected': 0, 'holdout_accuracy': candidate_accuracy, 'version': version,
+            'update_seconds': sum(timings)}
+
+
+def compare(dataset_path):
+    """Print accuracy and latency of the batch TF-IDF model next to the online hashing model"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    from scoring import CompiledLinearScorer
+
+    messages, labels = load_dataset(dataset_path)
+    train_x, test_x, train_y, test_y = holdout_split(messages, labels)
+
+    started = time.perf_counter()
+    vectorizer = TfidfVectorizer(min_df=1, stop_words='english', binary=True)
+    batch_model = LogisticRegression().fit(vectorizer.fit_transform(train_x), train_y)
+    batch_fit = time.perf_counter() - started
+    batch_scorer = CompiledLinearScorer.from_sklearn(vectorizer, batch_model)
+
+    learner = OnlineLearner(state_path=None)
+    started = time.perf_counter()
+    learner.bootstrap(train_x, train_y)
+    online_fit = time.perf_counter() - started
+    online_scorer = learner.scorer()
+
+    # Update latency: stream the training split through the bootstrapped model as if it were feedback
+    _, timings = learner.candidate(train_x, train_y)
+    timings = np.array(timings)
+
+    def scoring_latency(scorer):
+        started = time.perf_counter()
+        for message in test_x:
+            scorer.predict_proba([message])
+        return (time.perf_counter() - started) / len(test_x)
+
+    reference = learner.model.predict_proba(learner.vectorizer.transform(test_x))
+    parity = float(np.abs(reference - online_scorer.predict_proba(test_x)).max())
+
+    print(f"holdout: {len(test_x)} messages (notebook split)")
+    print(f"{'':>26} {'batch tfidf+logreg':>20} {'online hashing+sgd':>20}")
+    print(f"{'holdout accuracy':>26} {accuracy(batch_scorer, test_x, test_y):>20.4f} "
+          f"{accuracy(online_scorer, test_x, test_y):>20.4f}")
+    print(f"{'full (re)fit seconds':>26} {batch_fit:>20.3f} {online_fit:>20.3f}")
+    print(f"{'update latency':>26} {'full refit':>20} "
+          f"{f'{timings.mean() * 1e3:.2f} ms/{MINI_BATCH_SIZE} msgs':>20}")
+    print(f"{'update p95':>26} {'':>20} {f'{np.percentile(timings, 95) * 1e3:.2f} ms':>20}")
+    print(f"{'scoring us/message':>26} {scoring_latency(batch_scorer) * 1e6:>20.1f} "
+          f"{scoring_latency(online_scorer) * 1e6:>20.1f}")
+    batch_bytes = batch_scorer.coef.nbytes + batch_scorer.idf.nbytes + batch_scorer.vocabulary.nbytes()
+    print(f"{'model memory (arrays)':>26} {f'{batch_bytes} B':>20} "
+          f"{f'{online_scorer.coef.nbytes} B':>20}")
+    print(f"hashing scorer vs sklearn max |predict_proba difference|: {parity:.3e}")
+    return parity
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Online learning from analyst feedback")
+    parser.add_argument('--state', default=STATE_PATH, help="Learner state file")
+    parser.add_argument('--dataset', default='mail_data.csv')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bootstrap = subparsers.add_parser('bootstrap', help="Fit the initial online model on the training split")
+    bootstrap.add_argument('--registry-dir', help="Also publish the bootstrapped model here")
+
+    apply = subparsers.add_parser('apply', help="Fold pending feedback into the model and publish it")
+    apply.add_argument('--registry-dir', default=os.getenv('MODEL_REGISTRY_DIR'),
+                       required=not os.getenv('MODEL_REGISTRY_DIR'), help="Directory the serving registry watches")
+    apply.add_argument('--batch-limit', type=int, default=1000, help="Most feedback items per published update")
+    apply.add_argument('--max-accuracy-drop', type=float, default=0.01,
+                       help="Reject updates that lower holdout accuracy by more than this")
+    apply.add_argument('--watch', type=float, help="Keep polling for feedback every N seconds")
+
+    subparsers.add_parser('compare', help="Compare accuracy and latency against the batch model")
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        return 0 if compare(args.dataset) <= 1e-9 else 1
+
+    messages, labels = load_dataset(args.dataset)
+    train_x, test_x, train_y, test_y = holdout_split(messages, labels)
+    learner = OnlineLearner(args.state)
+
+    if args.command == 'bootstrap':
+        learner.bootstrap(train_x, train_y)
+        learner.holdout_accuracy = accuracy(learner.scorer(), test_x, test_y)
+        if args.registry_dir:
+            print(f"Published online-{learner.publish(args.registry_dir)}.ztm")
+        learner.save()
+        print(f"Bootstrapped online model: holdout accuracy {learner.holdout_accuracy:.4f}")
+        return 0
+
+    if learner.model is None:
+        raise SystemExit(f"No learner state at {args.state}; run 'bootstrap' first")
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    feedback_collection = MongoClient(os.getenv('MONGO_URI')).spam_classifier_db.feedback
+    while True:
+        summary = apply_feedback(learner, feedback_collection, args.registry_dir, (test_x, test_y),
+                                 args.max_accuracy_drop, args.batch_limit)
+        if summary is not None:
+            print(summary, flush=True)
+            continue  # More may be pending beyond batch_limit
+        if not args.watch:
+            return 0
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
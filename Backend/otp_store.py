@@ -0,0 +1,229 @@
+"""Storage for one-time verification codes.
+
+Each (email, action) pair has at most one live code. Both operations are atomic:
+
+- issue() replaces the previous code in a single upsert.
+- verify() checks the code and counts a failed attempt in a single
+  find_one_and_update. Concurrent guesses therefore cannot both read the
+  same attempt count, and exactly one caller sees the code become exhausted.
+
+MongoOTPStore is the default. MemoryOTPStore keeps codes in the process, for
+single-process deployments and tests: a code issued by one gunicorn worker
+cannot be verified by another. The Async* variants expose the same methods
+as coroutines for async_app.py.
+"""
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+BACKENDS = ('mongo', 'memory')
+OTP_TTL = datetime.timedelta(minutes=10)
+MAX_ATTEMPTS = 5
+KEY = [('email', 1), ('action', 1)]
+# Server error codes for an existing index on KEY with different options
+INDEX_CONFLICT_CODES = (85, 86)  # IndexOptionsConflict, IndexKeySpecsConflict
+INDEX_NOT_FOUND = 27
+
+# verify() results
+VERIFIED = 'verified'
+INVALID = 'invalid'        # Wrong code; attempts remain
+EXHAUSTED = 'exhausted'    # Wrong code that used the last attempt; the code is now dead
+MISSING = 'missing'        # No live code: never issued, expired, already used or exhausted
+
+
+class MongoOTPStore:
+    def __init__(self, collection, max_attempts=MAX_ATTEMPTS, ttl=OTP_TTL):
+        self.collection = collection
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+
+    def ensure_indexes(self):
+        try:
+            self.collection.create_index(KEY, unique=True)
+        except OperationFailure as e:
+            if e.code not in INDEX_CONFLICT_CODES:
+                raise
+            self._rebuild_key_index()
+        self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    def _rebuild_key_index(self):
+        """Replace the non-unique index on KEY that older deployments have with the unique one.
+
+        Every worker runs this at startup, so several may rebuild at once: a
+        drop that finds the index already gone is fine, and so is a create that
+        finds another worker's unique index. Duplicate codes make the rebuild
+        fail: the old index is restored and the error left to the operator.
+        """
+        for attempt in range(2):
+            try:
+                self.collection.drop_index(KEY)
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND:
+                    raise
+            try:
+                self.collection.create_index(KEY, unique=True)
+                return
+            except DuplicateKeyError:
+                self.collection.create_index(KEY)
+                raise
+            except OperationFailure as e:
+                # Another worker restored the old index in between; drop it again once
+                if e.code not in INDEX_CONFLICT_CODES or attempt:
+                    raise
+
+    def _issue_update(self, otp, ip_address):
+        now = datetime.datetime.utcnow()
+        return {'$set': {
+            'otp': otp,
+            'created_at': now,
+            'expires_at': now + self.ttl,
+            'verified': False,
+            'attempts': 0,
+            'ip_address': ip_address
+        }}
+
+    def _verify_query(self, email, action, otp):
+        """(filter, pipeline update) that checks otp and counts a failed attempt in one write"""
+        live = {
+            'email': email,
+            'action': action,
+            'verified': False,
+            'expires_at': {'$gt': datetime.datetime.utcnow()},
+            'attempts': {'$lt': self.max_attempts}
+        }
+        # $literal keeps a submitted code such as '$otp' from being read as a field path
+        matches = {'$eq': ['$otp', {'$literal': otp}]}
+        update = [{'$set': {'verified': matches, 'attempts': {'$add': ['$attempts', {'$cond': [matches, 0, 1]}]}}}]
+        return live, update
+
+    def _status(self, document):
+        if document is None:
+            return MISSING
+        if document['verified']:
+            return VERIFIED
+        return EXHAUSTED if document['attempts'] >= self.max_attempts else INVALID
+
+    def issue(self, email, action, otp, ip_address=None):
+        """Store otp as the only live code for (email, action)"""
+        update = self._issue_update(otp, ip_address)
+        try:
+            self.collection.update_one({'email': email, 'action': action}, update, upsert=True)
+        except DuplicateKeyError:
+            # Lost an upsert race with a concurrent issue(); the document exists now, so this updates it
+            self.collection.update_one({'email': email, 'action': action}, update, upsert=True)
+
+    def verify(self, email, action, otp):
+        """Check otp against the live code; returns VERIFIED, INVALID, EXHAUSTED or MISSING"""
+        live, update = self._verify_query(email, action, otp)
+        return self._status(self.collection.find_one_and_update(
+            live, update, projection={'verified': True, 'attempts': True}, return_document=ReturnDocument.AFTER))
+
+
+class AsyncMongoOTPStore(MongoOTPStore):
+    """MongoOTPStore over a motor collection"""
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index(KEY, unique=True)
+        except OperationFailure as e:
+            if e.code not in INDEX_CONFLICT_CODES:
+                raise
+            await self._rebuild_key_index()
+        await self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    async def _rebuild_key_index(self):
+        for attempt in range(2):
+            try:
+                await self.collection.drop_index(KEY)
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND:
+                    raise
+            try:
+                await self.collection.create_index(KEY, unique=True)
+                return
+            except DuplicateKeyError:
+                await self.collection.create_index(KEY)
+                raise
+            except OperationFailure as e:
+                if e.code not in INDEX_CONFLICT_CODES or attempt:
+                    raise
+
+    async def issue(self, email, action, otp, ip_address=None):
+        update = self._issue_update(otp, ip_address)
+        try:
+            await self.collection.update_one({'email': email, 'action': action}, update, upsert=True)
+        except DuplicateKeyError:
+            await self.collection.update_one({'email': email, 'action': action}, update, upsert=True)
+
+    async def verify(self, email, action, otp):
+        live, update = self._verify_query(email, action, otp)
+        return self._status(await self.collection.find_one_and_update(
+            live, update, projection={'verified': True, 'attempts': True}, return_document=ReturnDocument.AFTER))
+
+
+class MemoryOTPStore:
+    """Process-local store with the same semantics as MongoOTPStore.
+
+    Entries are kept in issue order, so with a single TTL the oldest entry
+    always expires first. Expired entries are purged on issue. Once
+    max_entries is reached, the oldest live codes are dropped as well.
+    """
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, ttl=OTP_TTL, max_entries=100000):
+        self.max_attempts = max_attempts
+        self.ttl = ttl.total_seconds()
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (email, action) -> [otp, expires, attempts]
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        pass
+
+    def issue(self, email, action, otp, ip_address=None):
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop((email, action), None)
+            while self._entries and (len(self._entries) >= self.max_entries
+                                     or next(iter(self._entries.values()))[1] <= now):
+                self._entries.popitem(last=False)
+            self._entries[(email, action)] = [otp, now + self.ttl, 0]
+
+    def verify(self, email, action, otp):
+        with self._lock:
+            entry = self._entries.get((email, action))
+            if entry is None or entry[1] <= time.monotonic() or entry[2] >= self.max_attempts:
+                return MISSING
+            if entry[0] == otp:
+                del self._entries[(email, action)]
+                return VERIFIED
+            entry[2] += 1
+            return EXHAUSTED if entry[2] >= self.max_attempts else INVALID
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AsyncMemoryOTPStore(MemoryOTPStore):
+    """MemoryOTPStore with awaitable methods; nothing blocks, so they run inline on the loop"""
+
+    async def ensure_indexes(self):
+        pass
+
+    async def issue(self, email, action, otp, ip_address=None):
+        super().issue(email, action, otp, ip_address)
+
+    async def verify(self, email, action, otp):
+        return super().verify(email, action, otp)
+
+
+def open_store(backend, collection, asynchronous=False):
+    """Store for backend ('mongo' or 'memory'); collection is ignored by the memory backend"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown OTP store backend: {backend}")
+    if backend == 'memory':
+        return AsyncMemoryOTPStore() if asynchronous else MemoryOTPStore()
+    return AsyncMongoOTPStore(collection) if asynchronous else MongoOTPStore(collection)
@@ -0,0 +1,131 @@
+import base64
+import datetime
+import json
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+MAX_PAGE_SIZE = 1000
+COUNT_LIMIT = 10000  # Filtered 'estimated' totals stop counting here
+SORT = [('timestamp', -1), ('_id', -1)]
+
+
+def encode_cursor(document):
+    """Opaque cursor pointing just past document in (timestamp, _id) descending order"""
+    payload = json.dumps({'t': document['timestamp'].isoformat(), 'id': str(document['_id'])})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, _id) from encode_cursor output; raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.datetime.fromisoformat(payload['t']), ObjectId(payload['id'])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 query parameter into the naive UTC datetimes stored in Mongo"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError as e:
+        raise ValueError(f"Invalid timestamp: {value}") from e
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def time_range_filter(since, until):
+    """{'timestamp': {...}} for an optional [since, until) range given as ISO 8601 strings"""
+    bounds = {}
+    since, until = parse_timestamp(since), parse_timestamp(until)
+    if since:
+        bounds['$gte'] = since
+    if until:
+        bounds['$lt'] = until
+    return {'timestamp': bounds} if bounds else {}
+
+
+def parse_page_args(args):
+    """Read page, per_page, cursor and count from request args; raises ValueError on bad input"""
+    try:
+        page = int(args.get('page', 1))
+        per_page = int(args.get('per_page', 10))
+    except ValueError as e:
+        raise ValueError("page and per_page must be integers") from e
+    if page < 1 or per_page < 1:
+        raise ValueError("page and per_page must be positive")
+    count = args.get('count', 'estimated')
+    if count not in ('exact', 'estimated', 'none'):
+        raise ValueError("count must be 'exact', 'estimated' or 'none'")
+    return page, min(per_page, MAX_PAGE_SIZE), args.get('cursor'), count
+
+
+def count_total(collection, query, mode):
+    """Return (total, accuracy) where accuracy is 'exact', 'estimated' or 'lower_bound'"""
+    if mode == 'none':
+        return None, None
+    if mode == 'exact':
+        return collection.count_documents(query), 'exact'
+    if not query:
+        # Read from collection metadata; no documents are scanned
+        return collection.estimated_document_count(), 'estimated'
+    total = collection.count_documents(query, limit=COUNT_LIMIT)
+    return total, 'exact' if total < COUNT_LIMIT else 'lower_bound'
+
+
+def keyset_query(query, cursor):
+    """Restrict query to documents after cursor in (timestamp, _id) descending order"""
+    if not cursor:
+        return query
+    timestamp, last_id = decode_cursor(cursor)
+    after = {'$or': [{'timestamp': {'$lt': timestamp}},
+                     {'timestamp': timestamp, '_id': {'$lt': last_id}}]}
+    return {'$and': [query, after]} if query else after
+
+
+def finish_page(documents, per_page):
+    """Trim the per_page + 1 fetched documents to a page and return (documents, next_cursor)"""
+    # One extra document tells us whether another page exists without counting
+    has_more = len(documents) > per_page
+    documents = documents[:per_page]
+    next_cursor = encode_cursor(documents[-1]) if has_more and documents else None
+    return documents, next_cursor
+
+
+def fetch_page(collection, query, page, per_page, cursor=None):
+    """Return (documents, next_cursor) for one page in (timestamp, _id) descending order.
+
+    With a cursor the page starts right after the cursor's document and is
+    served by an index range scan, so every page costs the same. Without one
+    the legacy page number is applied with skip(). next_cursor is None on the
+    last page.
+    """
+    find = collection.find(keyset_query(query, cursor)).sort(SORT)
+    if not cursor:
+        find = find.skip((page - 1) * per_page)
+    return finish_page(list(find.limit(per_page + 1)), per_page)
+
+
+def log_filters(args):
+    """Optional filters: user, result and a [since, until) time range"""
+    query = time_range_filter(args.get('since'), args.get('until'))
+    for field in ('user', 'result'):
+        if args.get(field):
+            query[field] = args[field]
+    return query
+
+
+def security_event_filters(args):
+    """Optional filters: severity, event_type, user and a [since, until) time range"""
+    query = time_range_filter(args.get('since'), args.get('until'))
+    for field in ('severity', 'event_type'):
+        if args.get(field):
+            query[field] = args[field]
+    if args.get('user'):
+        query['user_email'] = args['user']
+    return query
@@ -0,0 +1,109 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import bcrypt
+
+# Defaults for both services. Queued + running operations are capped below the gthread thread count (Procfile: 8),
+# since in app.py each one holds a request thread until bcrypt finishes
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 4
+DEFAULT_TIMEOUT = 10.0  # Seconds
+
+
+class PasswordPoolBusy(Exception):
+    """The pool is saturated, or an operation did not finish within the timeout"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small bounded pool instead of the request thread.
+
+    bcrypt releases the GIL while hashing, so pool threads hash in parallel
+    with request handling. At most max_pending operations may be queued or
+    running; beyond that PasswordPoolBusy is raised immediately, so a storm of
+    login attempts cannot tie up every request thread behind bcrypt. An
+    operation still unfinished after timeout seconds raises it as well.
+    """
+
+    def __init__(self, rounds=12, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING, timeout=DEFAULT_TIMEOUT):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._dummy_hash = None
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _ensure_started(self):
+        # Created lazily so forked gunicorn workers each get their own pool
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _submit(self, function, *args):
+        self._ensure_started()
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PasswordPoolBusy("Too many password operations in progress")
+        try:
+            future = self._executor.submit(function, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, function, *args):
+        future = self._submit(function, *args)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # Cancelling drops it if it is still queued, so it frees its slot without running
+            future.cancel()
+            self.timed_out += 1
+            raise PasswordPoolBusy("Password operation timed out")
+
+    def _hash(self, password):
+        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds))
+        return hashed_password.decode('utf-8')  # Store as a string
+
+    def _check(self, password, hashed_password):
+        if hashed_password is None:
+            bcrypt.checkpw(password.encode('utf-8'), self._get_dummy_hash())
+            return False
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+        except Exception:
+            return False
+
+    def hash(self, password):
+        return self._run(self._hash, password)
+
+    def check(self, password, hashed_password):
+        """Verify password; a missing hash is checked against a dummy so timing matches a real user"""
+        return self._run(self._check, password, hashed_password)
+
+    def submit_hash(self, password):
+        """Like hash() but returns a concurrent.futures.Future instead of waiting (for async callers)"""
+        return self._submit(self._hash, password)
+
+    def submit_check(self, password, hashed_password):
+        """Like check() but returns a concurrent.futures.Future instead of waiting (for async callers)"""
+        return self._submit(self._check, password, hashed_password)
+
+    def _get_dummy_hash(self):
+        if self._dummy_hash is None:
+            self._dummy_hash = bcrypt.hashpw(os.urandom(16), bcrypt.gensalt(rounds=self.rounds))
+        return self._dummy_hash
+
+    def stats(self):
+        in_use = self.max_pending - self._slots._value if self._slots is not None else 0
+        return {'pending': in_use, 'max_pending': self.max_pending, 'rejected': self.rejected,
+                'timed_out': self.timed_out}
@@ -0,0 +1,199 @@
+"""Time-bucketed counters for the admin dashboard, maintained as logs are written.
+
+Each flushed batch of prediction logs or security events is folded into a
+handful of $inc upserts: one per (kind, granularity, bucket) touched, plus
+one per user. Reading a time range only touches its buckets, so /stats costs
+the same however large the raw collections grow.
+
+Existing logs can be folded in once with:
+
+    python rollups.py backfill [--reset]
+"""
+import datetime
+from collections import defaultdict
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+GRANULARITIES = {
+    'minute': datetime.timedelta(minutes=1),
+    'hour': datetime.timedelta(hours=1),
+    'day': datetime.timedelta(days=1),
+}
+# Fine-grained buckets expire through a TTL index; day buckets are kept
+RETENTION = {
+    'minute': datetime.timedelta(days=7),
+    'hour': datetime.timedelta(days=90),
+    'day': None,
+}
+MAX_BUCKETS = 1500  # Largest series /stats returns in one response
+
+
+def bucket_start(timestamp, granularity):
+    if granularity == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _field(value):
+    # Values become document keys, which may not contain '.' or start with '$'
+    return str(value or 'unknown').replace('.', '_').replace('$', '_')
+
+
+def confidence_bin(confidence):
+    """Lower edge of the 0.05-wide confidence bin, as a key like '0_85'"""
+    edge = min(int(float(confidence) * 20), 19) / 20
+    return f"{edge:.2f}".replace('.', '_')
+
+
+def prediction_counters(record):
+    label = 'spam' if record.get('result') == 'SPAM' else 'ham'
+    return {
+        'total': 1,
+        f'result.{label}': 1,
+        f"confidence_level.{_field(record.get('confidence_level'))}": 1,
+        f"confidence.{confidence_bin(record.get('confidence', 0.0))}": 1,
+    }
+
+
+def security_event_counters(record):
+    return {
+        'total': 1,
+        f"event_type.{_field(record.get('event_type'))}": 1,
+        f"severity.{_field(record.get('severity'))}": 1,
+    }
+
+
+class Rollups:
+    """Maintains and queries the rollup and per-user counter collections"""
+
+    KINDS = {
+        'predictions': (prediction_counters, 'user'),
+        'security_events': (security_event_counters, 'user_email'),
+    }
+
+    def __init__(self, rollups_collection, user_stats_collection):
+        self.rollups = rollups_collection
+        self.user_stats = user_stats_collection
+
+    def ensure_indexes(self):
+        self.rollups.create_index([('kind', ASCENDING), ('granularity', ASCENDING), ('bucket', ASCENDING)])
+        self.rollups.create_index('expires_at', expireAfterSeconds=0)
+        self.user_stats.create_index([('predictions.total', DESCENDING)])
+
+    def record(self, kind, records):
+        """Fold a batch of written records into the counters with one bulk write per collection"""
+        counters_for, user_field = self.KINDS[kind]
+        buckets = defaultdict(lambda: defaultdict(int))
+        users = defaultdict(lambda: defaultdict(int))
+        last_seen = {}
+
+        for record in records:
+            timestamp = record.get('timestamp')
+            if not isinstance(timestamp, datetime.datetime):
+                continue
+            counters = counters_for(record)
+            for granularity in GRANULARITIES:
+                bucket = buckets[(granularity, bucket_start(timestamp, granularity))]
+                for field, amount in counters.items():
+                    bucket[field] += amount
+            user = record.get(user_field)
+            if user:
+                for field, amount in counters.items():
+                    if field == 'total' or field.startswith(('result.', 'severity.')):
+                        users[user][f'{kind}.{field}'] += amount
+                last_seen[user] = max(last_seen.get(user, timestamp), timestamp)
+
+        operations = []
+        for (granularity, bucket), counters in buckets.items():
+            set_on_insert = {'kind': kind, 'granularity': granularity, 'bucket': bucket}
+            if RETENTION[granularity] is not None:
+                set_on_insert['expires_at'] = bucket + GRANULARITIES[granularity] + RETENTION[granularity]
+            operations.append(UpdateOne(
+                {'_id': f"{kind}:{granularity}:{bucket.isoformat()}"},
+                {'$inc': {f'counts.{field}': amount for field, amount in counters.items()},
+                 '$setOnInsert': set_on_insert},
+                upsert=True,
+            ))
+        if operations:
+            self.rollups.bulk_write(operations, ordered=False)
+
+        user_operations = [
+            UpdateOne({'_id': user}, {'$inc': dict(counters), '$max': {'last_seen': last_seen[user]}}, upsert=True)
+            for user, counters in users.items()
+        ]
+        if user_operations:
+            self.user_stats.bulk_write(user_operations, ordered=False)
+
+    def on_flush(self, kind):
+        """BufferedWriter callback that rolls up every batch after it is inserted"""
+        return lambda records: self.record(kind, records)
+
+    def series(self, kind, granularity, since, until):
+        """Buckets of kind in [since, until) plus their summed counts"""
+        cursor = self.rollups.find(
+            {'kind': kind, 'granularity': granularity, 'bucket': {'$gte': since, '$lt': until}},
+            {'_id': 0, 'bucket': 1, 'counts': 1},
+        ).sort('bucket', ASCENDING).limit(MAX_BUCKETS)
+        buckets = [{'bucket': item['bucket'].isoformat(), 'counts': item.get('counts', {})} for item in cursor]
+        totals = {}
+        for item in buckets:
+            _add_counts(totals, item['counts'])
+        return buckets, totals
+
+    def top_users(self, limit=10):
+        users = []
+        for item in self.user_stats.find({}).sort('predictions.total', DESCENDING).limit(limit):
+            item['user'] = item.pop('_id')
+            if isinstance(item.get('last_seen'), datetime.datetime):
+                item['last_seen'] = item['last_seen'].isoformat()
+            users.append(item)
+        return users
+
+
+def _add_counts(target, counts):
+    for field, value in counts.items():
+        if isinstance(value, dict):
+            _add_counts(target.setdefault(field, {}), value)
+        else:
+            target[field] = target.get(field, 0) + value
+
+
+def backfill(db, reset=False, batch_size=5000):
+    """Rebuild rollups from the raw logs and security_events collections"""
+    rollups = Rollups(db.stats_rollups, db.user_stats)
+    if reset:
+        db.stats_rollups.delete_many({})
+        db.user_stats.delete_many({})
+    rollups.ensure_indexes()
+    for kind, collection in (('predictions', db.logs), ('security_events', db.security_events)):
+        batch = []
+        processed = 0
+        for record in collection.find({}).batch_size(batch_size):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                rollups.record(kind, batch)
+                processed += len(batch)
+                batch = []
+        if batch:
+            rollups.record(kind, batch)
+            processed += len(batch)
+        print(f"{kind}: rolled up {processed} records")
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Maintain dashboard rollups")
+    parser.add_argument('command', choices=['backfill'])
+    parser.add_argument('--reset', action='store_true',
+                        help="Delete existing rollups first (required if any were already recorded)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    backfill(MongoClient(os.getenv('MONGO_URI')).spam_classifier_db, reset=args.reset)
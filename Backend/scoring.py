@@ -0,0 +1,208 @@
+import re
+
+import numpy as np
+
+from vocabulary import CompactVocabulary
+
+
+class SklearnScorer:
+    """Scores messages with the pickled vectorizer and model as-is"""
+
+    engine = 'sklearn'
+
+    def __init__(self, vectorizer, model):
+        self.vectorizer = vectorizer
+        self.model = model
+
+    def predict_proba(self, texts):
+        return self.model.predict_proba(self.vectorizer.transform(texts))
+
+
+class CompiledLinearScorer:
+    """TF-IDF + binary logistic regression compiled into flat NumPy arrays.
+
+    Scoring a message tokenizes it once, looks the tokens up in the vocabulary
+    table and evaluates the normalized sparse dot product and sigmoid directly,
+    skipping sklearn's per-call validation and CSR matrix construction.
+    predict_proba returns the same (n, 2) layout as LogisticRegression.
+    The vocabulary is a CompactVocabulary; a plain dict is converted to one.
+    """
+
+    engine = 'compiled'
+
+    def __init__(self, vocabulary, idf, coef, intercept, token_pattern=r"(?u)\b\w\w+\b",
+                 lowercase=True, binary=True, sublinear_tf=False, norm='l2'):
+        if norm not in ('l2', None):
+            raise ValueError(f"Unsupported norm for compiled scorer: {norm}")
+        if isinstance(vocabulary, dict):
+            vocabulary = CompactVocabulary.from_dict(vocabulary)
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.token_pattern = token_pattern
+        self.lowercase = lowercase
+        self.binary = binary
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+        self._token_re = re.compile(token_pattern)
+
+    @classmethod
+    def from_sklearn(cls, vectorizer, model):
+        """Compile a fitted TfidfVectorizer and binary LogisticRegression"""
+        if vectorizer.analyzer != 'word' or tuple(vectorizer.ngram_range) != (1, 1):
+            raise ValueError("Compiled scorer only supports word unigram vectorizers")
+        if vectorizer.tokenizer is not None or vectorizer.preprocessor is not None or vectorizer.strip_accents:
+            raise ValueError("Compiled scorer does not support custom tokenizers, preprocessors or accent stripping")
+        if model.coef_.shape[0] != 1:
+            raise ValueError("Compiled scorer only supports binary classifiers")
+
+        if vectorizer.use_idf:
+            idf = vectorizer.idf_
+        else:
+            idf = np.ones(len(vectorizer.vocabulary_))
+        # Stop words never reach vocabulary_, so dropping unknown tokens also drops them
+        return cls(
+            vocabulary=CompactVocabulary.from_dict(vectorizer.vocabulary_),
+            idf=idf,
+            coef=model.coef_[0],
+            intercept=model.intercept_[0],
+            token_pattern=vectorizer.token_pattern,
+            lowercase=vectorizer.lowercase,
+            binary=vectorizer.binary,
+            sublinear_tf=vectorizer.sublinear_tf,
+            norm=vectorizer.norm,
+        )
+
+    def tokenize(self, text):
+        if self.lowercase:
+            text = text.lower()
+        return self._token_re.findall(text)
+
+    def decision_function(self, text):
+        """Return the logistic regression decision value for a single message"""
+        if self.binary:
+            # Deduplicate tokens first (in first-seen order, so the sum order is the same in every worker)
+            indices = self.vocabulary.indexes(dict.fromkeys(self.tokenize(text)))
+            if not indices:
+                return self.intercept
+            indices = np.array(indices, dtype=np.int64)
+            weights = self.idf[indices]
+        else:
+            counts = {}
+            for index in self.vocabulary.indexes(self.tokenize(text)):
+                counts[index] = counts.get(index, 0) + 1
+            if not counts:
+                return self.intercept
+            indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+            if self.sublinear_tf:
+                tf = np.log(tf) + 1
+            weights = tf * self.idf[indices]
+
+        score = float(np.dot(weights, self.coef[indices]))
+        if self.norm == 'l2':
+            norm = float(np.sqrt(np.dot(weights, weights)))
+            if norm > 0:
+                score /= norm
+        return score + self.intercept
+
+    def predict_proba(self, texts):
+        decisions = np.fromiter((self.decision_function(text) for text in texts), dtype=np.float64, count=len(texts))
+        positive = 1.0 / (1.0 + np.exp(-decisions))
+        return np.column_stack([1.0 - positive, positive])
+
+
+class HashingLinearScorer:
+    """HashingVectorizer + binary linear model compiled into a weight array.
+
+    Tokens are mapped to feature indexes with the same signed MurmurHash3 as
+    sklearn's HashingVectorizer, so the model needs no vocabulary and can be
+    updated incrementally (see online_learning.py). Only binary features with
+    alternate_sign=False are supported, which keeps every weight at 1 before
+    normalization.
+    """
+
+    engine = 'hashing'
+
+    def __init__(self, coef, intercept, n_features, stop_words=(), token_pattern=r"(?u)\b\w\w+\b",
+                 lowercase=True, norm='l2'):
+        if norm not in ('l2', None):
+            raise ValueError(f"Unsupported norm for hashing scorer: {norm}")
+        from sklearn.utils import murmurhash3_32
+        self._hash = murmurhash3_32
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.n_features = int(n_features)
+        self.stop_words = frozenset(stop_words)
+        self.token_pattern = token_pattern
+        self.lowercase = lowercase
+        self.norm = norm
+        self._token_re = re.compile(token_pattern)
+
+    @classmethod
+    def from_sklearn(cls, vectorizer, model):
+        """Compile a HashingVectorizer(binary=True, alternate_sign=False) and binary linear model"""
+        if vectorizer.analyzer != 'word' or tuple(vectorizer.ngram_range) != (1, 1):
+            raise ValueError("Hashing scorer only supports word unigram vectorizers")
+        if not vectorizer.binary or vectorizer.alternate_sign:
+            raise ValueError("Hashing scorer requires binary=True and alternate_sign=False")
+        if vectorizer.tokenizer is not None or vectorizer.preprocessor is not None or vectorizer.strip_accents:
+            raise ValueError("Hashing scorer does not support custom tokenizers, preprocessors or accent stripping")
+        if model.coef_.shape[0] != 1:
+            raise ValueError("Hashing scorer only supports binary classifiers")
+        return cls(
+            coef=model.coef_[0],
+            intercept=model.intercept_[0],
+            n_features=vectorizer.n_features,
+            stop_words=vectorizer.get_stop_words() or (),
+            token_pattern=vectorizer.token_pattern,
+            lowercase=vectorizer.lowercase,
+            norm=vectorizer.norm,
+        )
+
+    def tokenize(self, text):
+        if self.lowercase:
+            text = text.lower()
+        return self._token_re.findall(text)
+
+    def decision_function(self, text):
+        stop_words = self.stop_words
+        murmurhash = self._hash
+        n_features = self.n_features
+        # Colliding tokens share one binary feature, exactly as in HashingVectorizer
+        indices = {abs(murmurhash(token, seed=0)) % n_features for token in self.tokenize(text)
+                   if token not in stop_words}
+        if not indices:
+            return self.intercept
+        score = float(self.coef[np.fromiter(indices, dtype=np.int64, count=len(indices))].sum())
+        if self.norm == 'l2':
+            score /= np.sqrt(len(indices))
+        return score + self.intercept
+
+    def predict_proba(self, texts):
+        decisions = np.fromiter((self.decision_function(text) for text in texts), dtype=np.float64, count=len(texts))
+        positive = 1.0 / (1.0 + np.exp(-decisions))
+        return np.column_stack([1.0 - positive, positive])
+
+
+def interpret_probabilities(prediction_probabilities):
+    """Turn a predict_proba row into (result, confidence, confidence_level)"""
+    # If the prediction is very close to the decision boundary, treat with caution
+    is_spam = prediction_probabilities[0] > 0.5
+    confidence = float(max(prediction_probabilities))
+    
+    # If confidence is low, flag as uncertain
+    result = 'SPAM' if is_spam else 'NOT SPAM'
+    confidence_level = "high" if confidence > 0.8 else "medium" if confidence > 0.6 else "low"
+    return result, confidence, confidence_level
+
+
+def build_scorer(vectorizer, model, engine='compiled'):
+    """Build the scorer selected by the SCORING_ENGINE setting"""
+    if engine == 'compiled':
+        return CompiledLinearScorer.from_sklearn(vectorizer, model)
+    if engine == 'sklearn':
+        return SklearnScorer(vectorizer, model)
+    raise ValueError(f"Unknown scoring engine: {engine}")
+
@@ -0,0 +1,40 @@
+"""Per-message scoring time of the compiled linear scorer against the sklearn pipeline.
+
+    python scoring_benchmark.py [mail_data.csv] [--sample 1000]
+
+Run from Backend/ with the model pickles present. Parity between the two
+is asserted by tests/test_scoring.py.
+"""
+import argparse
+import csv
+import pickle
+import time
+
+from scoring import CompiledLinearScorer, SklearnScorer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the compiled and sklearn scorers one message at a time")
+    parser.add_argument('corpus', nargs='?', default='mail_data.csv', help="CSV file with a 'Message' column")
+    parser.add_argument('--sample', type=int, default=1000, help="Messages to score")
+    args = parser.parse_args(argv)
+
+    with open('logistic_regression.pkl', 'rb') as file:
+        model = pickle.load(file)
+    with open('feature_extraction.pkl', 'rb') as file:
+        feature_extraction = pickle.load(file)
+    with open(args.corpus, newline='', encoding='utf-8') as file:
+        sample = [row['Message'] for row in csv.DictReader(file)][:args.sample]
+
+    timings = {}
+    for scorer in (SklearnScorer(feature_extraction, model), CompiledLinearScorer.from_sklearn(feature_extraction, model)):
+        start = time.perf_counter()
+        for message in sample:
+            scorer.predict_proba([message])
+        timings[scorer.engine] = (time.perf_counter() - start) / len(sample)
+        print(f"{scorer.engine:>8}: {timings[scorer.engine] * 1e6:8.1f} us/message")
+    print(f"speedup: {timings['sklearn'] / timings['compiled']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import re
+from collections import namedtuple
+
+import numpy as np
+
+# Limits applied by the adversarial input screen
+SCREEN_MAX_LENGTH = 1000
+SCREEN_MIN_LENGTH = 5
+
+# All patterns are compiled once at import time and shared by every request
+SUSPICIOUS_PATTERNS = [
+    re.compile(r'<script.?>.?</script>', re.IGNORECASE),
+    re.compile(r'<.?javascript:.?>', re.IGNORECASE),
+]
+KEYBOARD_PATTERNS = [
+    'qwert', 'asdfg', 'zxcvb',
+    'qay', 'wsx', 'edc'  # Vertical patterns
+]
+KEYBOARD_RE = re.compile('|'.join(re.escape(pattern) for pattern in KEYBOARD_PATTERNS))
+NUMERIC_RE = re.compile(r'^[0-9]+$')
+TYPICAL_NUMBER_PATTERNS = [
+    re.compile(r'^\d{3}-\d{3}-\d{4}$'),  # Phone number with hyphens
+    re.compile(r'^\d{5}(-\d{4})?$'),     # ZIP code
+    re.compile(r'^\d{1,3}$')              # Small numbers
+]
+
+NEWLINE = ord('\n')
+
+Finding = namedtuple('Finding', ['reason', 'details', 'severity'])
+
+
+def smallest_period(text, min_period=1):
+    """Return the smallest period p >= min_period of text (len(text) if none).
+
+    A string has period p when text[i] == text[i + p] for every valid i. Uses the
+    KMP prefix function, so it runs in O(n) instead of building pattern * k strings.
+    """
+    n = len(text)
+    if n == 0:
+        return 0
+    prefix = [0] * n
+    k = 0
+    for i in range(1, n):
+        while k and text[i] != text[k]:
+            k = prefix[k - 1]
+        if text[i] == text[k]:
+            k += 1
+        prefix[i] = k
+
+    # Periods are n - border for every border of text, smallest first
+    border = prefix[-1]
+    while border:
+        if n - border >= min_period:
+            return n - border
+        border = prefix[border - 1]
+    return n
+
+
+def find_repeated_segment(text, segment_length=4):
+    """Return the first segment that appears again later without overlapping, else None.
+
+    Any non-overlapping repeat of length >= segment_length starts with a repeat of
+    exactly segment_length, so remembering the last position of every
+    segment_length-gram answers the question in a single linear pass.
+    """
+    last_seen = {}
+    for i in range(len(text) - segment_length + 1):
+        last_seen[text[i:i + segment_length]] = i
+    for i in range(len(text) - segment_length * 2 + 1):
+        segment = text[i:i + segment_length]
+        if last_seen[segment] - i >= segment_length:
+            return segment
+    return None
+
+
+def _find_repeated_4gram(text, codes):
+    """Vectorized find_repeated_segment(text, 4) for text whose code points fit in 16 bits"""
+    n = len(codes)
+    if n < 8:
+        return None
+    wide = codes.astype(np.uint64)
+    keys = (wide[:-3] << 48) | (wide[1:-2] << 32) | (wide[2:-1] << 16) | wide[3:]
+    _, inverse = np.unique(keys, return_inverse=True)
+    positions = np.arange(len(keys))
+    last_seen = np.zeros(inverse.max() + 1, dtype=np.int64)
+    np.maximum.at(last_seen, inverse, positions)
+    starts = positions[:n - 7]
+    hits = np.flatnonzero(last_seen[inverse[:n - 7]] - starts >= 4)
+    if not len(hits):
+        return None
+    i = int(hits[0])
+    return text[i:i + 4]
+
+
+class AdversarialInputScanner:
+    """Screens text for adversarial input and reports the first rule that fires.
+
+    The text is converted to an array of code points once; the character
+    histogram, entropy, alphanumeric and unique-character ratios and the
+    run/alternation checks are all computed from that array, so the rule set
+    is evaluated without re-walking the string in Python.
+    """
+
+    def __init__(self, max_length=SCREEN_MAX_LENGTH, min_length=SCREEN_MIN_LENGTH, segment_checks=True):
+        self.max_length = max_length
+        self.min_length = min_length
+        # Any natural text of a few hundred characters repeats a 4-gram, so windows of long documents skip this
+        self.segment_checks = segment_checks
+
+    def scan(self, text):
+        """Return a Finding for the first rule that flags text, or None if it looks safe"""
+        length = len(text)
+
+        # Check input length constraints
+        if length > self.max_length:
+            return Finding("oversized_input", f"Input length: {length}", "medium")
+        if length < self.min_length:
+            return Finding("undersized_input", f"Input length: {length}", "low")
+
+        # Check for suspicious patterns
+        for pattern in SUSPICIOUS_PATTERNS:
+            if pattern.search(text):
+                return Finding("suspicious_pattern", f"Pattern detected: {pattern.pattern}", "high")
+
+        codes = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+
+        # Character histogram in one vectorized pass
+        if codes.max() < 0x10000:
+            counts = np.bincount(codes)
+            symbols = np.flatnonzero(counts)
+            frequencies = counts[symbols]
+        else:
+            symbols, frequencies = np.unique(codes, return_counts=True)
+
+        # Unusually low entropy can indicate adversarial inputs
+        probabilities = frequencies / length
+        entropy = 0.0 - float((probabilities * np.log2(probabilities)).sum())
+        if entropy < 2.0 and length > 10:
+            return Finding("unusual_entropy", f"Input entropy: {entropy}", "medium")
+
+        # Regex '.' never matches a newline, so runs through one do not count
+        not_newline = codes != NEWLINE
+
+        # At least 4 of the same character in a row
+        same_as_next = codes[1:] == codes[:-1]
+        if length >= 4 and np.any(same_as_next[:-2] & same_as_next[1:-1] & same_as_next[2:] & not_newline[:-3]):
+            return Finding("repeated_characters", "Repeated character sequence detected", "medium")
+
+        # Alternating character patterns like 'abababab'
+        if length >= 6:
+            same_as_second_next = codes[2:] == codes[:-2]
+            alternating = (same_as_second_next[:-3] & same_as_second_next[1:-2]
+                           & same_as_second_next[2:-1] & same_as_second_next[3:]
+                           & not_newline[:-5] & not_newline[1:-4])
+            if np.any(alternating):
+                return Finding("alternating_pattern", "Alternating character pattern detected", "medium")
+
+        # Check for keyboard patterns
+        lowered = text.lower()
+        if KEYBOARD_RE.search(lowered):
+            pattern = next(pattern for pattern in KEYBOARD_PATTERNS if pattern in lowered)
+            return Finding("keyboard_pattern", f"Keyboard pattern detected: {pattern}", "medium")
+
+        # Check for numeric-only content that's not reasonably formatted
+        if length > 4 and NUMERIC_RE.match(text):
+            if not any(pattern.match(text) for pattern in TYPICAL_NUMBER_PATTERNS):
+                return Finding("suspicious_numeric", "Suspicious numeric sequence", "medium")
+
+        # Check ratio of alphanumeric to non-alphanumeric characters
+        alnum_count = sum(count for symbol, count in zip(symbols.tolist(), frequencies.tolist())
+                          if chr(symbol).isalnum())
+        if length > 5 and alnum_count / length < 0.7:
+            return Finding("high_special_char_ratio", "High ratio of special characters", "medium")
+
+        # Check for random character distribution (gibberish detection)
+        if length > 8 and len(symbols) / length > 0.8:
+            return Finding("random_distribution", "Random character distribution detected", "medium")
+
+        if length >= 8:
+            # Check if the string is made up of repeating patterns
+            period = smallest_period(text, min_period=2)
+            if period <= length // 2:
+                return Finding("repeating_subsequence", f"Repeating pattern detected: {text[:period]}", "medium")
+
+            # Check if string has two identical halves
+            half_length = length // 2
+            if text[:half_length] == text[half_length:half_length * 2] and half_length >= 4:
+                return Finding("identical_halves", "String contains identical halves", "medium")
+
+            # Check for identical segments (any position)
+            if not self.segment_checks:
+                segment = None
+            elif codes.max() < 0x10000:
+                segment = _find_repeated_4gram(text, codes)
+            else:
+                segment = find_repeated_segment(text, segment_length=4)
+            if segment is not None:
+                return Finding("identical_segments", f"Identical segments detected: {segment}", "medium")
+
+        return None
+
+
+scanner = AdversarialInputScanner()
+
+
+def sanitize_input(text):
+    """Sanitize input text to prevent injection attacks"""
+    # Basic sanitization - remove potentially dangerous characters
+    # This is a simple implementation - consider using a library like bleach for production
+    text = re.sub(r'<[^>]*>', '', text)  # Remove HTML tags
+    text = re.sub(r'[\'";]', '', text)   # Remove quotes and semicolons
+    
+    # Normalize whitespace
+    text = re.sub(r'\s+', ' ', text).strip()
+    
+    return text
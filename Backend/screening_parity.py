@@ -0,0 +1,165 @@
+"""Verdict parity between screening.scanner and the original is_adversarial_input.
+
+The repetition rules were rewritten from nested loops (roughly cubic in the
+input length) to linear checks. This script keeps the original rules as a
+reference and compares both on every message of a CSV corpus, raw and
+sanitized, plus generated periodic and repeated-segment strings. The rule
+name, details and severity must all match; the entropy in unusual_entropy
+details only to 1e-9, as the scanner sums it in a different order:
+
+    python screening_parity.py mail_data.csv --generated 2000
+
+Exits non-zero and prints the first differences if any input disagrees.
+"""
+import argparse
+import csv
+import random
+import re
+import string
+import sys
+import time
+
+import numpy as np
+
+from screening import Finding, sanitize_input, scanner
+
+
+def reference_scan(text):
+    """The original is_adversarial_input rules, returning the Finding instead of logging it"""
+    MAX_INPUT_LENGTH = 1000
+    MIN_INPUT_LENGTH = 5
+    SUSPICIOUS_PATTERNS = [
+        r'<script.?>.?</script>',
+        r'<.?javascript:.?>',
+    ]
+
+    if len(text) > MAX_INPUT_LENGTH:
+        return Finding("oversized_input", f"Input length: {len(text)}", "medium")
+    if len(text) < MIN_INPUT_LENGTH:
+        return Finding("undersized_input", f"Input length: {len(text)}", "low")
+    for pattern in SUSPICIOUS_PATTERNS:
+        if re.search(pattern, text, re.IGNORECASE):
+            return Finding("suspicious_pattern", f"Pattern detected: {pattern}", "high")
+
+    char_counts = {}
+    for char in text:
+        char_counts[char] = char_counts.get(char, 0) + 1
+    total_chars = len(text)
+    entropy = 0
+    for char, count in char_counts.items():
+        prob = count / total_chars
+        entropy -= prob * np.log2(prob) if prob > 0 else 0
+    if entropy < 2.0 and len(text) > 10:
+        return Finding("unusual_entropy", f"Input entropy: {entropy}", "medium")
+
+    if re.search(r'(.)\1{3,}', text):
+        return Finding("repeated_characters", "Repeated character sequence detected", "medium")
+    if re.search(r'(.)(.)(\1\2){2,}', text):
+        return Finding("alternating_pattern", "Alternating character pattern detected", "medium")
+
+    for pattern in ['qwert', 'asdfg', 'zxcvb', 'qay', 'wsx', 'edc']:
+        if pattern in text.lower():
+            return Finding("keyboard_pattern", f"Keyboard pattern detected: {pattern}", "medium")
+
+    if re.match(r'^[0-9]+$', text) and len(text) > 4:
+        typical_number_patterns = [r'^\d{3}-\d{3}-\d{4}$', r'^\d{5}(-\d{4})?$', r'^\d{1,3}$']
+        if not any(re.match(pattern, text) for pattern in typical_number_patterns):
+            return Finding("suspicious_numeric", "Suspicious numeric sequence", "medium")
+
+    alnum_count = sum(1 for c in text if c.isalnum())
+    if len(text) > 5 and alnum_count / len(text) < 0.7:
+        return Finding("high_special_char_ratio", "High ratio of special characters", "medium")
+    if len(text) > 8 and len(char_counts) / len(text) > 0.8:
+        return Finding("random_distribution", "Random character distribution detected", "medium")
+
+    if len(text) >= 8:
+        for pattern_length in range(2, len(text) // 2 + 1):
+            pattern = text[:pattern_length]
+            if text == pattern * (len(text) // pattern_length) + text[:(len(text) % pattern_length)]:
+                return Finding("repeating_subsequence", f"Repeating pattern detected: {pattern}", "medium")
+
+        half_length = len(text) // 2
+        if text[:half_length] == text[half_length:half_length * 2] and half_length >= 4:
+            return Finding("identical_halves", "String contains identical halves", "medium")
+
+        for segment_length in range(4, len(text) // 2 + 1):
+            for i in range(len(text) - segment_length * 2 + 1):
+                segment = text[i:i + segment_length]
+                if segment in text[i + segment_length:]:
+                    return Finding("identical_segments", f"Identical segments detected: {segment}", "medium")
+    return None
+
+
+def same_finding(expected, actual):
+    if expected is None or actual is None or expected.reason != 'unusual_entropy':
+        return expected == actual
+    if (expected.reason, expected.severity) != (actual.reason, actual.severity):
+        return False
+    return abs(float(expected.details.split(': ')[1]) - float(actual.details.split(': ')[1])) < 1e-9
+
+
+def corpus_inputs(path):
+    """Every message of a CSV with a 'Message' column, raw and sanitized"""
+    with open(path, newline='', encoding='utf-8') as file:
+        for record in csv.DictReader(file):
+            message = record.get('Message') or ''
+            yield message
+            yield sanitize_input(message)
+
+
+def generated_inputs(count, seed=0):
+    """Periodic strings, strings with a planted repeat and random text, some with non-BMP letters"""
+    rng = random.Random(seed)
+    bold = ''.join(chr(code) for code in range(0x1D400, 0x1D434))  # Mathematical bold letters, beyond 16 bits
+    alphabets = [string.ascii_letters + string.digits, string.ascii_lowercase + ' ', string.ascii_lowercase + bold]
+    for index in range(count):
+        alphabet = alphabets[index // 3 % len(alphabets)]
+        length = rng.randint(8, 120)
+        kind = index % 3
+        if kind == 0:
+            pattern = ''.join(rng.choices(alphabet, k=rng.randint(2, 12)))
+            yield (pattern * (length // len(pattern) + 1))[:length]
+        elif kind == 1:
+            segment = ''.join(rng.choices(alphabet, k=rng.randint(4, 10)))
+            filler = ''.join(rng.choices(alphabet, k=length))
+            cut = rng.randint(0, length)
+            yield filler[:cut] + segment + filler[cut:] + segment
+        else:
+            yield ''.join(rng.choices(alphabet, k=length))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the adversarial input screen with the original rules")
+    parser.add_argument('corpus', nargs='*', default=['mail_data.csv'], help="CSV files with a 'Message' column")
+    parser.add_argument('--generated', type=int, default=2000, help="Generated repetition inputs to add")
+    parser.add_argument('--show', type=int, default=10, help="Differences to print")
+    args = parser.parse_args(argv)
+
+    inputs = [text for path in args.corpus for text in corpus_inputs(path)]
+    inputs.extend(generated_inputs(args.generated))
+    reference_seconds = current_seconds = 0.0
+    differences = []
+    reasons = {}
+    for text in inputs:
+        start = time.perf_counter()
+        expected = reference_scan(text)
+        checked = time.perf_counter()
+        actual = scanner.scan(text)
+        current_seconds += time.perf_counter() - checked
+        reference_seconds += checked - start
+        reason = expected.reason if expected else 'accepted'
+        reasons[reason] = reasons.get(reason, 0) + 1
+        if not same_finding(expected, actual):
+            differences.append((text, expected, actual))
+
+    print(f"{len(inputs)} inputs, {len(differences)} differences "
+          f"(reference {reference_seconds:.2f}s, scanner {current_seconds:.2f}s)")
+    for reason, count in sorted(reasons.items(), key=lambda item: -item[1]):
+        print(f"  {reason:>24}: {count}")
+    for text, expected, actual in differences[:args.show]:
+        print(f"\n{text[:80]!r}\n  reference: {expected}\n  scanner:   {actual}")
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
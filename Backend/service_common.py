@@ -0,0 +1,441 @@
+"""Request logic shared by app.py (Flask, pymongo) and async_app.py (Quart, motor).
+
+Nothing here touches the web framework, Mongo or SMTP. The apps do that
+I/O and pass the results to these helpers, so both services build the same
+tokens, documents and responses. Responses are (payload, status[, headers])
+tuples; each app turns them into a framework response with respond().
+
+ClassificationPipeline owns the /check_spam path:
+
+    prediction cache -> adversarial screen -> near-duplicate index -> scorer
+
+It is thread-safe, so async_app.py runs it on its inference pool.
+"""
+import datetime
+import logging
+import pickle
+import random
+import re
+import string
+import time
+
+import jwt
+
+from cache import artifact_version
+from long_documents import analyze_document
+from mailer import MailQueueFull, build_otp_message
+from model_artifact import load_scorer
+from model_registry import ActiveModel
+from otp_store import EXHAUSTED, VERIFIED
+from scoring import build_scorer, interpret_probabilities
+from screening import SCREEN_MAX_LENGTH, sanitize_input, scanner
+
+logger = logging.getLogger('security')
+
+EMAIL_RE = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+TOKEN_LIFETIME = datetime.timedelta(hours=8)
+LOW_CONFIDENCE = 0.6  # Predictions below this carry a review warning
+
+# (collection, keys, options) created at startup by both apps
+COLLECTION_INDEXES = [
+    ('users', 'email', {'unique': True}),
+    # Keyset pagination walks (timestamp, _id) descending, optionally behind an equality filter
+    ('logs', [("timestamp", -1), ("_id", -1)], {}),
+    ('logs', [("user", 1), ("timestamp", -1), ("_id", -1)], {}),
+    ('logs', [("result", 1), ("timestamp", -1), ("_id", -1)], {}),
+    ('security_events', [("timestamp", -1), ("_id", -1)], {}),
+    ('security_events', [("severity", 1), ("timestamp", -1), ("_id", -1)], {}),
+    ('security_events', [("event_type", 1), ("timestamp", -1), ("_id", -1)], {}),
+    ('security_events', [("user_email", 1), ("timestamp", -1), ("_id", -1)], {}),
+]
+
+
+#========================Model==================================================
+def load_model(model_artifact=None, scoring_engine='compiled'):
+    """ActiveModel from a flat artifact, or from the bundled pickles when model_artifact is empty"""
+    if model_artifact:
+        # Memory-mapped arrays are shared by every worker and nothing is unpickled
+        scorer, model_version = load_scorer(model_artifact)
+        return ActiveModel(model_version, scorer, model_artifact)
+    with open('logistic_regression.pkl', 'rb') as file:
+        model = pickle.load(file)
+    with open('feature_extraction.pkl', 'rb') as file:
+        feature_extraction = pickle.load(file)
+    # The compiled scorer keeps its own compact vocabulary; the vectorizer's dict is only referenced if sklearn scores
+    scorer = build_scorer(feature_extraction, model, scoring_engine)
+    model_version = artifact_version('logistic_regression.pkl', 'feature_extraction.pkl')
+    return ActiveModel(model_version, scorer, 'logistic_regression.pkl')
+
+
+#========================Classification==================================================
+class _NoMetric:
+    """Stands in for a metric family and its children when an app exports no metrics"""
+
+    def labels(self, *values):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1.0):
+        pass
+
+
+class ClassificationPipeline:
+    """Sanitize, screen and score messages against the per-process caches.
+
+    stage_seconds and rejected_inputs are the app's metric families (labelled
+    by stage and by reason); without them nothing is recorded.
+    """
+
+    def __init__(self, prediction_cache, near_duplicates=None, max_input_length=50000, long_document_budget=0.25,
+                 stage_seconds=None, rejected_inputs=None):
+        self.prediction_cache = prediction_cache
+        self.near_duplicates = near_duplicates
+        self.max_input_length = max_input_length
+        self.long_document_budget = long_document_budget
+        stage_seconds = stage_seconds or _NoMetric()
+        self.rejected_inputs = rejected_inputs or _NoMetric()
+        self.sanitize_seconds = stage_seconds.labels('sanitize')
+        self.screen_seconds = stage_seconds.labels('screen')
+        self.vectorize_seconds = stage_seconds.labels('vectorize')  # sklearn engine only
+        self.predict_seconds = stage_seconds.labels('predict')      # sklearn engine only
+        self.score_seconds = stage_seconds.labels('score')          # compiled engine: vectorize + predict fused
+        self.near_duplicate_seconds = stage_seconds.labels('near_duplicate')
+        self.long_document_seconds = stage_seconds.labels('long_document')  # Windowed screen + score
+
+    def sanitize(self, mail):
+        start = time.perf_counter()
+        mail = sanitize_input(mail)
+        self.sanitize_seconds.observe(time.perf_counter() - start)
+        return mail
+
+    def adversarial_reason(self, text):
+        """Return the screening reason if input might be adversarial or malicious, else None"""
+        start = time.perf_counter()
+        finding = scanner.scan(text)
+        self.screen_seconds.observe(time.perf_counter() - start)
+        if finding is None:
+            return None
+        logger.info(f"Adversarial input screen: {finding.reason} - {finding.details}")
+        return finding.reason
+
+    def screen_with_cache(self, mail, active_model):
+        """Return (cache_key, cached_prediction, is_adversarial) for a sanitized message"""
+        cache_key = self.prediction_cache.key_for(mail, active_model.version)
+        cached = self.prediction_cache.get(cache_key)
+        if cached is not None:
+            adversarial, prediction = cached
+            if adversarial:
+                # Rejections are cached as (True, reason)
+                self.rejected_inputs.labels(prediction or 'unknown').inc()
+                return cache_key, None, True
+            return cache_key, prediction, False
+        reason = self.adversarial_reason(mail)
+        if reason is not None:
+            self.rejected_inputs.labels(reason).inc()
+            self.prediction_cache.put(cache_key, (True, reason))
+            return cache_key, None, True
+        return cache_key, None, False
+
+    def score_messages(self, scorer, mails):
+        """predict_proba with stage timings; the sklearn engine is timed per step"""
+        start = time.perf_counter()
+        if scorer.engine == 'sklearn':
+            features = scorer.vectorizer.transform(mails)
+            vectorized = time.perf_counter()
+            probabilities = scorer.model.predict_proba(features)
+            self.vectorize_seconds.observe(vectorized - start)
+            self.predict_seconds.observe(time.perf_counter() - vectorized)
+        else:
+            probabilities = scorer.predict_proba(mails)
+            self.score_seconds.observe(time.perf_counter() - start)
+        return probabilities
+
+    def classify_long_document(self, mail, active_model):
+        """Windowed verdict for a message longer than one screening window.
+
+        Returns (prediction, details) with the per-window breakdown in details,
+        or (None, None) if the message is rejected.
+        """
+        if len(mail) > self.max_input_length:
+            reason = 'oversized_input'
+            logger.info(f"Adversarial input screen: {reason} - Input length: {len(mail)}")
+        else:
+            start = time.perf_counter()
+            analysis = analyze_document(mail, active_model.scorer, self.long_document_budget)
+            self.long_document_seconds.observe(time.perf_counter() - start)
+            if analysis.rejection is None:
+                details = {
+                    'windows_total': analysis.windows_total,
+                    'windows_scored': sum('spam_probability' in window for window in analysis.windows),
+                    'truncated': analysis.truncated,
+                    'windows': analysis.windows,
+                }
+                return (*interpret_probabilities(analysis.probabilities), None), details
+            reason = analysis.rejection.reason
+            logger.info(f"Adversarial input screen: {reason} - {analysis.rejection.details}")
+        self.rejected_inputs.labels(reason).inc()
+        return None, None
+
+    def match_near_duplicates(self, active_model, mails):
+        """Return (predictions, signatures) with predictions filled in where an indexed near-duplicate matched"""
+        predictions = [None] * len(mails)
+        signatures = [None] * len(mails)
+        near_duplicates = self.near_duplicates
+        # Verdicts are per model; a request still holding the previous model skips the index
+        if near_duplicates is None or near_duplicates.model_version != active_model.version:
+            return predictions, signatures
+        for position, mail in enumerate(mails):
+            start = time.perf_counter()
+            signatures[position] = signature = near_duplicates.signature(mail)
+            match = near_duplicates.lookup(signature, active_model.version) if signature is not None else None
+            self.near_duplicate_seconds.observe(time.perf_counter() - start)
+            if match is not None:
+                verdict, cluster_id = match
+                predictions[position] = (*verdict, cluster_id)
+        return predictions, signatures
+
+    def predict_with_cache(self, active_model, cache_keys, mails):
+        """Predict cache misses and cache the results.
+
+        Near-duplicates of indexed messages reuse their verdict; the rest are
+        scored in a single scorer call and indexed as new clusters. Returns one
+        (result, confidence, confidence_level, cluster_id) per message.
+        """
+        predictions, signatures = self.match_near_duplicates(active_model, mails)
+        to_score = [position for position, prediction in enumerate(predictions) if prediction is None]
+        if to_score:
+            probabilities = self.score_messages(active_model.scorer, [mails[position] for position in to_score])
+            for position, prediction_probabilities in zip(to_score, probabilities):
+                verdict = interpret_probabilities(prediction_probabilities)
+                cluster_id = None
+                signature = signatures[position]
+                if signature is not None:
+                    # Variants within one batch join the cluster of the first one scored
+                    match = (self.near_duplicates.lookup(signature, active_model.version)
+                             if len(to_score) > 1 else None)
+                    cluster_id = match[1] if match else self.near_duplicates.add(
+                        signature, verdict, mails[position][:50], active_model.version)
+                predictions[position] = (*verdict, cluster_id)
+        for cache_key, prediction in zip(cache_keys, predictions):
+            self.prediction_cache.put(cache_key, (False, prediction))
+        return predictions
+
+    def classify(self, mail, active_model):
+        """(prediction, details) for one sanitized message; prediction is None if screening rejects it.
+
+        details holds the per-window breakdown of a long message, else None.
+        """
+        if len(mail) > SCREEN_MAX_LENGTH:
+            return self.classify_long_document(mail, active_model)
+        cache_key, prediction, adversarial = self.screen_with_cache(mail, active_model)
+        if adversarial:
+            return None, None
+        if prediction is None:
+            prediction = self.predict_with_cache(active_model, [cache_key], [mail])[0]
+        return prediction, None
+
+
+#========================Records and Responses==================================================
+def build_prediction_response(result, confidence, confidence_level, cluster_id=None):
+    response = {'result': result, 'confidence': confidence, 'confidence_level': confidence_level}
+    if cluster_id is not None:
+        response['cluster_id'] = cluster_id
+    # If confidence is very low, add a warning in the response
+    if confidence < LOW_CONFIDENCE:
+        response['warning'] = 'Prediction has low confidence, please review carefully'
+    return response
+
+
+def build_log_record(user_email, mail, result, confidence, confidence_level, model_version, cluster_id,
+                     ip_address):
+    return {
+        'user': user_email,
+        'emailSubject': mail[:50],  # Truncate subject for logging
+        'result': result,
+        'confidence': confidence,
+        'confidence_level': confidence_level,
+        'model_version': model_version,
+        'cluster_id': cluster_id,
+        'timestamp': datetime.datetime.utcnow(),
+        'ip_address': ip_address
+    }
+
+
+def build_security_event(event_type, details, ip_address, user_email=None, severity="medium"):
+    return {
+        'event_type': event_type,
+        'details': details,
+        'ip_address': ip_address,
+        'user_email': user_email,
+        'severity': severity,
+        'timestamp': datetime.datetime.utcnow()
+    }
+
+
+def page_response(key, items, page, per_page, total, total_accuracy, next_cursor):
+    """Body of a paginated /logs or /security-events response"""
+    return {
+        # Convert ObjectId to string for JSON serialization
+        key: [{**item, '_id': str(item['_id'])} for item in items],
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'total_accuracy': total_accuracy,
+        'next_cursor': next_cursor
+    }, 200
+
+
+def admin_denied(current_user, action, log_security_event):
+    """403 response for a non-admin user attempting action, else None"""
+    if current_user['role'] == 'admin':
+        return None
+    log_security_event(
+        'unauthorized_access',
+        f"User {current_user['email']} attempted to {action} without permission",
+        user_email=current_user['email'],
+        severity="high"
+    )
+    return {'message': 'Unauthorized'}, 403
+
+
+def rate_limit_response():
+    return {
+        "message": "Rate limit exceeded. Please try again later.",
+        "error": "Too many requests"
+    }, 429
+
+
+def password_busy_response(retry_after):
+    """503 for PasswordPoolBusy; retry_after seconds go into the Retry-After header"""
+    return {'message': 'Server is busy, please try again shortly'}, 503, {'Retry-After': str(retry_after)}
+
+
+#========================Registration and OTP==================================================
+def registration_error(email, password):
+    """Message explaining why email and password cannot register, or None if they can"""
+    if not email or not password:
+        return 'Email and password are required'
+    # Validate email format
+    if not EMAIL_RE.match(email):
+        return 'Invalid email format'
+    # Password strength validation
+    if len(password) < 8:
+        return 'Password must be at least 8 characters'
+    if not re.search(r"[A-Z]", password) or not re.search(r"[a-z]", password) or not re.search(r"[0-9]", password):
+        return 'Password must contain uppercase, lowercase and numbers'
+    return None
+
+
+def decrypt_password(cipher_suite, password):
+    """Undo the encryption /register/initiate applied; anything else is taken as plaintext"""
+    if password.startswith('gAAA'):  # Simple check if it looks like Fernet encrypted
+        try:
+            return cipher_suite.decrypt(password.encode()).decode()
+        except Exception:
+            pass
+    return password
+
+
+def new_user(email, hashed_password):
+    return {
+        'email': email,
+        'password': hashed_password,
+        'role': 'user',  # Default role
+        'created_at': datetime.datetime.utcnow(),
+        'last_login': None
+    }
+
+
+def generate_otp():
+    # Generate a 6-digit OTP
+    return ''.join(random.choices(string.digits, k=6))
+
+
+def otp_verified(status, email, action, log_security_event):
+    """True if an otp_store verify() status is VERIFIED; the attempt that exhausts a code is logged"""
+    if status == EXHAUSTED:
+        log_security_event('max_otp_attempts',
+                           f"User {email} exceeded maximum OTP attempts for {action}",
+                           user_email=email,
+                           severity="high")
+    return status == VERIFIED
+
+
+def send_otp_email(mailer, sender, email, otp, action, ip_address):
+    # Queue the OTP email for delivery; returns the delivery id, or None if it could not be queued
+    try:
+        return mailer.send(email, build_otp_message(sender, email, otp, action, ip_address))
+    except MailQueueFull as e:
+        logger.error(f"Error queueing email: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Error sending email: {e}")
+        return None
+
+
+def otp_sent_response(mailer, delivery_id, email, **fields):
+    """Response of an endpoint that queued an OTP email, with its delivery fields"""
+    if not delivery_id:
+        return {'message': 'Failed to send verification code'}, 500
+    status = mailer.status(delivery_id)
+    return {
+        'message': 'Verification code sent to your email',
+        'email': email,
+        **fields,
+        'delivery_id': delivery_id,
+        'delivery_status': status['status'] if status else 'queued'
+    }, 200
+
+
+#========================Tokens==================================================
+class AuthError(Exception):
+    """A request that fails authentication; event is a security event to log, if any"""
+
+    def __init__(self, message, status=401, event=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.event = event  # (event_type, details, severity, user_email)
+
+
+def create_token(user, secret, ip_address):
+    now = datetime.datetime.utcnow()
+    payload = {
+        'user_id': str(user['_id']),
+        'email': user['email'],
+        'role': user['role'],
+        'ip': ip_address,  # Add IP address for extra validation
+        'iat': now,  # Issued at time
+        'exp': now + TOKEN_LIFETIME  # Reduced token lifetime
+    }
+    return jwt.encode(payload, secret, algorithm='HS256')
+
+
+def decode_token(header, secret, ip_address):
+    """Claims of the 'Bearer <token>' Authorization header; raises AuthError if it is missing or invalid.
+
+    A token is only valid from the address it was issued to. Other errors
+    (such as a header without a token) propagate to the caller.
+    """
+    if not header:
+        raise AuthError('Token is missing', event=('missing_token', 'API request without token', 'medium', None))
+    try:
+        data = jwt.decode(header.split(" ")[1], secret, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        raise AuthError('Token has expired')
+    except jwt.InvalidTokenError:
+        raise AuthError('Invalid token', event=('invalid_token', 'Invalid token used', 'high', None))
+    # Additional security: validate the IP hasn't changed
+    if data.get('ip') != ip_address:
+        raise AuthError('Session expired, please login again', event=(
+            'ip_mismatch', f"Token IP {data.get('ip')} doesn't match current IP {ip_address}", 'high', data['email']))
+    return data
+
+
+def auth_error_response(error, log_security_event):
+    if error.event is not None:
+        event_type, details, severity, user_email = error.event
+        log_security_event(event_type, details, user_email=user_email, severity=severity)
+    return {'message': error.message}, error.status
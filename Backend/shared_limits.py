@@ -0,0 +1,239 @@
+"""Rate-limit storage shared by every worker process on a host.
+
+flask-limiter's memory:// storage counts per process, so N gunicorn workers
+allow N times the configured rate. SharedMemoryStorage keeps the same fixed
+window counters in a memory-mapped file instead: a fixed-size open-addressing
+table of (key hash, window expiry, count) slots guarded by a per-process
+thread lock plus flock(), so every worker sees and updates one counter per
+limit. Importing this module registers the 'sharedmem' scheme with limits:
+
+    Limiter(get_remote_address, app=app, storage_uri="sharedmem:///var/lib/ztrust/ratelimits.bin")
+
+The file must be a regular file owned by the service user and private to it;
+symlinks are refused. Plain sharedmem:// uses ratelimits.bin in a directory
+private to the user (under $XDG_RUNTIME_DIR, else the temp directory).
+
+tests/test_shared_limits.py checks that limits hold across processes.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from limits.storage import Storage
+
+MAGIC = b'ZTLIMIT1'
+HEADER = struct.Struct('<8sQ')  # magic, slot count
+SLOT = struct.Struct('<Qdq')     # key hash (0 = never used), window expiry (epoch seconds), count
+DEFAULT_SLOTS = 65536
+MAX_PROBE = 64
+
+
+def _check_private(path, info, kind):
+    if info.st_uid != os.geteuid() or info.st_mode & 0o077:
+        raise PermissionError(f"Rate-limit {kind} {path} must be owned by this user and private to it")
+
+
+def default_path():
+    """ratelimits.bin in a directory private to this user, created on first use"""
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        directory = os.path.join(runtime, 'ztrust')
+    else:
+        directory = os.path.join(tempfile.gettempdir(), f'ztrust-{os.geteuid()}')
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    # The name is guessable, so a directory someone else created (or a symlink) is refused
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"Rate-limit directory {directory} is not a directory")
+    _check_private(directory, info, 'directory')
+    return os.path.join(directory, 'ratelimits.bin')
+
+
+def key_hash(key):
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class SharedMemoryStorage(Storage):
+    """Fixed-window counters in a memory-mapped file shared across processes.
+
+    Behaves like limits' MemoryStorage for the fixed-window strategy: a counter
+    starts at the first hit and resets once its window expires. Expired slots
+    are reused; if a key's probe window is full of live counters the one
+    closest to expiry is evicted, so size slots well above the number of
+    concurrently limited clients (about 24 bytes each).
+    """
+
+    STORAGE_SCHEME = ['sharedmem']
+
+    def __init__(self, uri=None, wrap_exceptions=False, slots=DEFAULT_SLOTS, **options):
+        path = urllib.parse.urlparse(uri).path if uri else ''
+        self.path = path or default_path()
+        self.slots = int(slots)
+        self.size = HEADER.size + self.slots * SLOT.size
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self._ensure_open()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return OSError
+
+    def _ensure_open(self):
+        # Reopened in each forked worker: an inherited descriptor shares its open file, and so its flock,
+        # with the parent, and then the two processes would not exclude each other
+        if self._pid != os.getpid():
+            with self._open_lock:
+                if self._pid == os.getpid():
+                    return
+                self._close()
+                self._lock = threading.Lock()
+                self._open()
+                self._pid = os.getpid()
+
+    def _close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            info = os.fstat(fd)
+            if not stat.S_ISREG(info.st_mode):
+                raise PermissionError(f"Rate-limit file {self.path} is not a regular file")
+            _check_private(self.path, info, 'file')
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, HEADER.size, 0)
+            if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, self.slots) \
+                    or os.fstat(self._fd).st_size != self.size:
+                # New file or a table of another size: start from an empty table
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, self.slots), 0)
+            self._map = mmap.mmap(self._fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _acquire(self):
+        # flock excludes other processes; threads of one process share the lock, hence the thread lock
+        self._ensure_open()
+        self._lock.acquire()
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._lock.release()
+            raise
+
+    def _release(self):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+    def _find(self, hashed, now, create):
+        """Return (offset, expiry, count) of the key's slot; call with the lock held"""
+        start = hashed % self.slots
+        reusable = None
+        oldest = None
+        for probe in range(MAX_PROBE):
+            offset = HEADER.size + ((start + probe) % self.slots) * SLOT.size
+            slot_hash, expiry, count = SLOT.unpack_from(self._map, offset)
+            if slot_hash == hashed:
+                return offset, expiry, count
+            if slot_hash == 0:
+                # Slots are never emptied again, so an unused slot ends the key's probe chain
+                if reusable is None:
+                    reusable = offset
+                break
+            if reusable is None and expiry <= now:
+                reusable = offset
+            if oldest is None or expiry < oldest[1]:
+                oldest = (offset, expiry)
+        if not create:
+            return None
+        return (reusable if reusable is not None else oldest[0]), 0.0, 0
+
+    def incr(self, key, expiry, amount=1):
+        hashed = key_hash(key)
+        now = time.time()
+        self._acquire()
+        try:
+            offset, window_expiry, count = self._find(hashed, now, create=True)
+            if window_expiry <= now:
+                window_expiry = now + expiry
+                count = 0
+            count += amount
+            SLOT.pack_into(self._map, offset, hashed, window_expiry, count)
+        finally:
+            self._release()
+        return count
+
+    def get(self, key):
+        now = time.time()
+        self._acquire()
+        try:
+            found = self._find(key_hash(key), now, create=False)
+        finally:
+            self._release()
+        if found is None or found[1] <= now:
+            return 0
+        return found[2]
+
+    def get_expiry(self, key):
+        now = time.time()
+        self._acquire()
+        try:
+            found = self._find(key_hash(key), now, create=False)
+        finally:
+            self._release()
+        if found is None or found[1] <= now:
+            return now
+        return found[1]
+
+    def clear(self, key):
+        self._acquire()
+        try:
+            found = self._find(key_hash(key), time.time(), create=False)
+            if found is not None:
+                # Keep the hash so probe chains through this slot stay intact
+                SLOT.pack_into(self._map, found[0], key_hash(key), 0.0, 0)
+        finally:
+            self._release()
+
+    def reset(self):
+        self._acquire()
+        try:
+            now = time.time()
+            live = 0
+            for index in range(self.slots):
+                slot_hash, expiry, _ = SLOT.unpack_from(self._map, HEADER.size + index * SLOT.size)
+                live += slot_hash != 0 and expiry > now
+            self._map[HEADER.size:] = bytes(self.slots * SLOT.size)
+        finally:
+            self._release()
+        return live
+
+    def check(self):
+        return self._map is not None and not self._map.closed
+
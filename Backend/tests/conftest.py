@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The service modules live flat in Backend/, next to this directory
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
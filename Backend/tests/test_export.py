@@ -0,0 +1,24 @@
+import csv
+import io
+import json
+
+from export import LOG_FIELDS, iter_csv, iter_ndjson
+
+SUBJECTS = ['=HYPERLINK("http://evil.example","open")', '+1+1', '-2+3', '@SUM(A1)', '\tcmd', '\rcmd', 'Hello']
+
+
+def documents():
+    return [{'_id': i, 'result': 'SPAM', 'confidence': -0.5 if i == 0 else 0.9, 'emailSubject': subject}
+            for i, subject in enumerate(SUBJECTS)]
+
+
+def test_csv_cells_that_start_a_formula_are_quoted():
+    rows = list(csv.DictReader(io.StringIO(''.join(iter_csv(documents(), LOG_FIELDS)))))
+    assert [row['emailSubject'] for row in rows] == ["'" + subject for subject in SUBJECTS[:-1]] + ['Hello']
+    # Numbers are left alone
+    assert rows[0]['confidence'] == '-0.5'
+
+
+def test_ndjson_is_unchanged():
+    lines = ''.join(iter_ndjson(documents())).splitlines()
+    assert [json.loads(line)['emailSubject'] for line in lines] == SUBJECTS
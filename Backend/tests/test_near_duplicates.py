@@ -0,0 +1,32 @@
+import near_duplicates
+from near_duplicates import NearDuplicateIndex
+
+CAMPAIGN = "Congratulations you have been selected to receive a free cruise, call now to claim your prize"
+NEWSLETTER = "The quarterly report is attached, please review the figures before the meeting on Thursday"
+
+
+def test_refresh_of_single_member_cluster_at_oldest_slot_of_full_ring(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(near_duplicates.time, 'monotonic', lambda: clock[0])
+    index = NearDuplicateIndex(max_entries=2, ttl=10)
+    index.bind_model('v1')
+    campaign = index.signature(CAMPAIGN)
+    campaign_cluster = index.add(campaign, ('SPAM', 0.99, 'high'), model_version='v1')
+    clock[0] += 1
+    newsletter_cluster = index.add(index.signature(NEWSLETTER), ('NOT SPAM', 0.95, 'high'), model_version='v1')
+
+    # Past half the TTL the match is re-inserted; the ring is full, so that evicts the matched slot itself
+    clock[0] += 6
+    assert index.lookup(campaign, 'v1') == (('SPAM', 0.99, 'high'), campaign_cluster)
+    assert index.stats()['entries'] == 2
+    assert {cluster['cluster_id'] for cluster in index.largest_clusters(min_hits=0)} == {
+        campaign_cluster, newsletter_cluster}
+
+    # The index stays consistent for later lookups and inserts
+    assert index.lookup(campaign, 'v1') == (('SPAM', 0.99, 'high'), campaign_cluster)
+    assert index.lookup(index.signature(NEWSLETTER), 'v1')[1] == newsletter_cluster
+    # The newsletter was refreshed last, so a new entry now displaces the campaign
+    added = index.add(index.signature(CAMPAIGN + " before midnight tonight"), ('SPAM', 0.9, 'high'), model_version='v1')
+    assert len(index) == 2
+    assert index.lookup(index.signature(NEWSLETTER), 'v1')[1] == newsletter_cluster
+    assert {cluster['cluster_id'] for cluster in index.largest_clusters(min_hits=0)} == {newsletter_cluster, added}
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from otp_store import KEY, MongoOTPStore
+
+
+class IndexedCollection:
+    """Just the index calls of a collection, with the server's error codes for conflicts"""
+
+    def __init__(self, unique, duplicates=False):
+        self.indexes = {'key': unique}
+        self.duplicates = duplicates
+        self.lock = threading.Lock()
+
+    def _name(self, keys):
+        return 'key' if keys == KEY else 'expires_at'
+
+    def create_index(self, keys, unique=False, **options):
+        time.sleep(0.001)  # Leave room for other workers between calls
+        name = self._name(keys)
+        with self.lock:
+            if name in self.indexes and self.indexes[name] != unique:
+                raise OperationFailure("Index already exists with different options", code=85)
+            if unique and self.duplicates:
+                raise DuplicateKeyError("E11000 duplicate key error", code=11000)
+            self.indexes[name] = unique
+
+    def drop_index(self, keys):
+        time.sleep(0.001)
+        with self.lock:
+            if self.indexes.pop(self._name(keys), None) is None:
+                raise OperationFailure("index not found", code=27)
+
+
+def start_workers(collection, count=8):
+    errors = []
+    barrier = threading.Barrier(count)
+
+    def worker():
+        barrier.wait()
+        try:
+            MongoOTPStore(collection).ensure_indexes()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_workers_rebuilding_the_old_index_together_all_start():
+    for _ in range(20):
+        collection = IndexedCollection(unique=False)
+        assert start_workers(collection) == []
+        assert collection.indexes == {'key': True, 'expires_at': False}
+
+
+def test_rebuild_blocked_by_duplicate_codes_restores_the_old_index():
+    collection = IndexedCollection(unique=False, duplicates=True)
+    with pytest.raises(DuplicateKeyError):
+        MongoOTPStore(collection).ensure_indexes()
+    assert collection.indexes == {'key': False}
@@ -0,0 +1,36 @@
+import csv
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from scoring import CompiledLinearScorer, SklearnScorer
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load(name):
+    with open(os.path.join(BACKEND, name), 'rb') as file:
+        return pickle.load(file)
+
+
+@pytest.fixture(scope='module')
+def scorers():
+    model, feature_extraction = load('logistic_regression.pkl'), load('feature_extraction.pkl')
+    return SklearnScorer(feature_extraction, model), CompiledLinearScorer.from_sklearn(feature_extraction, model)
+
+
+def message_sample(step=5):
+    """Every step-th corpus message plus edge cases the tokenizer must treat like sklearn"""
+    with open(os.path.join(BACKEND, 'mail_data.csv'), newline='', encoding='utf-8') as file:
+        messages = [row['Message'] for row in csv.DictReader(file)][::step]
+    return messages + ['', 'a', 'FREE FREE FREE entry!!!', 'unseen-tokens zzqx qqzx', 'Ünïcödé wörds £100 ça va']
+
+
+def test_compiled_scorer_matches_sklearn(scorers):
+    reference, compiled = scorers
+    messages = message_sample()
+    difference = np.abs(reference.predict_proba(messages) - compiled.predict_proba(messages))
+    assert compiled.predict_proba(messages).shape == (len(messages), 2)
+    assert difference.max() < 1e-9
@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from screening import scanner
+from screening_parity import corpus_inputs, generated_inputs, reference_scan, same_finding
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'mail_data.csv')
+
+
+def corpus_sample(step=10):
+    """Every step-th message of the corpus, raw and sanitized"""
+    texts = list(corpus_inputs(CORPUS))
+    return [text for i in range(0, len(texts), 2 * step) for text in texts[i:i + 2]]
+
+
+@pytest.mark.parametrize('source', ['generated', 'corpus'])
+def test_scanner_matches_the_original_rules(source):
+    texts = list(generated_inputs(1500)) if source == 'generated' else corpus_sample()
+    differences = []
+    for text in texts:
+        expected, actual = reference_scan(text), scanner.scan(text)
+        if not same_finding(expected, actual):
+            differences.append((text, expected, actual))
+    assert differences == []
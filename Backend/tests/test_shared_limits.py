@@ -0,0 +1,85 @@
+import fcntl
+import multiprocessing
+import os
+import time
+
+import pytest
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter
+
+from shared_limits import SharedMemoryStorage
+
+PROCESSES = 8
+HITS = 100
+context = multiprocessing.get_context('fork')
+
+
+@pytest.fixture
+def uri(tmp_path):
+    return f"sharedmem://{tmp_path / 'limits.bin'}"
+
+
+def hammer(uri, limit, barrier, results, limiter=None):
+    limiter = limiter or FixedWindowRateLimiter(SharedMemoryStorage(uri))
+    item = parse(limit)
+    barrier.wait()
+    results.put(sum(limiter.hit(item, 'check_spam', '10.0.0.1') for _ in range(HITS)))
+
+
+def allowed_across_processes(uri, limit, limiter=None):
+    """Total hits allowed when PROCESSES forked workers each try HITS at once"""
+    barrier = context.Barrier(PROCESSES)
+    results = context.Queue()
+    workers = [context.Process(target=hammer, args=(uri, limit, barrier, results, limiter)) for _ in range(PROCESSES)]
+    for worker in workers:
+        worker.start()
+    allowed = sum(results.get(timeout=30) for _ in workers)
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+    return allowed
+
+
+@pytest.mark.parametrize('limit', ['10 per minute', '5 per minute', '200 per hour'])
+def test_processes_share_one_limit(uri, limit):
+    assert allowed_across_processes(uri, limit) == parse(limit).amount
+
+
+def test_each_window_allows_the_limit(uri):
+    limit = '10 per 2 seconds'
+    for window in range(2):
+        assert allowed_across_processes(uri, limit) == 10, f"window {window}"
+        time.sleep(2.1)
+
+
+def test_storage_opened_before_fork_is_reopened_in_each_worker(uri):
+    # As under gunicorn --preload: workers inherit an open storage and must not share its flock with the parent
+    limiter = FixedWindowRateLimiter(SharedMemoryStorage(uri))
+    assert allowed_across_processes(uri, '20 per minute', limiter) == 20
+    # The parent's own descriptor keeps working and sees the workers' hits
+    assert not limiter.hit(parse('20 per minute'), 'check_spam', '10.0.0.1')
+
+
+def test_worker_forked_while_parent_holds_the_lock_is_excluded(uri):
+    storage = SharedMemoryStorage(uri)
+    read, write = os.pipe()
+    storage._acquire()
+    try:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                # Own descriptor after the reopen, so the parent's flock now excludes this process
+                storage._ensure_open()
+                try:
+                    fcntl.flock(storage._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.write(write, b'shared')
+                except BlockingIOError:
+                    os.write(write, b'excluded')
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+    finally:
+        storage._release()
+    assert os.read(read, 16) == b'excluded'
+    # The parent keeps working after the fork
+    assert storage.incr('key', 60) == 1
@@ -0,0 +1,226 @@
+"""Compact token -> feature index table for the compiled scorer.
+
+A fitted TfidfVectorizer keeps vocabulary_ as a dict, and every str and int
+in it is a separate object in every worker. The dict costs about 120 bytes
+per term. CompactVocabulary stores the same mapping in three flat arrays:
+
+    blob      UTF-8 bytes of every token, concatenated in feature-index order
+    offsets   token i is blob[offsets[i]:offsets[i + 1]]
+    slots     open-addressing hash table (linear probing, load <= 0.5) of
+              feature indexes, -1 for empty, keyed by crc32 of the token bytes
+
+That is about 22 bytes per term with 10-byte tokens. The arrays live in the
+model artifact and are memory-mapped, so every worker shares one copy
+through the page cache. Lookups go through memoryviews, which return plain
+Python ints. A small per-process dict of the first HOT_TOKENS known tokens
+looked up sits in front of the table, so frequent words skip the probe.
+
+Run `python vocabulary.py` for a memory and lookup benchmark against a dict.
+"""
+import zlib
+
+import numpy as np
+
+EMPTY = -1
+HOT_TOKENS = 4096  # Known tokens cached per process in front of the table (first seen, never evicted)
+
+
+def table_size(count):
+    """Smallest power of two holding count entries at a load factor of at most 0.5"""
+    size = 8
+    while size < 2 * count:
+        size *= 2
+    return size
+
+
+def encode_tokens(tokens):
+    """(blob, offsets) for tokens in feature-index order"""
+    encoded = [token.encode('utf-8') for token in tokens]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    dtype = np.uint32 if lengths.sum() < 2 ** 32 else np.int64
+    offsets = np.zeros(len(encoded) + 1, dtype=dtype)
+    np.cumsum(lengths, out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def build_slots(blob, offsets):
+    """Hash table over the tokens in blob; indexes fit in int32 up to 2**31 terms"""
+    raw = blob.tobytes()
+    bounds = offsets.tolist()
+    count = len(bounds) - 1
+    mask = table_size(count) - 1
+    slots = [EMPTY] * (mask + 1)
+    for index in range(count):
+        position = zlib.crc32(raw[bounds[index]:bounds[index + 1]]) & mask
+        while slots[position] != EMPTY:
+            position = (position + 1) & mask
+        slots[position] = index
+    return np.array(slots, dtype=np.int32)
+
+
+class CompactVocabulary:
+    """Read-only token -> index mapping with the dict methods the scorer uses"""
+
+    def __init__(self, blob, offsets, slots=None, hot_tokens=HOT_TOKENS):
+        if slots is None:
+            slots = build_slots(blob, offsets)
+        if len(slots) & (len(slots) - 1):
+            raise ValueError("Vocabulary hash table size must be a power of two")
+        # Kept so callers (e.g. the artifact writer) can reach the arrays; lookups use the views
+        self.blob = blob
+        self.offsets = offsets
+        self.slots = slots
+        self._blob = memoryview(np.ascontiguousarray(blob))
+        self._offsets = memoryview(np.ascontiguousarray(offsets)).cast('B').cast(offsets.dtype.char)
+        self._slots = memoryview(np.ascontiguousarray(slots)).cast('B').cast('i')
+        self._mask = len(slots) - 1
+        self._length = len(offsets) - 1
+        # Token frequencies are Zipfian, so the first known tokens looked up are mostly the frequent ones and a
+        # small dict of them answers most lookups. Misses are never cached: the long tail of unknown tokens
+        # would otherwise fill the dict. It stops growing at hot_tokens entries
+        self._hot = {}
+        self.hot_tokens = hot_tokens
+
+    @classmethod
+    def from_dict(cls, vocabulary):
+        """Build from a token -> index dict whose indexes run contiguously from 0"""
+        tokens = sorted(vocabulary, key=vocabulary.get)
+        if [vocabulary[token] for token in tokens] != list(range(len(tokens))):
+            raise ValueError("Vocabulary indexes must be contiguous from 0")
+        return cls(*encode_tokens(tokens))
+
+    def _probe(self, token):
+        key = token.encode('utf-8')
+        blob = self._blob
+        offsets = self._offsets
+        slots = self._slots
+        mask = self._mask
+        position = zlib.crc32(key) & mask
+        while True:
+            index = slots[position]
+            if index == EMPTY or blob[offsets[index]:offsets[index + 1]] == key:
+                return index
+            position = (position + 1) & mask
+
+    def get(self, token, default=None):
+        index = self._hot.get(token)
+        if index is None:
+            index = self._probe(token)
+            if index != EMPTY and len(self._hot) < self.hot_tokens:
+                self._hot[token] = index
+        return default if index == EMPTY else index
+
+    def indexes(self, tokens):
+        """Feature indexes of the known tokens, in order; unknown tokens are skipped.
+
+        The scorer's lookup path: one call per message, with the hot-token
+        dict checked inline.
+        """
+        hot = self._hot
+        probe = self._probe
+        found = []
+        for token in tokens:
+            index = hot.get(token)
+            if index is None:
+                index = probe(token)
+                if index == EMPTY:
+                    continue
+                if len(hot) < self.hot_tokens:
+                    hot[token] = index
+            found.append(index)
+        return found
+
+    def __getitem__(self, token):
+        index = self.get(token)
+        if index is None:
+            raise KeyError(token)
+        return index
+
+    def __contains__(self, token):
+        return self.get(token) is not None
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        """Tokens in feature-index order"""
+        raw = self._blob.tobytes()
+        bounds = self._offsets.tolist()
+        return (raw[bounds[index]:bounds[index + 1]].decode('utf-8') for index in range(self._length))
+
+    def nbytes(self):
+        """Size of the shared arrays (the hot-token dict is extra, per process)"""
+        return self.blob.nbytes + self.offsets.nbytes + self.slots.nbytes
+
+
+if __name__ == '__main__':
+    # Benchmark: memory and lookup throughput of a dict and a CompactVocabulary over the same terms
+    import argparse
+    import random
+    import string
+    import time
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description="Compact vocabulary benchmark")
+    parser.add_argument('--terms', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=1000000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    alphabet = string.ascii_lowercase + string.digits
+
+    def random_terms(count):
+        # Lengths roughly like a TF-IDF vocabulary: mostly 4-12 characters
+        return [''.join(rng.choices(alphabet, k=rng.randint(2, 16))) for _ in range(count)]
+
+    terms = {}
+    while len(terms) < args.terms:
+        terms.update(dict.fromkeys(random_terms(args.terms - len(terms))))
+    terms = list(terms)
+    tracemalloc.start()
+    # Fresh str and int objects, as in an unpickled vocabulary_
+    as_dict = {term.encode('utf-8').decode('utf-8'): index for index, term in enumerate(terms)}
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    compact = CompactVocabulary.from_dict(as_dict)
+    build_seconds = time.perf_counter() - start
+    assert all(compact.get(term) == index for index, term in enumerate(terms[:100000]))
+
+    # Half hits, half misses, in the same order for both structures
+    misses = [term + '~' for term in random_terms(args.lookups // 2)]
+    uniform = rng.choices(terms, k=args.lookups // 2) + misses
+    rng.shuffle(uniform)
+    # Token streams are Zipfian: rank r is drawn with probability ~ 1 / r ** 1.1, over terms and misses alike
+    ranked = terms[:len(misses)] + misses
+    rng.shuffle(ranked)
+    ranks = np.random.default_rng(0).zipf(1.1, size=args.lookups * 2)
+    zipfian = [ranked[rank - 1] for rank in ranks[ranks <= len(ranked)][:args.lookups].tolist()]
+
+    def throughput(lookup_many, probes, batch=20):
+        # Message-sized batches, the way the scorer looks tokens up
+        batches = [probes[start:start + batch] for start in range(0, len(probes), batch)]
+        start = time.perf_counter()
+        for tokens in batches:
+            lookup_many(tokens)
+        return len(probes) / (time.perf_counter() - start)
+
+    get = as_dict.get
+
+    def dict_indexes(tokens):
+        return [index for index in map(get, tokens) if index is not None]
+
+    table_only = CompactVocabulary(compact.blob, compact.offsets, compact.slots, hot_tokens=0)
+    fresh = CompactVocabulary(compact.blob, compact.offsets, compact.slots)  # Empty hot-token dict
+    per_million = 1e6 / len(terms)
+    print(f"terms: {len(terms)}  mean token length: {compact.blob.nbytes / len(terms):.1f} bytes  "
+          f"build: {build_seconds:.1f}s")
+    print(f"{'':>30} {'dict':>14} {'compact':>14}")
+    print(f"{'MB per 1M terms':>30} {dict_bytes * per_million / 2 ** 20:>14.1f} "
+          f"{compact.nbytes() * per_million / 2 ** 20:>14.1f}")
+    print(f"{'bytes per term':>30} {dict_bytes / len(terms):>14.1f} {compact.nbytes() / len(terms):>14.1f}")
+    print(f"{'lookups/s uniform, table only':>30} {throughput(dict_indexes, uniform):>14,.0f} "
+          f"{throughput(table_only.indexes, uniform):>14,.0f}")
+    print(f"{'lookups/s zipfian':>30} {throughput(dict_indexes, zipfian):>14,.0f} "
+          f"{throughput(fresh.indexes, zipfian):>14,.0f}")